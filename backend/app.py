@@ -1,21 +1,37 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 import yaml
 import threading
 import time
 import logging
+import math
 import os
-import subprocess
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 from zoneinfo import ZoneInfo
 
 from models import Database
+from memory_db import MemoryDatabase
+from db_profiler import QueryProfiler
 from flag_manager import FlagManager
 from checker import ServiceChecker
+from check_queue import CheckQueue, QueuedChecker
 from scoring import ScoringEngine
-from auth import TokenManager
+from auth import SERVICE_ROLES, TokenManager
+from response_cache import ResponseCache
+from compression import init_json_compression, negotiate_encoding
+from static_assets import StaticAsset
+from clock import SystemClock
+from containers import DockerBackend
+from team_registry import TeamRegistry
+from metrics import REGISTRY, Counter, Gauge, Histogram
+from rate_limit import TokenBucketLimiter
+from uptime import UptimeTracker, uptime_summary
+from patch_store import PatchStore
+from patch_validator import PatchValidator
+from task_graph import TaskGraph
+from serialization import FastJSONProvider, PreEncoded, SocketIOJSON, dumps as json_dumps
 
 # 設置日誌
 logging.basicConfig(
@@ -26,9 +42,55 @@ logger = logging.getLogger(__name__)
 
 # 初始化 Flask
 app = Flask(__name__)
+# jsonify / request.json 改用較快的 JSON encoder (有安裝 orjson 時)
+app.json = FastJSONProvider(app)
 app.config['SECRET_KEY'] = 'ad-ctf-secret-key-change-me'
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", json=SocketIOJSON)
+
+# === 指標 ===
+HTTP_REQUEST_SECONDS = Histogram('ad_http_request_duration_seconds', 'HTTP 請求處理時間', ['endpoint', 'method', 'status'])
+FLAG_SUBMISSIONS = Counter('ad_flag_submissions_total', 'Flag 提交結果', ['result', 'reason'])
+SOCKETIO_EMITS = Counter('ad_socketio_emits_total', 'SocketIO 廣播事件數', ['event'])
+ROUND_STEP_SECONDS = Histogram('ad_round_step_duration_seconds', 'Round 結算與 Patch 階段各步驟耗時', ['step'])
+CONTAINER_RECREATE_SECONDS = Histogram('ad_container_recreate_duration_seconds', '單一隊伍容器重建耗時', ['result'])
+GAME_ROUND = Gauge('ad_game_round', '目前的 Round 編號')
+
+# Flag 提交結果訊息 → 指標 reason label
+SUBMISSION_REASONS = {
+    'Flag accepted': 'accepted',
+    'Invalid flag': 'invalid_flag',
+    'Cannot submit your own flag': 'own_flag',
+    'This flag has already been submitted': 'duplicate'
+}
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    start = g.get('request_start')
+    if start is not None:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            endpoint=request.url_rule.rule if request.url_rule else 'unmatched',
+            method=request.method,
+            status=response.status_code
+        )
+    return response
+
+def broadcast(event, data):
+    """透過 SocketIO 廣播事件給所有客戶端"""
+    SOCKETIO_EMITS.inc(event=event)
+    # payload 只序列化一次，不論有多少客戶端 / namespace 接收
+    socketio.emit(event, PreEncoded(data))
+
+def record_step(step, started):
+    """記錄 Round 結算 / Patch 階段某一步驟的耗時 (started 為 time.perf_counter() 的值)"""
+    elapsed = time.perf_counter() - started
+    ROUND_STEP_SECONDS.observe(elapsed, step=step)
+    logger.info(f"Step '{step}' finished in {elapsed:.2f}s")
 
 # 載入配置
 config_file = os.environ.get('CONFIG_FILE', 'config.yml')
@@ -38,15 +100,69 @@ if not os.path.exists(config_file) and os.path.exists('/app/config.yml'):
 with open(config_file, 'r', encoding='utf-8') as f:
     config = yaml.safe_load(f)
 
+# 隊伍清單、IP 與 port 由註冊表依 num_teams 產生 (config['teams'] 只用於覆寫名稱等)
+team_registry = TeamRegistry.from_config(config)
+config['teams'] = team_registry.teams()
+
+# 超過此大小 (bytes) 的 JSON 回應自動壓縮
+JSON_COMPRESS_MIN_SIZE = config['server'].get('compress_min_size', 1024)
+init_json_compression(app, JSON_COMPRESS_MIN_SIZE)
+
 # 初始化組件
-db = Database(config['database']['path'])
+query_profiler = QueryProfiler(slow_threshold=config['database'].get('slow_query_ms', 100) / 1000)
+# database.engine: sqlite (預設) 或 memory (純記憶體，供模擬與測試，重啟後資料消失)
+if config['database'].get('engine', 'sqlite') == 'memory':
+    db = MemoryDatabase()
+else:
+    # database.writer: 寫入交給單一 writer 執行緒 group commit (enabled: false 時每次寫入各自 commit)
+    writer_config = config['database'].get('writer', {})
+    db = Database(config['database']['path'], profiler=query_profiler,
+                  writer_options=writer_config if writer_config.get('enabled', True) else None)
 flag_manager = FlagManager(db)
-service_checker = ServiceChecker(db, timeout=5)
-scoring_engine = ScoringEngine(db, config)
+patch_config = config.get('patches', {})
+patch_store = PatchStore(db, root=patch_config.get('path', '/app/data/patches'),
+                         max_bytes=patch_config.get('max_bytes', 1024 * 1024))
+# patches.validation: 上傳後在一次性的隊伍映像容器中預先檢查，Patch 階段只套用通過檢查的版本
+validation_config = patch_config.get('validation', {})
+if validation_config.get('enabled', True):
+    patch_validator = PatchValidator(
+        db, patch_store.path,
+        image=lambda team_id: team_registry.slot(team_id)['image'],
+        workers=validation_config.get('workers', 2),
+        import_timeout=validation_config.get('import_timeout', 10),
+        listener=lambda patch, status, error: response_cache.bump('patches')
+    )
+else:
+    patch_validator = None
+# 每隊每 Round 的檢查累計計數，由 checker 更新、計分與 /api/uptime 讀取
+uptime_tracker = UptimeTracker(db)
+# checker.mode: local 由主伺服器直接檢查；queue 交給 checker_worker.py
+checker_config = config.get('checker', {})
+if checker_config.get('mode', 'local') == 'queue':
+    check_queue = CheckQueue(checker_config.get('queue_path', '/app/data/checks.db'))
+    service_checker = QueuedChecker(
+        db, check_queue,
+        timeout=checker_config.get('timeout', 5),
+        sweep_timeout=checker_config.get('sweep_timeout', 30),
+        uptime=uptime_tracker
+    )
+else:
+    check_queue = None
+    service_checker = ServiceChecker(db, timeout=checker_config.get('timeout', 5), uptime=uptime_tracker,
+                                     max_body_bytes=checker_config.get('max_body_bytes', 65536))
+clock = SystemClock()
+container_backend = DockerBackend(team_registry)
+# containers.swap: recreate (刪除後重建) 或 blue_green (新容器通過健康檢查後才切換)
+container_config = config.get('containers', {})
+container_swap = container_config.get('swap', 'recreate')
+scoring_engine = ScoringEngine(db, config, uptime=uptime_tracker)
 token_manager = TokenManager()
+# 每隊 Flag 提交的限流 (rate_limit.flag_submit 未設定時不限流)
+flag_rate_limiter = TokenBucketLimiter.from_config('flag_submit', config.get('rate_limit', {}).get('flag_submit'))
+response_cache = ResponseCache(dumps=lambda data: json_dumps(data) + b'\n')
 
 # 生成並打印 Tokens (只在第一次生成，之後從檔案讀取)
-TOKEN_FILE = '/app/data/tokens.json'
+TOKEN_FILE = os.environ.get('TOKEN_FILE', '/app/data/tokens.json')
 if os.path.exists(TOKEN_FILE):
     with open(TOKEN_FILE, 'r') as f:
         TOKENS = json.load(f)
@@ -55,6 +171,16 @@ if os.path.exists(TOKEN_FILE):
     for key, value in TOKENS.items():
         if key.startswith('team'):
             token_manager.tokens[key] = value
+    # 舊的 tokens.json 沒有的服務 Token：補上並寫回檔案
+    missing_roles = [role for role in SERVICE_ROLES if role not in TOKENS]
+    for role in SERVICE_ROLES:
+        if role in TOKENS:
+            token_manager.service_tokens[role] = TOKENS[role]
+        else:
+            TOKENS[role] = token_manager.generate_service_token(role)
+    if missing_roles:
+        with open(TOKEN_FILE, 'w') as f:
+            json.dump(TOKENS, f, indent=2)
     logger.info("使用現有 Tokens")
 else:
     TOKENS = token_manager.generate_tokens(config['game']['num_teams'])
@@ -72,39 +198,76 @@ game_state = {
     'start_time': None
 }
 
+# Patch 階段預先生成的下一 Round Flag 值: {round_number: {team_id: {vuln_type: flag}}}
+pregenerated_flags = {}
+
 # 初始化隊伍資料
 def init_teams():
-    """初始化隊伍到資料庫"""
+    """初始化隊伍到資料庫 (保留 blue/green 切換到備用 slot 的 host/port)"""
+    registered = {team['id']: team for team in db.get_teams()}
     for team_config in config['teams']:
+        host, port = team_config['host'], team_config['port']
+        current = registered.get(team_config['id'])
+        spare = team_registry.spare_slot(team_config['id'])
+        if current and spare and current['host'] == spare['host']:
+            host, port = current['host'], current['port']
         db.add_team(
             team_id=team_config['id'],
             name=team_config['name'],
-            host=team_config['host'],
-            port=team_config['port']
+            host=host,
+            port=port
         )
+    container_backend.sync_active(db.get_teams())
+    response_cache.bump('teams')
     logger.info(f"Initialized {len(config['teams'])} teams")
 
+def cached_json_response(key, resources, builder, extra=None):
+    """
+    回傳快取的 JSON 回應 (依賴的資源版本未變動時不重新查詢與序列化)
+    支援 If-None-Match 條件請求 → 304
+    """
+    cached = response_cache.get(key, resources, builder, extra)
+    encoding = 'identity'
+    if len(cached.body) >= JSON_COMPRESS_MIN_SIZE:
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+    body, etag = cached.encoded(encoding)
+    response = app.response_class(body, mimetype='application/json')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 # === Web 路由 ===
 
+# Dashboard 靜態頁面：載入一次並預先壓縮，檔案修改時間變動時自動重新載入
+dashboard_asset = StaticAsset(
+    ['/app/dashboard.html', 'dashboard.html',
+     os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dashboard.html')],
+    # 替換 API URL 為當前地址
+    transform=lambda content: content.replace(b'http://localhost:8001', b''),
+    mimetype='text/html'
+)
+
 @app.route('/')
 def index():
     """首頁 - 返回 Dashboard"""
-    # 讀取 dashboard.html
-    dashboard_path = '/app/dashboard.html'
-    if not os.path.exists(dashboard_path):
-        dashboard_path = 'dashboard.html'
-    
-    try:
-        with open(dashboard_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        # 替換 API URL 為當前地址
-        content = content.replace('http://localhost:8001', '')
-        return content
-    except FileNotFoundError:
+    asset = dashboard_asset.get()
+    if asset is None:
         return jsonify({
             'error': 'Dashboard not found',
             'message': 'Please access the API at /api/status'
         }), 404
+    
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''), asset.variants)
+    response = app.response_class(asset.variants[encoding], mimetype=asset.mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(asset.etag if encoding == 'identity' else f'{asset.etag}-{encoding}')
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response.make_conditional(request)
 
 # === API 路由 ===
 
@@ -139,7 +302,10 @@ def get_team_token(team_id):
 
 @app.route('/api/status', methods=['GET'])
 def get_status():
-    """獲取系統狀態"""
+    """獲取系統狀態 (剩餘時間以秒為單位變動，快取以當前秒數為額外版本)"""
+    return cached_json_response('status', ('game', 'rounds'), build_status, extra=int(time.time()))
+
+def build_status():
     response_data = {
         'game_started': game_state['started'],
         'current_round': game_state['current_round'],
@@ -194,42 +360,75 @@ def get_status():
                 'start_time': current_round['start_time']
             }
     
-    return jsonify(response_data)
+    return response_data
 
 @app.route('/api/teams', methods=['GET'])
 def get_teams():
     """獲取所有隊伍"""
-    teams = db.get_teams()
-    return jsonify({'teams': teams})
+    return cached_json_response('teams', ('teams',), lambda: {'teams': db.get_teams()})
 
 @app.route('/api/scoreboard', methods=['GET'])
 def get_scoreboard():
     """獲取排行榜"""
-    scoreboard = db.get_scoreboard()
-    current_round = db.get_current_round()
+    def build():
+        scoreboard = db.get_scoreboard()
+        current_round = db.get_current_round()
+        return {
+            'current_round': current_round['round_number'] if current_round else 0,
+            'scoreboard': scoreboard
+        }
     
-    return jsonify({
-        'current_round': current_round['round_number'] if current_round else 0,
-        'scoreboard': scoreboard
-    })
+    return cached_json_response('scoreboard', ('teams', 'rounds', 'scores', 'service_status'), build)
 
 @app.route('/api/round/<int:round_number>/scores', methods=['GET'])
 def get_round_scores(round_number):
     """獲取特定 Round 的分數"""
     # 查找 round_id
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT id FROM rounds WHERE round_number = ?', (round_number,))
-    result = cursor.fetchone()
-    conn.close()
+    result = db.get_round_by_number(round_number)
     
     if not result:
         return jsonify({'error': 'Round not found'}), 404
     
     round_id = result['id']
-    scores = db.get_round_scores(round_id)
     
-    return jsonify({'round': round_number, 'scores': scores})
+    return cached_json_response(
+        f'round-{round_number}-scores',
+        ('teams', 'rounds', 'scores'),
+        lambda: {'round': round_number, 'scores': db.get_round_scores(round_id)}
+    )
+
+@app.route('/api/uptime', methods=['GET'])
+def get_uptime():
+    """
+    每隊在某 Round 的檢查次數、uptime 比例與延遲分布
+    ?round=N 指定 Round 編號，預設為當前 Round
+    """
+    round_number = request.args.get('round', type=int)
+    round_data = db.get_round_by_number(round_number) if round_number else db.get_current_round()
+    if not round_data:
+        return jsonify({'error': 'Round not found'}), 404
+    
+    return cached_json_response(
+        f"uptime-{round_data['id']}",
+        ('service_status',),
+        lambda: {
+            'round': round_data['round_number'],
+            'teams': uptime_summary(uptime_tracker.get_round(round_data['id']), uptime_tracker.buckets)
+        }
+    )
+
+@app.route('/api/timeline', methods=['GET'])
+def get_timeline():
+    """
+    分數時間軸：每隊在每個 Round 結算後的累計總分與名次 (欄式格式)
+    ?since=N 只返回 Round 編號大於 N 的部分，供增量更新
+    """
+    since = request.args.get('since', 0, type=int)
+    return cached_json_response(
+        f'timeline-{since}',
+        ('teams', 'scores'),
+        lambda: db.get_timeline(since)
+    )
 
 @app.route('/api/flag/submit', methods=['POST'])
 def submit_flag():
@@ -252,6 +451,16 @@ def submit_flag():
     
     # 將 "team1" 轉換為數字 1
     team_str = auth_result['team_id']
+    
+    # 限流：在任何資料庫查詢之前拒絕過量的提交
+    if flag_rate_limiter is not None:
+        allowed, retry_after = flag_rate_limiter.acquire(team_str)
+        if not allowed:
+            FLAG_SUBMISSIONS.inc(result='rejected', reason='rate_limited')
+            response = jsonify({'error': 'Rate limit exceeded', 'retry_after': round(retry_after, 2)})
+            response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+            return response, 429
+    
     team_id = int(team_str.replace('team', ''))
     
     # 檢查遊戲是否開始
@@ -269,10 +478,15 @@ def submit_flag():
         return jsonify({'error': 'No active round'}), 400
     
     result = db.submit_flag(team_id, flag_value, current_round['id'])
+    FLAG_SUBMISSIONS.inc(
+        result='accepted' if result['success'] else 'rejected',
+        reason=SUBMISSION_REASONS.get(result['message'], 'other')
+    )
     
     # 如果成功,廣播更新
     if result['success']:
-        socketio.emit('flag_captured', {
+        response_cache.bump('submissions')
+        broadcast('flag_captured', {
             'attacker_id': team_id,
             'victim_id': result['target_team_id'],
             'round': current_round['round_number']
@@ -364,12 +578,73 @@ def get_team_flags(team_id):
         'flags': flags
     })
 
+# Flag feed long-poll 最長等待時間 (秒)
+FLAG_FEED_MAX_WAIT = 30
+
+@app.route('/api/team/<int:team_id>/flags/feed', methods=['GET'])
+def get_team_flags_feed(team_id):
+    """
+    版本化的隊伍 Flag feed - 僅供該隊伍或 Admin
+    支援 If-None-Match 條件請求 (304) 及 long-poll：
+    帶上 ?wait=N 時，若版本未變動會等待最多 N 秒直到新 Round 的 Flags 產生
+    """
+    # 驗證權限
+    token = request.args.get('token') or request.headers.get('Authorization', '').replace('Bearer ', '')
+
+    if not token:
+        return jsonify({'error': 'No token provided'}), 401
+
+    auth_result = token_manager.validate_token(token)
+    if not auth_result['valid']:
+        return jsonify({'error': 'Invalid token'}), 401
+
+    # 檢查權限：必須是 admin 或是該隊伍自己
+    if auth_result['role'] == 'team':
+        team_str = auth_result['team_id']
+        requester_team_id = int(team_str.replace('team', ''))
+        if requester_team_id != team_id:
+            return jsonify({'error': 'You can only view your own flags'}), 403
+    elif auth_result['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    # 客戶端已持有的版本
+    known_etag = request.headers.get('If-None-Match', '').strip() or None
+
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        wait = 0
+    wait = max(0, min(wait, FLAG_FEED_MAX_WAIT))
+
+    feed = flag_manager.get_feed(team_id, known_etag, wait)
+
+    if feed['etag'] == known_etag:
+        response = app.response_class(status=304)
+        response.headers['ETag'] = feed['etag']
+        return response
+
+    if feed['flags'] is None:
+        return jsonify({'error': 'Flags not found'}), 404
+
+    response = jsonify({
+        'team_id': team_id,
+        'round': feed['round'],
+        'version': feed['version'],
+        'flags': feed['flags']
+    })
+    response.headers['ETag'] = feed['etag']
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/api/service-status', methods=['GET'])
 def get_service_status():
     """獲取所有服務狀態"""
+    return cached_json_response('service-status', ('teams', 'rounds', 'service_status'), build_service_status)
+
+def build_service_status():
     current_round = db.get_current_round()
     if not current_round:
-        return jsonify({'services': []}), 200
+        return {'services': []}
     
     statuses = db.get_service_status(current_round['id'])
     
@@ -388,66 +663,62 @@ def get_service_status():
                 'checked_at': status['checked_at']
             })
     
-    return jsonify({'services': result})
+    return {'services': result}
 
 @app.route('/api/flag/history', methods=['GET'])
 def get_flag_history():
     """獲取 Flag 提交歷史"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                fs.submitted_at as timestamp,
-                fs.flag_value as flag,
-                fs.is_valid as success,
-                t1.name as attacker_team,
-                t2.name as victim_team
-            FROM flag_submissions fs
-            LEFT JOIN teams t1 ON fs.submitter_team_id = t1.id
-            LEFT JOIN teams t2 ON fs.target_team_id = t2.id
-            ORDER BY fs.submitted_at DESC
-            LIMIT 100
-        ''')
+        return cached_json_response('flag-history', ('teams', 'submissions'), build_flag_history)
+    except Exception as e:
+        logger.error(f"Error in get_flag_history: {e}")
+        return jsonify({'history': [], 'error': str(e)}), 200  # 返回空列表而不是錯誤
+
+def build_flag_history():
+    history = []
+    for row in db.get_recent_submissions(100):
+        # 隱藏 flag 內容,只顯示前8個字符
+        flag_value = row['flag']
+        masked_flag = flag_value[:8] + '*' * (len(flag_value) - 8) if len(flag_value) > 8 else '****'
         
-        history = []
-        for row in cursor.fetchall():
-            # 隱藏 flag 內容,只顯示前8個字符
-            flag_value = row['flag']
-            masked_flag = flag_value[:8] + '*' * (len(flag_value) - 8) if len(flag_value) > 8 else '****'
-            
-            # 修正時間格式 - 處理資料庫中的時間字串，套用台灣時區
-            timestamp_str = row['timestamp']
-            try:
-                # 嘗試解析時間戳
-                if isinstance(timestamp_str, str):
-                    if ' ' in timestamp_str:
-                        dt = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-                    else:
-                        dt = datetime.fromisoformat(timestamp_str)
-                    # 如果沒有時區資訊，假設是台灣時區
-                    if dt.tzinfo is None:
-                        dt = dt.replace(tzinfo=ZoneInfo('Asia/Taipei'))
-                    formatted_timestamp = dt.strftime('%Y-%m-%d %p %I:%M:%S')
+        # 修正時間格式 - 處理資料庫中的時間字串，套用台灣時區
+        timestamp_str = row['timestamp']
+        try:
+            # 嘗試解析時間戳
+            if isinstance(timestamp_str, str):
+                if ' ' in timestamp_str:
+                    dt = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
                 else:
-                    formatted_timestamp = timestamp_str
-            except:
+                    dt = datetime.fromisoformat(timestamp_str)
+                # 如果沒有時區資訊，假設是台灣時區
+                if dt.tzinfo is None:
+                    dt = dt.replace(tzinfo=ZoneInfo('Asia/Taipei'))
+                formatted_timestamp = dt.strftime('%Y-%m-%d %p %I:%M:%S')
+            else:
                 formatted_timestamp = timestamp_str
-            
-            history.append({
-                'timestamp': formatted_timestamp,
-                'flag': masked_flag,  # 使用遮罩後的 flag
-                'success': bool(row['success']),
-                'attacker_team': row['attacker_team'] or 'Unknown',
-                'victim_team': row['victim_team'] or 'Unknown'
-            })
+        except:
+            formatted_timestamp = timestamp_str
         
-        conn.close()
-        return jsonify({'history': history})
-    except Exception as e:
-        logger.error(f"Error in get_flag_history: {e}")
-        return jsonify({'history': [], 'error': str(e)}), 200  # 返回空列表而不是錯誤
+        history.append({
+            'timestamp': formatted_timestamp,
+            'flag': masked_flag,  # 使用遮罩後的 flag
+            'success': bool(row['success']),
+            'attacker_team': row['attacker_team'] or 'Unknown',
+            'victim_team': row['victim_team'] or 'Unknown'
+        })
+    
+    return {'history': history}
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus 格式的指標（Metrics Token 或 Admin）"""
+    auth_header = request.headers.get('Authorization', '')
+    token = auth_header.replace('Bearer ', '')
+    
+    if not token or not (token_manager.has_role(token, 'metrics') or token_manager.is_admin(token)):
+        return jsonify({'error': 'Metrics token required'}), 401
+    
+    return app.response_class(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/api/admin/logs', methods=['GET'])
 def get_admin_logs():
@@ -469,6 +740,77 @@ def get_admin_logs():
     
     return jsonify({'logs': logs})
 
+@app.route('/api/admin/db/queries', methods=['GET', 'DELETE'])
+def get_db_query_stats():
+    """
+    SQL 量測結果（僅 Admin）
+    GET: ?top=N&sort=total_time|max_time|avg_time|count|rows|lock_wait
+    DELETE: 清除統計與慢查詢紀錄
+    """
+    auth_header = request.headers.get('Authorization', '')
+    token = auth_header.replace('Bearer ', '')
+    
+    if not token or not token_manager.is_admin(token):
+        return jsonify({'error': 'Admin access required'}), 401
+    
+    if request.method == 'DELETE':
+        query_profiler.reset()
+        return jsonify({'message': 'Query statistics reset'})
+    
+    top = request.args.get('top', 20, type=int)
+    sort = request.args.get('sort', 'total_time')
+    if sort not in ('total_time', 'max_time', 'avg_time', 'count', 'rows', 'lock_wait'):
+        return jsonify({'error': f'Invalid sort field: {sort}'}), 400
+    
+    return jsonify({
+        'statements': query_profiler.top(top, sort),
+        'methods': query_profiler.by_method(),
+        'slow_queries': query_profiler.slow_queries(top),
+        'slow_threshold_ms': query_profiler.slow_threshold * 1000
+    })
+
+@app.route('/api/checker/lease', methods=['POST'])
+def lease_check_jobs():
+    """checker worker 取出檢查工作（僅 Checker Token）: {worker, limit (1-500), lease_seconds (1-3600)}"""
+    auth_header = request.headers.get('Authorization', '')
+    token = auth_header.replace('Bearer ', '')
+    
+    if not token or not token_manager.has_role(token, 'checker'):
+        return jsonify({'error': 'Checker token required'}), 401
+    if check_queue is None:
+        return jsonify({'error': 'Checker queue is disabled (checker.mode is not queue)'}), 409
+    
+    data = request.json or {}
+    if not isinstance(data, dict) or not data.get('worker'):
+        return jsonify({'error': 'Missing worker'}), 400
+    limit = data.get('limit', 10)
+    if type(limit) is not int or not 1 <= limit <= 500:
+        return jsonify({'error': 'limit must be an integer between 1 and 500'}), 400
+    lease_seconds = data.get('lease_seconds', 30)
+    if type(lease_seconds) not in (int, float) or not 1 <= lease_seconds <= 3600:
+        return jsonify({'error': 'lease_seconds must be a number between 1 and 3600'}), 400
+    jobs = check_queue.lease(data['worker'], limit, float(lease_seconds))
+    return jsonify({'jobs': jobs})
+
+@app.route('/api/checker/report', methods=['POST'])
+def report_check_results():
+    """checker worker 批次回報檢查結果（僅 Checker Token）: {worker, results: [{job_id, is_up, response_time, error_message}]}"""
+    auth_header = request.headers.get('Authorization', '')
+    token = auth_header.replace('Bearer ', '')
+    
+    if not token or not token_manager.has_role(token, 'checker'):
+        return jsonify({'error': 'Checker token required'}), 401
+    if check_queue is None:
+        return jsonify({'error': 'Checker queue is disabled (checker.mode is not queue)'}), 409
+    
+    data = request.json or {}
+    results = data.get('results')
+    if not data.get('worker') or not isinstance(results, list):
+        return jsonify({'error': 'Missing worker or results'}), 400
+    if any('job_id' not in result or 'is_up' not in result for result in results):
+        return jsonify({'error': 'Each result needs job_id and is_up'}), 400
+    return jsonify({'accepted': check_queue.report(data['worker'], results)})
+
 @app.route('/api/patch/upload', methods=['POST'])
 def upload_patch():
     """上傳 Patch 文件（僅 Team）"""
@@ -486,6 +828,13 @@ def upload_patch():
     team_str = auth_result['team_id']
     team_id = int(team_str.replace('team', ''))
     
+    # 請求大小上限 (multipart 的欄位與邊界另外保留 64KB)
+    if request.content_length and request.content_length > patch_store.max_bytes + 64 * 1024:
+        return jsonify({
+            'success': False,
+            'message': f'Patch too large (max {patch_store.max_bytes} bytes)'
+        }), 413
+    
     # 檢查文件
     if 'patch' not in request.files:
         return jsonify({'success': False, 'message': 'No file uploaded'}), 400
@@ -497,25 +846,23 @@ def upload_patch():
     if not file.filename.endswith('.py'):
         return jsonify({'success': False, 'message': 'Only .py files allowed'}), 400
     
-    # 保存 Patch 到持久化目錄
-    patch_dir = '/app/data/patches'  # 改為持久化路徑
-    os.makedirs(patch_dir, exist_ok=True)
-    
-    patch_path = os.path.join(patch_dir, f'{team_id}_app.py')
-    file.save(patch_path)
+    # 串流寫入 Patch 儲存 (相同內容只存一份)
+    patch, error = patch_store.save(team_id, file.filename, file.stream)
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    response_cache.bump('patches')
     
-    # 同時保存一份到 /app/patches 供立即套用使用
-    temp_patch_dir = '/app/patches'
-    os.makedirs(temp_patch_dir, exist_ok=True)
-    temp_patch_path = os.path.join(temp_patch_dir, f'{team_id}_app.py')
-    file.seek(0)  # 重置文件指針
-    file.save(temp_patch_path)
+    # 非同步檢查 (相同內容已有結果時不重新檢查)
+    if patch_validator is not None and patch['status'] not in ('valid', 'invalid'):
+        patch_validator.submit(patch)
     
-    logger.info(f"Patch uploaded for team {team_id} (saved to persistent storage)")
+    logger.info(f"Patch uploaded for team {team_id} ({patch['sha256'][:12]}, {patch['size']} bytes)")
     
     return jsonify({
         'success': True,
-        'message': f'Patch uploaded successfully. Will be applied in next patch phase.'
+        'message': f'Patch uploaded successfully. Will be applied in next patch phase.',
+        'sha256': patch['sha256'],
+        'status': patch['status'] if patch_validator is not None else 'valid'
     })
 
 @app.route('/api/patch/download', methods=['GET'])
@@ -535,11 +882,10 @@ def download_patch():
     team_str = auth_result['team_id']
     team_id = int(team_str.replace('team', ''))
     
-    # 從持久化目錄檢查 patch 檔案
-    patch_dir = '/app/data/patches'
-    patch_path = os.path.join(patch_dir, f'{team_id}_app.py')
+    # 查詢隊伍目前的 patch
+    patch = patch_store.get(team_id)
     
-    if not os.path.exists(patch_path):
+    if not patch:
         return jsonify({
             'success': False, 
             'message': 'No patch file found. Please upload a patch first.'
@@ -548,7 +894,7 @@ def download_patch():
     try:
         from flask import send_file
         return send_file(
-            patch_path,
+            patch_store.path(patch['sha256']),
             as_attachment=True,
             download_name=f'team{team_id}_patch.py',
             mimetype='text/x-python'
@@ -577,46 +923,34 @@ def list_patches():
     if auth_result['role'] not in ['team', 'admin']:
         return jsonify({'success': False, 'message': 'Invalid token type'}), 403
     
-    # 從持久化目錄列出所有 patch 檔案
-    patch_dir = '/app/data/patches'
-    if not os.path.exists(patch_dir):
-        return jsonify({'patches': []})
+    return cached_json_response('patches', ('teams', 'patches'), build_patch_list)
+
+def build_patch_list():
+    team_dict = {t['id']: t['name'] for t in db.get_teams()}
     
     patches = []
-    teams = db.get_teams()
-    team_dict = {t['id']: t['name'] for t in teams}
-    
-    for filename in os.listdir(patch_dir):
-        if filename.endswith('_app.py'):
-            try:
-                team_id = int(filename.split('_')[0])
-                file_path = os.path.join(patch_dir, filename)
-                file_size = os.path.getsize(file_path)
-                file_mtime = os.path.getmtime(file_path)
-                
-                from datetime import datetime
-                # 修正時間格式 - 使用台灣時區 (UTC+8)
-                dt = datetime.fromtimestamp(file_mtime, tz=ZoneInfo('Asia/Taipei'))
-                upload_time = dt.strftime('%Y-%m-%d %p %I:%M:%S')  # 使用 %p 顯示 AM/PM，%I 為12小時制
-                
-                patches.append({
-                    'team_id': team_id,
-                    'team_name': team_dict.get(team_id, f'Team {team_id}'),
-                    'filename': filename,
-                    'size': file_size,
-                    'upload_time': upload_time
-                })
-            except (ValueError, IndexError):
-                continue
-    
-    # 按隊伍 ID 排序
-    patches.sort(key=lambda x: x['team_id'])
+    for patch in patch_store.list():
+        team_id = patch['team_id']
+        # 修正時間格式 - 使用台灣時區 (UTC+8)
+        dt = datetime.fromtimestamp(patch['uploaded_at'], tz=ZoneInfo('Asia/Taipei'))
+        upload_time = dt.strftime('%Y-%m-%d %p %I:%M:%S')  # 使用 %p 顯示 AM/PM，%I 為12小時制
+        
+        patches.append({
+            'team_id': team_id,
+            'team_name': team_dict.get(team_id, f'Team {team_id}'),
+            'filename': f'{team_id}_app.py',
+            'size': patch['size'],
+            'sha256': patch['sha256'],
+            'status': patch['status'],
+            'validation_error': patch['validation_error'],
+            'upload_time': upload_time
+        })
     
-    return jsonify({
+    return {
         'success': True,
         'patches': patches,
         'count': len(patches)
-    })
+    }
 
 @app.route('/api/patch/download/<int:target_team_id>', methods=['GET'])
 def download_other_team_patch(target_team_id):
@@ -634,11 +968,10 @@ def download_other_team_patch(target_team_id):
     if auth_result['role'] not in ['team', 'admin']:
         return jsonify({'success': False, 'message': 'Invalid token type'}), 403
     
-    # 從持久化目錄檢查目標隊伍的 patch
-    patch_dir = '/app/data/patches'
-    patch_path = os.path.join(patch_dir, f'{target_team_id}_app.py')
+    # 查詢目標隊伍的 patch
+    patch = patch_store.get(target_team_id)
     
-    if not os.path.exists(patch_path):
+    if not patch:
         return jsonify({
             'success': False,
             'message': f'Team {target_team_id} has not uploaded a patch yet.'
@@ -647,7 +980,7 @@ def download_other_team_patch(target_team_id):
     try:
         from flask import send_file
         return send_file(
-            patch_path,
+            patch_store.path(patch['sha256']),
             as_attachment=True,
             download_name=f'team{target_team_id}_patch.py',
             mimetype='text/x-python'
@@ -673,13 +1006,16 @@ def start_game():
         return jsonify({'error': 'Game already started'}), 400
     
     game_state['started'] = True
-    game_state['start_time'] = datetime.now(tz=ZoneInfo('Asia/Taipei'))
+    game_state['start_time'] = clock.now()
+    # Round 編號接續資料庫中已有的 Round (停止後重啟伺服器再開始時不會重複使用編號)
+    game_state['current_round'] = max(game_state['current_round'], db.get_last_round_number())
+    response_cache.bump('game')
     
     # 啟動遊戲循環
     threading.Thread(target=game_loop, daemon=True).start()
     
     logger.info("Game started!")
-    socketio.emit('game_started', {'message': 'Game has started'})
+    broadcast('game_started', {'message': 'Game has started'})
     
     return jsonify({'message': 'Game started successfully'})
 
@@ -698,324 +1034,498 @@ def stop_game():
     # 結束當前 round
     if game_state['round_id']:
         db.close_round(game_state['round_id'])
+    journal_phase('stopped', game_state['current_round'], game_state['round_id'])
+    flag_manager.clear_feed()
+    response_cache.bump('game', 'rounds')
     
     logger.info("Game stopped!")
-    socketio.emit('game_stopped', {'message': 'Game has stopped'})
+    broadcast('game_stopped', {'message': 'Game has stopped'})
     
     return jsonify({'message': 'Game stopped successfully'})
 
 # === 遊戲循環 ===
 
+def patches_to_apply():
+    """
+    每隊要套用的 Patch: {team_id: sha256}
+    有預先檢查時只套用各隊最後一個通過檢查的版本 (還在檢查中的最多等待 patches.validation.wait_seconds)
+    """
+    if patch_validator is not None:
+        patch_validator.wait(timeout=validation_config.get('wait_seconds', 10))
+    
+    patches = {}
+    for patch in patch_store.list():
+        team_id = patch['team_id']
+        sha256 = patch['sha256']
+        if patch_validator is not None:
+            if patch['status'] != 'valid':
+                logger.warning(f"Patch {sha256[:12]} for team{team_id} is {patch['status']}, "
+                               f"{'keeping last valid patch' if patch['valid_sha256'] else 'skipped'}")
+            sha256 = patch['valid_sha256']
+            if not sha256:
+                continue
+        patches[team_id] = sha256
+    return patches
+
+def apply_patch(team_id, sha256, slot=None):
+    """把 Patch 複製到隊伍容器 (slot 預設為目前使用的容器) 並重啟 Apache，返回是否成功複製"""
+    team_name = f"team{team_id}"
+    try:
+        # 將檔案複製到正在運行的容器
+        copied, error = container_backend.copy_into(team_id, patch_store.path(sha256), '/app/app.py', slot=slot)
+        
+        if not copied:
+            logger.error(f"Failed to apply patch for {team_name}: {error}")
+            return False
+        logger.info(f"Patch applied for {team_name}")
+        
+        # 重啟容器內的 Apache 以載入新代碼
+        reloaded, _ = container_backend.reload_app(team_id, slot=slot)
+        
+        if reloaded:
+            logger.info(f"Apache restarted for {team_name}")
+        else:
+            logger.warning(f"Could not restart Apache for {team_name}, container may need manual restart")
+        return True
+    
+    except Exception as e:
+        logger.error(f"Failed to apply patch for {team_name}: {e}")
+        return False
+
 def apply_patches():
     """套用所有隊伍的 Patch 到正在運行的容器"""
-    # 從持久化目錄讀取 patches
-    persistent_patch_dir = '/app/data/patches'
-    temp_patch_dir = '/app/patches'
-    
-    if not os.path.exists(persistent_patch_dir):
-        logger.info("No persistent patches directory found")
+    patches = patches_to_apply()
+    if not patches:
+        logger.info("No patches to apply")
         return
     
     logger.info("=== Applying Patches ===")
     
-    # 獲取所有 patch 文件
-    teams = db.get_teams()
-    applied_count = 0
+    team_ids = {team['id'] for team in db.get_teams()}
+    applied_count = sum(
+        1 for team_id, sha256 in patches.items() if team_id in team_ids and apply_patch(team_id, sha256)
+    )
+    
+    if applied_count == 0:
+        logger.info("No patches to apply")
+    else:
+        logger.info(f"Applied {applied_count} patches to running containers")
+
+def recreate_containers(teams):
+    """刪除所有隊伍容器後從乾淨映像重建並套用 patches (重建期間服務中斷)"""
+    team_names = [f"team{team['id']}" for team in teams]
+    
+    # Step 1: 停止並刪除所有容器
+    logger.info("Stopping and removing all team containers...")
+    step_start = time.perf_counter()
+    removed, error = container_backend.remove_containers([team['id'] for team in teams])
+    if removed:
+        logger.info(f"Removed containers: {', '.join(team_names)}")
+    else:
+        logger.error(f"Error stopping/removing containers: {error}")
+    record_step('remove_containers', step_start)
+    
+    # Step 2: 確保網路存在
+    logger.info("Step 2: Ensuring network exists...")
+    step_start = time.perf_counter()
+    network_ok, error = container_backend.ensure_network()
+    if not network_ok:
+        logger.error(f"Error checking/creating network: {error}")
+    record_step('ensure_network', step_start)
+
+    # Step 3: 從映像重新創建所有容器
+    logger.info("Step 3: Recreating containers from clean images...")
+    step_start = time.perf_counter()
+    recreate_success = 0
+    recreate_failed = 0
     
     for team in teams:
         team_id = team['id']
         team_name = f"team{team_id}"
-        persistent_patch_file = os.path.join(persistent_patch_dir, f'{team_id}_app.py')
+        container_start = time.perf_counter()
         
-        if os.path.exists(persistent_patch_file):
+        # 從映像重新創建容器
+        recreated, error = container_backend.run_team_container(team_id)
+        
+        if recreated:
+            recreate_success += 1
+            logger.info(f"Successfully recreated {team_name}")
+        else:
+            recreate_failed += 1
+            logger.error(f"Failed to recreate {team_name}: {error}")
+        CONTAINER_RECREATE_SECONDS.observe(
+            time.perf_counter() - container_start,
+            result='success' if recreated else 'failed'
+        )
+
+    logger.info(f"Recreation complete: {recreate_success} success, {recreate_failed} failed")
+    record_step('recreate_containers', step_start)
+
+    # Step 4: 等待容器完全啟動
+    logger.info("Step 4: Waiting for containers to fully start...")
+    step_start = time.perf_counter()
+    clock.sleep(15)
+    record_step('wait_containers', step_start)
+    
+    # Step 5: 套用 Patches
+    logger.info("Step 5: Applying patches...")
+    step_start = time.perf_counter()
+    apply_patches()
+    record_step('apply_patches', step_start)
+
+    # Step 6: 等待 patches 套用完成
+    step_start = time.perf_counter()
+    clock.sleep(5)
+    record_step('wait_patches', step_start)
+    
+    # 預熱請求：觸發 WSGI 應用初始化 (創建 secret_flag.txt 等檔案)
+    logger.info("Warming up team containers (triggering WSGI app initialization)...")
+    step_start = time.perf_counter()
+    warmup_success = 0
+    warmup_failed = 0
+    for team in teams:
+        team_id = team['id']
+        try:
+            # 訪問健康檢查端點觸發應用載入
+            response = service_checker.http.get(container_backend.health_url(team_id), timeout=5)
+            if response.status_code == 200:
+                warmup_success += 1
+            else:
+                warmup_failed += 1
+                logger.warning(f"team{team_id} warmup returned HTTP {response.status_code}")
+        except Exception as e:
+            warmup_failed += 1
+            logger.error(f"Failed to warm up team{team_id}: {e}")
+    logger.info(f"Warmup complete: {warmup_success} success, {warmup_failed} failed")
+    record_step('warmup', step_start)
+
+def wait_healthy(slots, timeout):
+    """
+    輪詢容器的健康檢查端點 (同時觸發 WSGI 應用初始化) 直到回應 200 或逾時
+    slots: {team_id: slot}，返回通過檢查的 team_id 集合
+    """
+    pending = dict(slots)
+    healthy = set()
+    deadline = clock.time() + timeout
+    while pending:
+        for team_id, slot in list(pending.items()):
             try:
-                # 使用 docker cp 將檔案複製到正在運行的容器
-                result = subprocess.run([
-                    'docker', 'cp',
-                    persistent_patch_file,
-                    f'{team_name}:/app/app.py'
-                ], capture_output=True, text=True, timeout=10)
-                
-                if result.returncode == 0:
-                    logger.info(f"Patch applied for {team_name}")
-                    applied_count += 1
-                    
-                    # 重啟容器內的 Apache 以載入新代碼
-                    restart_result = subprocess.run([
-                        'docker', 'exec', team_name,
-                        'bash', '-c', 'pkill -HUP apache2 || apachectl graceful'
-                    ], capture_output=True, text=True, timeout=10)
-                    
-                    if restart_result.returncode == 0:
-                        logger.info(f"Apache restarted for {team_name}")
-                    else:
-                        logger.warning(f"Could not restart Apache for {team_name}, container may need manual restart")
-                    
-                    # 注意：不刪除持久化的 patch 文件，這樣下次重啟後仍可使用
-                    # 只清理臨時目錄中的文件
-                    temp_patch_file = os.path.join(temp_patch_dir, f'{team_id}_app.py')
-                    if os.path.exists(temp_patch_file):
-                        os.remove(temp_patch_file)
-                else:
-                    logger.error(f"Failed to apply patch for {team_name}: {result.stderr}")
-                
-            except subprocess.TimeoutExpired:
-                logger.error(f"Timeout applying patch for {team_name}")
-            except Exception as e:
-                logger.error(f"Failed to apply patch for {team_name}: {e}")
+                response = service_checker.http.get(container_backend.health_url(team_id, slot), timeout=5)
+                if response.status_code == 200:
+                    healthy.add(team_id)
+                    del pending[team_id]
+            except Exception:
+                pass
+        if not pending or clock.time() >= deadline:
+            break
+        clock.sleep(1)
+    return healthy
+
+def swap_containers(teams):
+    """
+    blue/green 切換：每隊在備用 slot 從乾淨映像啟動新容器並套用 patch，
+    通過健康檢查後把註冊的 host/port 切換到新容器，再移除舊容器；
+    新容器失敗時移除新容器，舊容器繼續提供服務
+    """
+    health_timeout = container_config.get('health_timeout', 60)
+    
+    # Step 1: 確保網路存在
+    step_start = time.perf_counter()
+    network_ok, error = container_backend.ensure_network()
+    if not network_ok:
+        logger.error(f"Error checking/creating network: {error}")
+    record_step('ensure_network', step_start)
+    
+    # Step 2: 在備用 slot 啟動新容器
+    logger.info("Step 2: Starting next generation containers from clean images...")
+    step_start = time.perf_counter()
+    started = {}
+    for team in teams:
+        team_id = team['id']
+        container_start = time.perf_counter()
+        slot, error = container_backend.start_next(team_id)
+        if slot:
+            started[team_id] = slot
+        else:
+            logger.error(f"Failed to start next container for team{team_id}: {error}")
+        CONTAINER_RECREATE_SECONDS.observe(
+            time.perf_counter() - container_start,
+            result='success' if slot else 'failed'
+        )
+    record_step('recreate_containers', step_start)
+    
+    # Step 3: 等待新容器通過健康檢查
+    step_start = time.perf_counter()
+    healthy = wait_healthy(started, health_timeout)
+    record_step('wait_containers', step_start)
+    
+    # Step 4: 套用 Patches 到新容器，重啟 Apache 後再檢查一次
+    step_start = time.perf_counter()
+    patches = patches_to_apply()
+    patched = {team_id: started[team_id] for team_id in sorted(healthy)
+               if team_id in patches and apply_patch(team_id, patches[team_id], slot=started[team_id])}
+    if patched:
+        healthy = (healthy - set(patched)) | wait_healthy(patched, health_timeout)
+    record_step('apply_patches', step_start)
+    
+    # Step 5: 切換註冊的 host/port，之後才移除舊容器
+    step_start = time.perf_counter()
+    switched = 0
+    for team in teams:
+        team_id = team['id']
+        slot = started.get(team_id)
+        if slot is None:
+            continue
+        if team_id not in healthy:
+            logger.error(f"team{team_id} next container {slot['container']} failed health check, keeping current one")
+            container_backend.remove_slot(slot)
+            continue
+        db.add_team(team_id, team['name'], slot['host'], slot['port'])
+        removed, error = container_backend.activate(team_id, slot)
+        if not removed:
+            logger.warning(f"Failed to remove previous container of team{team_id}: {error}")
+        switched += 1
+    response_cache.bump('teams')
+    logger.info(f"Switched {switched}/{len(teams)} teams to new containers")
+    record_step('switch_containers', step_start)
+
+def start_round():
+    """開始新 Round：創建 Round 並生成 Flags，返回 (round_number, round_id, teams)"""
+    game_state['current_round'] += 1
+    round_number = game_state['current_round']
+    game_state['phase'] = 'playing'
     
-    if applied_count == 0:
-        logger.info("No patches to apply")
+    logger.info(f"=== Round {round_number} - PLAYING PHASE ===")
+    
+    # 創建 Round
+    round_id = db.create_round(round_number)
+    game_state['round_id'] = round_id
+    response_cache.bump('game', 'rounds')
+    GAME_ROUND.set(round_number)
+    
+    # 生成新 Flags
+    teams = db.get_teams()
+    flags = flag_manager.create_flags_for_round(
+        round_id, 
+        round_number, 
+        teams, 
+        config['game']['flag_lifetime'],
+        pregenerated=pregenerated_flags.pop(round_number, None)
+    )
+    logger.info(f"Generated {len(flags)} flags for round {round_number}")
+    return round_number, round_id, teams
+
+def journal_phase(phase, round_number, round_id, deadline=None):
+    """記錄遊戲階段轉換 (伺服器重啟後由 resume_game 從最後一筆繼續)"""
+    start_time = game_state.get('start_time')
+    db.save_game_state({
+        'phase': phase,
+        'round_number': round_number,
+        'round_id': round_id,
+        'deadline': deadline,
+        'game_start_time': start_time.isoformat() if start_time else None
+    })
+
+def resume_game():
+    """
+    伺服器重啟後從遊戲狀態紀錄恢復：重建 game_state、Flag feed 與 Patch 階段資訊，
+    並從中斷的階段繼續遊戲循環 (沿用原本的階段截止時間)
+    返回是否恢復了進行中的遊戲
+    """
+    state = db.get_game_state()
+    if not state or state['phase'] not in ('playing', 'scoring', 'patching'):
+        return False
+    
+    round_number = state['round_number']
+    round_id = state['round_id']
+    game_state['started'] = True
+    game_state['current_round'] = round_number
+    game_state['round_id'] = round_id
+    game_state['phase'] = 'patching' if state['phase'] == 'patching' else 'playing'
+    if state['game_start_time']:
+        game_state['start_time'] = datetime.fromisoformat(state['game_start_time'])
+    GAME_ROUND.set(round_number)
+    
+    if state['phase'] == 'playing':
+        # 重新發布本 Round 的 Flag feed (Flags 已在資料庫中，不重新生成)
+        flag_manager.publish_feed(round_id, round_number, {
+            team['id']: db.get_team_flags(team['id'], round_id) for team in db.get_teams()
+        })
+    elif state['phase'] == 'patching':
+        game_state['patch_phase_info'] = {
+            'round_id': round_id,
+            'round_number': round_number,
+            'phase': 'patching',
+            'remaining_seconds': max(0, int(state['deadline'] - clock.time())),
+            'start_time': clock.now().isoformat()
+        }
+    response_cache.bump('game', 'rounds', 'scores', 'service_status')
+    
+    logger.info(f"Resuming round {round_number} from phase '{state['phase']}'")
+    threading.Thread(target=game_loop, kwargs={'resume': state}, daemon=True).start()
+    return True
+
+def close_round(round_number, round_id):
+    """結束 Round 並清空 Flag feed"""
+    db.close_round(round_id)
+    flag_manager.clear_feed()
+    response_cache.bump('scores', 'rounds')
+    logger.info(f"Round {round_number} scoring complete")
+
+def publish_scoreboard(round_number):
+    """廣播分數更新"""
+    scoreboard = db.get_scoreboard()
+    broadcast('scoreboard_updated', {
+        'round': round_number,
+        'scoreboard': scoreboard
+    })
+
+def prepare_flags(round_number, teams):
+    """預先生成下一 Round 的 Flag 值 (Round 開始時才寫入資料庫並發布)"""
+    pregenerated_flags.clear()
+    pregenerated_flags[round_number] = flag_manager.generate_round_flags(round_number, teams)
+
+def run_round_boundary(round_number, round_id, teams, score=True):
+    """
+    Round 之間的工作以 task graph 並行執行，Patch 階段的關鍵路徑只有容器相關工作：
+      scoring -> close_round -> publish_scoreboard (score=False 時略過，Round 已經結算)
+      prepare_flags: 下一 Round 的 Flag 值
+      containers: 重建容器或 blue/green 切換，並套用 patches
+    每個工作記錄為一個步驟耗時；某工作失敗不影響其他分支
+    """
+    graph = TaskGraph(on_step=record_step)
+    if score:
+        graph.add('scoring', lambda: scoring_engine.calculate_round_scores(round_id))
+        graph.add('close_round', lambda: close_round(round_number, round_id), after=['scoring'])
+        graph.add('publish_scoreboard', lambda: publish_scoreboard(round_number), after=['close_round'])
+    graph.add('prepare_flags', lambda: prepare_flags(round_number + 1, teams))
+    if container_swap == 'blue_green':
+        # 舊容器在新容器通過健康檢查前持續提供服務
+        graph.add('containers', lambda: swap_containers(teams))
     else:
-        logger.info(f"Applied {applied_count} patches to running containers")
+        graph.add('containers', lambda: recreate_containers(teams))
+    failed = graph.run()
+    if failed:
+        logger.error(f"Round {round_number} boundary tasks did not complete: {', '.join(sorted(failed))}")
 
-def game_loop():
-    """主遊戲循環 - 5分鐘比賽 + 5分鐘套用patch"""
+def game_loop(max_rounds=None, resume=None):
+    """
+    主遊戲循環 - 比賽階段 + 套用patch階段
+    max_rounds: 跑完指定的 Round 數後結束 (模擬用)，None 為持續到遊戲停止
+    resume: 遊戲狀態紀錄 (db.get_game_state)，從該筆記錄的 Round 與階段繼續
+    每次階段轉換都會寫入遊戲狀態紀錄
+    """
     logger.info("Game loop started")
     
-    while game_state['started']:
+    while game_state['started'] and (resume is not None or max_rounds is None
+                                     or game_state['current_round'] < max_rounds):
         try:
-            # ========== 階段 1: 比賽階段 (5 分鐘) ==========
-            game_state['current_round'] += 1
-            round_number = game_state['current_round']
-            game_state['phase'] = 'playing'
-            
-            logger.info(f"=== Round {round_number} - PLAYING PHASE ===")
-            
-            # 創建 Round
-            round_id = db.create_round(round_number)
-            game_state['round_id'] = round_id
-            
-            # 生成新 Flags
-            teams = db.get_teams()
-            flags = flag_manager.create_flags_for_round(
-                round_id, 
-                round_number, 
-                teams, 
-                config['game']['flag_lifetime']
-            )
-            logger.info(f"Generated {len(flags)} flags for round {round_number}")
-            
-            # 廣播新 Round 開始
-            socketio.emit('round_started', {
-                'round': round_number,
-                'phase': 'playing',
-                'duration': config['game']['round_duration']
-            })
-            
-            # Round 計時
-            round_start = time.time()
-            round_duration = config['game']['round_duration']
-            check_interval = config['game']['service_check_interval']
-            
-            # 在 Round 期間定期檢查服務
-            while time.time() - round_start < round_duration and game_state['started']:
-                # 檢查所有服務
-                service_status = service_checker.check_all_services(teams, round_id)
+            if resume is not None:
+                # 從紀錄的階段繼續
+                round_number = resume['round_number']
+                round_id = resume['round_id']
+                phase = resume['phase']
+                phase_deadline = resume['deadline']
+                teams = db.get_teams()
+                resume = None
+            else:
+                # ========== 階段 1: 比賽階段 (5 分鐘) ==========
+                round_number, round_id, teams = start_round()
+                phase = 'playing'
+                phase_deadline = clock.time() + config['game']['round_duration']
+                journal_phase('playing', round_number, round_id, phase_deadline)
                 
-                # 廣播服務狀態更新
-                socketio.emit('service_status_updated', {
+                # 廣播新 Round 開始
+                broadcast('round_started', {
                     'round': round_number,
-                    'status': service_status
+                    'phase': 'playing',
+                    'duration': config['game']['round_duration']
                 })
-                
-                # 等待下次檢查
-                time.sleep(check_interval)
             
-            # Round 結束
-            if game_state['started']:
-                logger.info(f"=== Round {round_number} - SCORING ===")
+            if phase == 'playing':
+                check_interval = config['game']['service_check_interval']
                 
-                # 計算分數
-                scoring_engine.calculate_round_scores(round_id)
-                
-                # 結束 Round
-                db.close_round(round_id)
-                
-                # 廣播分數更新
-                scoreboard = db.get_scoreboard()
-                socketio.emit('scoreboard_updated', {
-                    'round': round_number,
-                    'scoreboard': scoreboard
-                })
-                
-                logger.info(f"Round {round_number} scoring complete")
+                # 在 Round 期間定期檢查服務
+                while clock.time() < phase_deadline and game_state['started']:
+                    # 檢查所有服務
+                    service_status = service_checker.check_all_services(teams, round_id)
+                    response_cache.bump('service_status')
+                    
+                    # 廣播服務狀態更新
+                    broadcast('service_status_updated', {
+                        'round': round_number,
+                        'status': service_status
+                    })
+                    
+                    # 等待下次檢查
+                    clock.sleep(check_interval)
                 
+                # Round 結束：計分在 Patch 階段中與容器重建同時進行
+                phase = 'scoring'
+                phase_deadline = None
+            
+            if game_state['started'] and phase in ('scoring', 'patching'):
                 # ========== 階段 2: Patch 套用階段 (5 分鐘) ==========
                 logger.info(f"=== Round {round_number} - PATCH PHASE ===")
                 game_state['phase'] = 'patching'
+                response_cache.bump('game')
                 
                 # 計算 patch 階段結束時間
                 patch_duration = config['game'].get('patch_duration', 300)
-                patch_end_time = datetime.now(tz=ZoneInfo('Asia/Taipei')) + timedelta(seconds=patch_duration)
+                if phase_deadline is None:
+                    phase_deadline = clock.time() + patch_duration
+                    journal_phase('patching', round_number, round_id, phase_deadline)
+                
+                # Round 尚未結束 (剛離開比賽階段，或計分完成前伺服器重啟) 時需要計分
+                current_round = db.get_current_round()
+                score = current_round is not None and current_round['id'] == round_id
                 
                 # 保存 patch 階段資訊供 API 使用
                 game_state['patch_phase_info'] = {
                     'round_id': round_id,
                     'round_number': round_number,
                     'phase': 'patching',
-                    'remaining_seconds': patch_duration,
-                    'start_time': datetime.now(tz=ZoneInfo('Asia/Taipei')).isoformat()
+                    'remaining_seconds': max(0, int(phase_deadline - clock.time())),
+                    'start_time': clock.now().isoformat()
                 }
                 
                 # 廣播進入 Patch 階段
-                socketio.emit('phase_changed', {
+                broadcast('phase_changed', {
                     'phase': 'patching',
                     'duration': patch_duration,
-                    'message': '正在套用 Patch，服務暫停中...'
+                    'message': '正在套用 Patch，服務暫停中...' if container_swap != 'blue_green'
+                               else '正在準備套用 Patch 的新容器，服務持續運行...'
                 })
                 
-                # 記錄 patch 階段開始時間
-                patch_start = time.time()
-                
-                # Patch 階段：重啟容器並套用 patches
+                # Patch 階段：重啟容器並套用 patches (從紀錄恢復時也重新執行，各步驟可重複執行)，
+                # 同時計分、發布排行榜並準備下一 Round 的 Flags
                 # 注意：簡單的 restart 不會恢復被刪除的檔案
                 # 檔案恢復需要靠 secret_flag.txt 在應用啟動時自動創建
+                run_round_boundary(round_number, round_id, teams, score)
                 
-                team_names = [f"team{team['id']}" for team in teams]
-                
-                # Step 1: 停止並刪除所有容器
-                logger.info("Stopping and removing all team containers...")
-                try:
-                    subprocess.run(
-                        ['docker', 'rm', '-f'] + team_names,
-                        capture_output=True,
-                        text=True,
-                        timeout=30
-                    )
-                    logger.info(f"Removed containers: {', '.join(team_names)}")
-                except Exception as e:
-                    logger.error(f"Error stopping/removing containers: {e}")
-                
-                # Step 2: 確保網路存在
-                logger.info("Step 2: Ensuring network exists...")
-                try:
-                    result = subprocess.run(
-                        ['docker', 'network', 'inspect', 'adsystem_ad-network'],
-                        capture_output=True,
-                        text=True,
-                        timeout=10
-                    )
-                    if result.returncode != 0:
-                        logger.info("Network not found, creating adsystem_ad-network...")
-                        subprocess.run(
-                            ['docker', 'network', 'create', '--subnet=172.30.0.0/24', 'adsystem_ad-network'],
-                            capture_output=True,
-                            text=True,
-                            timeout=10
-                        )
-                        logger.info("Network created")
-                except Exception as e:
-                    logger.error(f"Error checking/creating network: {e}")
-
-                # Step 3: 從映像重新創建所有容器
-                logger.info("Step 3: Recreating containers from clean images...")
-                recreate_success = 0
-                recreate_failed = 0
-                
-                for team in teams:
-                    team_id = team['id']
-                    team_name = f"team{team_id}"
-                    image_name = f"adsystem_{team_name}"
-                    
-                    try:
-                        # 從映像重新創建容器
-                        docker_run_cmd = [
-                            'docker', 'run', '-d',
-                            '--name', team_name,
-                            '--network', 'adsystem_ad-network',
-                            '--ip', f'172.30.0.{100 + team_id}',
-                            '-p', f'{8100 + team_id}:8000',
-                            '-e', f'TEAM_ID={team_name}',
-                            '-e', 'MAIN_SERVER=http://172.30.0.10:5000',
-                            '-e', 'PORT=8000',
-                            '-e', f'SECRET_KEY={team_name}-secret-key',
-                            '-e', 'APACHE_LOG_DIR=/var/log/apache2',
-                            '-v', f'adsystem_{team_name}-logs:/app/logs',
-                            '-v', f'adsystem_{team_name}-files:/app/files',
-                            image_name
-                        ]
-                        
-                        result = subprocess.run(
-                            docker_run_cmd,
-                            capture_output=True,
-                            text=True,
-                            timeout=30
-                        )
-                        
-                        if result.returncode == 0:
-                            recreate_success += 1
-                            logger.info(f"Successfully recreated {team_name}")
-                        else:
-                            recreate_failed += 1
-                            logger.error(f"Failed to recreate {team_name}: {result.stderr}")
-                            
-                    except subprocess.TimeoutExpired:
-                        recreate_failed += 1
-                        logger.error(f"Timeout recreating {team_name}")
-                    except Exception as e:
-                        recreate_failed += 1
-                        logger.error(f"Error recreating {team_name}: {e}")
-
-                logger.info(f"Recreation complete: {recreate_success} success, {recreate_failed} failed")
-
-                # Step 4: 等待容器完全啟動
-                logger.info("Step 4: Waiting for containers to fully start...")
-                time.sleep(15)
-                
-                # Step 5: 套用 Patches
-                logger.info("Step 5: Applying patches...")
-                apply_patches()
-
-                # Step 6: 等待 patches 套用完成
-                time.sleep(5)
-                
-                # 預熱請求：觸發 WSGI 應用初始化 (創建 secret_flag.txt 等檔案)
-                logger.info("Warming up team containers (triggering WSGI app initialization)...")
-                import requests
-                warmup_success = 0
-                warmup_failed = 0
-                for team in teams:
-                    team_id = team['id']
-                    try:
-                        # 訪問健康檢查端點觸發應用載入
-                        response = requests.get(f"http://172.30.0.{100 + team_id}:8000/health", timeout=5)
-                        if response.status_code == 200:
-                            warmup_success += 1
-                        else:
-                            warmup_failed += 1
-                            logger.warning(f"team{team_id} warmup returned HTTP {response.status_code}")
-                    except Exception as e:
-                        warmup_failed += 1
-                        logger.error(f"Failed to warm up team{team_id}: {e}")
-                logger.info(f"Warmup complete: {warmup_success} success, {warmup_failed} failed")
-                
-                # 等待剩餘的 patch 時間
-                patch_duration = config['game'].get('patch_duration', 300)
-                applied_time = time.time() - patch_start
-                remaining_time = patch_duration - applied_time
+                # 等待到 patch 階段截止時間
+                remaining_time = phase_deadline - clock.time()
                 
                 if remaining_time > 0:
                     logger.info(f"Waiting {remaining_time:.0f}s before next round...")
                     
                     # 在等待期間更新剩餘時間
-                    wait_start = time.time()
-                    while time.time() - wait_start < remaining_time and game_state['started']:
-                        elapsed = time.time() - wait_start
-                        remaining = int(remaining_time - elapsed)
+                    while clock.time() < phase_deadline and game_state['started']:
+                        remaining = int(phase_deadline - clock.time())
                         if remaining > 0:
                             game_state['patch_phase_info']['remaining_seconds'] = remaining
-                        time.sleep(1)  # 每秒更新一次
+                        clock.sleep(1)  # 每秒更新一次
                 
                 # 清除 patch 階段資訊
                 if 'patch_phase_info' in game_state:
                     del game_state['patch_phase_info']
+                response_cache.bump('game')
                 
                 logger.info("Patch phase complete, ready for next round")
         
         except Exception as e:
             logger.error(f"Error in game loop: {e}", exc_info=True)
-            time.sleep(5)
+            clock.sleep(5)
     
     logger.info("Game loop ended")
 
@@ -1038,12 +1548,32 @@ if __name__ == '__main__':
     # 初始化隊伍
     init_teams()
     
+    # 匯入舊版格式的 patch 檔案，並繼續檢查重啟前未完成的 patch
+    patch_store.import_legacy()
+    if patch_validator is not None:
+        # 檢查容器無法執行時所有 patch 都不會通過檢查，也就永遠不會被套用：直接停止啟動
+        sandbox_errors = patch_validator.self_check(team['id'] for team in config['teams'])
+        if sandbox_errors:
+            for error in sandbox_errors:
+                logger.critical(f"Patch validation sandbox cannot run: {error}")
+            raise SystemExit('Patch validation sandbox is unavailable; build the team images '
+                             'or set patches.validation.enabled: false')
+        patch_validator.resume()
+    
+    # 恢復重啟前進行中的遊戲
+    if resume_game():
+        logger.info("Game state restored from journal")
+    
     # 打印 Tokens
     print("\n" + "="*80)
     print("🔐 AUTHENTICATION TOKENS")
     print("="*80)
     print("\n🛡️  ADMIN TOKEN:")
     print(f"   {TOKENS['admin']}")
+    print("\n🔎 CHECKER TOKEN (checker_worker.py --server):")
+    print(f"   {TOKENS['checker']}")
+    print("\n📈 METRICS TOKEN (Prometheus: Authorization: Bearer <token>):")
+    print(f"   {TOKENS['metrics']}")
     print("\n" + "-"*80)
     print("\n👥 TEAM TOKENS:")
     for i in range(1, config['game']['num_teams'] + 1):
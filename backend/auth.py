@@ -1,23 +1,32 @@
 """
 Token 認證系統
-生成並管理 Team Token 和 Admin Token
+生成並管理 Team Token、Admin Token 和服務用的 Token
+服務 Token 只能存取各自的 API：
+  checker: /api/checker/* (給其他機器上的 checker worker 使用)
+  metrics: /metrics (給 Prometheus 抓取指標使用)
 """
 import secrets
 import hashlib
 from typing import Dict, List
 
+# 服務 Token 的角色
+SERVICE_ROLES = ('checker', 'metrics')
+
 class TokenManager:
     def __init__(self):
         self.tokens = {}
         self.admin_token = None
+        self.service_tokens = {}  # role -> token
         
     def generate_tokens(self, num_teams: int = 12) -> Dict[str, str]:
         """
-        生成 Team Tokens 和 Admin Token
+        生成 Team Tokens、Admin Token 和服務 Tokens
         
         Returns:
             {
                 'admin': 'admin_token_xxx',
+                'checker': 'checker_token_xxx',
+                'metrics': 'metrics_token_xxx',
                 'team1': 'team1_token_xxx',
                 'team2': 'team2_token_xxx',
                 ...
@@ -29,6 +38,8 @@ class TokenManager:
         admin_secret = secrets.token_hex(32)  # 64 字元
         self.admin_token = f"ADMIN_{admin_secret}"
         tokens['admin'] = self.admin_token
+        for role in SERVICE_ROLES:
+            tokens[role] = self.generate_service_token(role)
         
         # 生成 Team Tokens
         for i in range(1, num_teams + 1):
@@ -40,6 +51,12 @@ class TokenManager:
         
         return tokens
     
+    def generate_service_token(self, role: str) -> str:
+        """生成服務 Token (舊的 tokens.json 沒有時補上)"""
+        service_secret = secrets.token_hex(32)  # 64 字元
+        self.service_tokens[role] = f"{role.upper()}_{service_secret}"
+        return self.service_tokens[role]
+    
     def validate_token(self, token: str) -> Dict:
         """
         驗證 Token 並返回身份信息
@@ -47,7 +64,7 @@ class TokenManager:
         Returns:
             {
                 'valid': bool,
-                'role': 'admin' | 'team',
+                'role': 'admin' | 'checker' | 'metrics' | 'team',
                 'team_id': str (僅 team 角色)
             }
         """
@@ -59,6 +76,15 @@ class TokenManager:
                 'team_id': None
             }
         
+        # 檢查服務 Token
+        for role, service_token in self.service_tokens.items():
+            if token == service_token:
+                return {
+                    'valid': True,
+                    'role': role,
+                    'team_id': None
+                }
+        
         # 檢查 Team Token
         for team_id, team_token in self.tokens.items():
             if token == team_token:
@@ -83,3 +109,8 @@ class TokenManager:
         """檢查是否為 Admin Token"""
         result = self.validate_token(token)
         return result['valid'] and result['role'] == 'admin'
+    
+    def has_role(self, token: str, role: str) -> bool:
+        """檢查是否為指定角色 (例如 'checker') 的 Token"""
+        result = self.validate_token(token)
+        return result['valid'] and result['role'] == role
@@ -0,0 +1,4 @@
+"""
+效能測試工具：負載測試、micro-benchmark 與本機替身服務
+在 backend/ 目錄下以 python -m bench.<module> 執行
+"""
@@ -0,0 +1,135 @@
+"""
+ServiceChecker 的 benchmark
+以 FakeFleet 模擬 12 ~ 500 隊的服務 (可混合延遲、錯誤、部分故障、卡住、超大回應、離線)，
+對每個隊伍數執行數次完整檢查 (check_all_services)，量測每輪耗時，
+並與替身服務記錄的 ground truth 比對 checker 判定的準確度
+
+用法 (在 backend/ 目錄下):
+    python -m bench.checker_bench --teams 12,100,500 --mix healthy:0.9,slow:0.05,down:0.05
+    python -m bench.checker_bench --teams 50 --mix dead:1 --timeout 1 --sweeps 1
+    python -m bench.checker_bench --teams 50 --mix healthy:0.5,oversized:0.5 --max-body-bytes 65536
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List
+
+from bench.fake_fleet import PROFILES, FakeFleet, assign_profiles
+from checker import ServiceChecker
+from models import Database
+
+DEFAULT_MIX = 'healthy:0.85,slow:0.04,flaky:0.03,partial:0.03,oversized:0.02,hang:0.01,down:0.02'
+
+
+def run_teams(num_teams: int, mix: str, sweeps: int, timeout: float, seed: int, work_dir: str,
+              ground_truth=None, max_body_bytes: int = 0) -> Dict:
+    profiles = assign_profiles(num_teams, mix, seed)
+    fleet = FakeFleet(num_teams, profiles=profiles, seed=seed)
+    fleet.start()
+    try:
+        db = Database(os.path.join(work_dir, f'checker-{num_teams}.db'))
+        teams = fleet.teams()
+        for team in teams:
+            db.add_team(team['id'], team['name'], team['host'], team['port'])
+        round_id = db.create_round(1)
+        checker = ServiceChecker(db, timeout=timeout, max_body_bytes=max_body_bytes)
+        profile_of = {team['id']: profiles[team['id'] - 1].name for team in teams}
+
+        sweep_times = []
+        mistakes = Counter()
+        checked = Counter()
+        correct = 0
+        for sweep in range(sweeps):
+            fleet.reset_records()
+            start = time.perf_counter()
+            results = checker.check_all_services(teams, round_id)
+            sweep_times.append(time.perf_counter() - start)
+
+            expected = fleet.expected_status(timeout)
+            for team_id, is_up in results.items():
+                profile = profile_of[team_id]
+                checked[profile] += 1
+                if is_up == expected[team_id]:
+                    correct += 1
+                else:
+                    mistakes[(profile, 'false_up' if is_up else 'false_down')] += 1
+            if ground_truth is not None:
+                for record in fleet.records:
+                    ground_truth.write(json.dumps({'teams': num_teams, 'sweep': sweep, **record}) + '\n')
+    finally:
+        fleet.stop()
+
+    total = sum(checked.values())
+    return {
+        'teams': num_teams,
+        'sweeps': sweeps,
+        'timeout': timeout,
+        'max_body_bytes': max_body_bytes,
+        'profiles': dict(Counter(profile_of.values())),
+        'sweep_seconds': {
+            'min': round(min(sweep_times), 3),
+            'median': round(statistics.median(sweep_times), 3),
+            'max': round(max(sweep_times), 3),
+        },
+        'per_team_ms': round(statistics.median(sweep_times) / num_teams * 1000, 3),
+        'accuracy': round(correct / total, 4) if total else None,
+        'mistakes': [
+            {'profile': profile, 'kind': kind, 'count': count}
+            for (profile, kind), count in sorted(mistakes.items())
+        ],
+    }
+
+
+def print_results(results: List[Dict]):
+    print(f"{'teams':>6} {'sweep median s':>15} {'sweep max s':>12} {'per team ms':>12} {'accuracy':>9}  mistakes")
+    for result in results:
+        mistakes = ', '.join(f"{m['profile']} {m['kind']} x{m['count']}" for m in result['mistakes']) or '-'
+        print(f"{result['teams']:>6} {result['sweep_seconds']['median']:>15.3f} {result['sweep_seconds']['max']:>12.3f} "
+              f"{result['per_team_ms']:>12.3f} {result['accuracy']:>9.2%}  {mistakes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ServiceChecker sweep benchmark against a fake fleet')
+    parser.add_argument('--teams', default='12,50,200', help='comma separated team counts (e.g. 12,100,500)')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help=f'profile:weight list, profiles: {", ".join(PROFILES)}')
+    parser.add_argument('--sweeps', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=5, help='ServiceChecker timeout (seconds)')
+    parser.add_argument('--max-body-bytes', type=int, default=0,
+                        help='stream at most this many bytes of each response (0 reads the whole body)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--ground-truth', help='write every fake request (JSON lines) to this file')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    # 每隊的檢查結果都會寫 log，量測時只保留錯誤
+    logging.getLogger('checker').setLevel(logging.ERROR)
+
+    work_dir = tempfile.mkdtemp(prefix='ad-checker-bench-')
+    ground_truth = open(args.ground_truth, 'w', encoding='utf-8') if args.ground_truth else None
+    results = []
+    try:
+        for num_teams in [int(n) for n in args.teams.split(',')]:
+            print(f'[bench] {num_teams} teams ...', file=sys.stderr, flush=True)
+            results.append(run_teams(num_teams, args.mix, args.sweeps, args.timeout, args.seed,
+                                     work_dir, ground_truth, args.max_body_bytes))
+    finally:
+        if ground_truth:
+            ground_truth.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'mix': args.mix, 'seed': args.seed, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
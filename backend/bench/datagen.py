@@ -0,0 +1,137 @@
+"""
+合成遊戲資料庫產生器
+依隊伍數、Round 數與各類資料密度產生與正式環境相同 schema 的 SQLite 資料庫，
+相同參數 + seed 產生的內容完全相同，供 micro-benchmark 重複使用
+
+用法 (在 backend/ 目錄下):
+    python -m bench.datagen --teams 50 --rounds 100 --out /tmp/game-50x100.db
+"""
+import argparse
+import hashlib
+import os
+import random
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict
+
+from models import Database
+
+VULN_TYPES = ['monitor', 'logs', 'download']
+
+DEFAULT_DENSITY = {
+    'checks_per_round': 20,    # 每隊每 Round 的服務檢查紀錄數 (正式環境約 round_duration / 5)
+    'uptime': 0.85,            # 服務檢查成功的機率
+    'steal_rate': 0.1,         # 每隊每 Round 偷到某隊某個 Flag 的機率
+}
+
+
+def flag_value(seed: int, team_id: int, round_number: int, vuln_type: str) -> str:
+    secret = hashlib.sha256(f'{seed}_{team_id}_{round_number}_{vuln_type}'.encode()).hexdigest()[:32]
+    return f'FLAG{{{team_id}_{round_number}_{secret}}}'
+
+
+def generate(path: str, num_teams: int, num_rounds: int, seed: int = 1, **density) -> Dict:
+    """
+    產生合成資料庫，最後一個 Round 保持 active (與遊戲進行中相同)
+    返回各資料表的列數
+    """
+    density = {**DEFAULT_DENSITY, **density}
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    Database(path)  # 建立 schema
+
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    cursor = conn.cursor()
+    start = datetime(2025, 1, 1, 9, 0, 0)
+
+    cursor.executemany(
+        'INSERT INTO teams (id, name, host, port) VALUES (?, ?, ?, ?)',
+        [(t, f'Team {t}', f'team{t}', 8000) for t in range(1, num_teams + 1)]
+    )
+
+    counts = {'teams': num_teams, 'rounds': 0, 'flags': 0, 'flag_submissions': 0, 'service_status': 0, 'scores': 0}
+    for round_number in range(1, num_rounds + 1):
+        round_start = start + timedelta(minutes=31 * (round_number - 1))
+        is_last = round_number == num_rounds
+        cursor.execute(
+            'INSERT INTO rounds (id, round_number, start_time, end_time, status) VALUES (?, ?, ?, ?, ?)',
+            (round_number, round_number, round_start.isoformat(sep=' '),
+             None if is_last else (round_start + timedelta(minutes=30)).isoformat(sep=' '),
+             'active' if is_last else 'closed')
+        )
+        counts['rounds'] += 1
+
+        cursor.executemany(
+            'INSERT INTO flags (team_id, round_id, flag_value, vuln_type) VALUES (?, ?, ?, ?)',
+            [(t, round_number, flag_value(seed, t, round_number, v), v)
+             for t in range(1, num_teams + 1) for v in VULN_TYPES]
+        )
+        counts['flags'] += num_teams * len(VULN_TYPES)
+
+        submissions = []
+        for attacker in range(1, num_teams + 1):
+            for victim in range(1, num_teams + 1):
+                if attacker == victim:
+                    continue
+                for vuln_type in VULN_TYPES:
+                    if rng.random() < density['steal_rate']:
+                        submitted_at = round_start + timedelta(seconds=rng.randint(0, 1799))
+                        submissions.append((attacker, victim, round_number,
+                                            flag_value(seed, victim, round_number, vuln_type), 1,
+                                            submitted_at.isoformat(sep=' ')))
+        cursor.executemany(
+            'INSERT INTO flag_submissions (submitter_team_id, target_team_id, round_id, flag_value, is_valid, submitted_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)', submissions
+        )
+        counts['flag_submissions'] += len(submissions)
+
+        checks = density['checks_per_round']
+        statuses = []
+        for t in range(1, num_teams + 1):
+            for i in range(checks):
+                checked_at = round_start + timedelta(seconds=int(1800 * i / checks))
+                is_up = rng.random() < density['uptime']
+                statuses.append((t, round_number, is_up, rng.uniform(0.05, 1.5),
+                                 None if is_up else 'Failed (1/3): /monitor: Timeout',
+                                 checked_at.isoformat(sep=' ')))
+        cursor.executemany(
+            'INSERT INTO service_status (team_id, round_id, is_up, response_time, error_message, checked_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)', statuses
+        )
+        counts['service_status'] += len(statuses)
+
+        if not is_last:
+            cursor.executemany(
+                'INSERT INTO scores (team_id, round_id, sla_score, defense_score, attack_score, total_score) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(t, round_number, 5.0, 2.0, 1.0, 8.0) for t in range(1, num_teams + 1)]
+            )
+            counts['scores'] += num_teams
+
+    conn.commit()
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic A&D CTF game database')
+    parser.add_argument('--teams', type=int, default=12)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--checks-per-round', type=int, default=DEFAULT_DENSITY['checks_per_round'])
+    parser.add_argument('--uptime', type=float, default=DEFAULT_DENSITY['uptime'])
+    parser.add_argument('--steal-rate', type=float, default=DEFAULT_DENSITY['steal_rate'])
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    counts = generate(args.out, args.teams, args.rounds, args.seed,
+                      checks_per_round=args.checks_per_round, uptime=args.uptime, steal_rate=args.steal_rate)
+    print(', '.join(f'{table}={count}' for table, count in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+"""
+本機替身隊伍服務
+實作 ServiceChecker 會檢查的 /files、/logs、/monitor 以及 /health，
+讓負載測試與 checker 測試不需要 Docker 與 Apache 隊伍容器
+
+所有隊伍的服務在同一個背景執行緒的 asyncio event loop 上，各自監聽一個本機 port，
+數百隊也不需要數百條執行緒。每隊可指定 ServiceProfile 模擬延遲分佈、錯誤率、
+部分端點故障、卡住不回應、超大回應或整個服務離線，並記錄每個請求的 ground truth
+"""
+import asyncio
+import math
+import random
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+FILES_PAGE = b"""<html><body><h1>File Manager</h1>
+<ul><li><a href="/download?file=readme.txt">readme.txt</a> (41 bytes) download</li></ul>
+</body></html>"""
+
+LOGS_PAGE = b"""<html><body><h1>Log Search</h1><pre>
+/app/logs/access.log:Access log entries...
+/app/logs/system.log:System log entries...
+</pre></body></html>"""
+
+MONITOR_PAGE = b"""<html><body><h1>System Monitor</h1><pre>
+; <<>> DiG 9.18.18 <<>> google.com
+;; global options: +cmd
+;; Got answer:
+;; ->>HEADER<<- opcode: QUERY, status: NOERROR, id: 4242
+;; QUESTION SECTION:
+;google.com.            IN  A
+;; ANSWER SECTION:
+google.com.     300 IN  A   142.250.196.110
+</pre></body></html>"""
+
+PAGES = {
+    '/files': FILES_PAGE,
+    '/logs': LOGS_PAGE,
+    '/monitor': MONITOR_PAGE,
+    '/health': b'OK',
+}
+
+REASONS = {200: 'OK', 404: 'Not Found', 500: 'Internal Server Error'}
+
+# 功能故障時回傳的頁面：HTTP 200 但沒有 checker 期待的內容
+BROKEN_PAGE = b'<html><body><h1>Error</h1></body></html>'
+
+
+class ServiceProfile:
+    def __init__(self, name: str = 'healthy', latency: str = 'constant', latency_ms: float = 2.0,
+                 jitter: float = 0.5, failure_rate: float = 0.0, broken_endpoints=(),
+                 hang_rate: float = 0.0, hang_seconds: float = 60.0, oversized_bytes: int = 0,
+                 down: bool = False):
+        """
+        latency: 延遲分佈 constant / uniform / lognormal / exponential
+        latency_ms: constant 的延遲、uniform / lognormal 的中位數、exponential 的平均
+        jitter: uniform 為 ±比例，lognormal 為 sigma
+        failure_rate: 回應 HTTP 500 的機率
+        broken_endpoints: 功能故障 (200 但內容不正確) 的端點
+        hang_rate: 請求卡住不回應的機率，卡住 hang_seconds 後直接斷線
+        oversized_bytes: 在正常回應後附加的填充位元組數
+        down: 服務離線 (port 沒有監聽，連線被拒)
+        """
+        self.name = name
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.broken_endpoints = frozenset(broken_endpoints)
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.oversized_bytes = oversized_bytes
+        self.down = down
+
+    def sample_latency(self, rng: random.Random) -> float:
+        """依延遲分佈抽樣 (秒)"""
+        base = self.latency_ms / 1000
+        if self.latency == 'uniform':
+            return max(0.0, rng.uniform(base * (1 - self.jitter), base * (1 + self.jitter)))
+        if self.latency == 'lognormal':
+            return base * math.exp(self.jitter * rng.gauss(0, 1))
+        if self.latency == 'exponential':
+            return rng.expovariate(1 / base) if base > 0 else 0.0
+        return base
+
+
+# 預設的情境
+PROFILES = {
+    'healthy': ServiceProfile('healthy'),
+    'slow': ServiceProfile('slow', latency='lognormal', latency_ms=300, jitter=1.0),
+    'flaky': ServiceProfile('flaky', latency='exponential', latency_ms=20, failure_rate=0.3),
+    'partial': ServiceProfile('partial', broken_endpoints=('/monitor',)),
+    'broken': ServiceProfile('broken', broken_endpoints=('/logs', '/monitor')),
+    'hang': ServiceProfile('hang', hang_rate=0.1),
+    'dead': ServiceProfile('dead', hang_rate=1.0),
+    'oversized': ServiceProfile('oversized', oversized_bytes=8 * 1024 * 1024),
+    'down': ServiceProfile('down', down=True),
+}
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """'healthy:0.8,slow:0.1,down:0.1' -> {'healthy': 0.8, 'slow': 0.1, 'down': 0.1}"""
+    weights = {}
+    for item in mix.split(','):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition(':')
+        name = name.strip()
+        if name not in PROFILES:
+            raise ValueError(f'Unknown profile: {name} (choose from {", ".join(PROFILES)})')
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def assign_profiles(num_teams: int, mix: str, seed: int = 1) -> List[ServiceProfile]:
+    """依比例分配情境給各隊 (數量四捨五入，不足的補 healthy)，以 seed 決定順序"""
+    weights = parse_mix(mix)
+    total = sum(weights.values()) or 1
+    profiles = []
+    for name, weight in weights.items():
+        profiles.extend([PROFILES[name]] * int(round(num_teams * weight / total)))
+    profiles = profiles[:num_teams]
+    profiles.extend([PROFILES['healthy']] * (num_teams - len(profiles)))
+    random.Random(seed).shuffle(profiles)
+    return profiles
+
+
+def free_port(host: str = '127.0.0.1') -> int:
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+class FakeTeamService:
+    """單一隊伍的替身服務 (在 FakeFleet 的 event loop 上執行)"""
+
+    def __init__(self, fleet: 'FakeFleet', team_id: int, profile: ServiceProfile, seed: int):
+        self.fleet = fleet
+        self.team_id = team_id
+        self.profile = profile
+        self.rng = random.Random(f'{seed}-{team_id}')
+        self.requests = 0
+        self.host = fleet.host
+        self.port = None
+        self.server = None
+
+    async def start(self):
+        if self.profile.down:
+            self.port = free_port(self.host)
+            return
+        self.server = await asyncio.start_server(self._handle, self.host, 0, limit=1 << 20)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length') or 0)
+                if length:
+                    await reader.readexactly(length)
+
+                response = await self._respond(method, target.split('?', 1)[0])
+                if response is None:
+                    break
+                writer.write(response)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+            # CancelledError: stop() 時取消仍卡住的請求
+            pass
+        finally:
+            writer.close()
+
+    def plan(self, method: str, path: str) -> Tuple[Optional[int], bytes, float]:
+        """
+        依情境決定回應並記錄 ground truth
+        返回: (HTTP 狀態碼, 內容, 延遲秒數)；狀態碼為 None 表示卡住後斷線
+        """
+        profile = self.profile
+        self.requests += 1
+        delay = profile.sample_latency(self.rng)
+        record = {'team_id': self.team_id, 'profile': profile.name, 'method': method, 'endpoint': path,
+                  'at': time.time(), 'delay': delay}
+
+        if profile.hang_rate and self.rng.random() < profile.hang_rate:
+            record.update(outcome='hang', valid=False, delay=profile.hang_seconds)
+            self.fleet.records.append(record)
+            return None, b'', profile.hang_seconds
+
+        body = PAGES.get(path)
+        if body is None:
+            status, body, outcome = 404, b'Not Found', 'not_found'
+        elif profile.failure_rate and self.rng.random() < profile.failure_rate:
+            status, body, outcome = 500, b'Internal Server Error', 'error'
+        elif path in profile.broken_endpoints:
+            status, body, outcome = 200, BROKEN_PAGE, 'broken'
+        else:
+            status, outcome = 200, 'ok'
+            if profile.oversized_bytes:
+                body = body + b' ' * profile.oversized_bytes
+                outcome = 'oversized'
+        record.update(outcome=outcome, valid=status == 200 and outcome in ('ok', 'oversized'), size=len(body))
+        self.fleet.records.append(record)
+        return status, body, delay
+
+    async def _respond(self, method: str, path: str) -> Optional[bytes]:
+        """依情境產生回應；None 表示卡住後斷線"""
+        status, body, delay = self.plan(method, path)
+        if delay:
+            await asyncio.sleep(delay)
+        if status is None:
+            return None
+        head = (f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+                f'Content-Type: text/html; charset=utf-8\r\n'
+                f'Content-Length: {len(body)}\r\n\r\n').encode('latin-1')
+        return head + body
+
+
+class FakeFleet:
+    """一組替身隊伍服務，每隊各自監聽一個本機 port"""
+
+    def __init__(self, num_teams: int, host: str = '127.0.0.1', profiles: List[ServiceProfile] = None,
+                 seed: int = 1):
+        self.host = host
+        profiles = profiles or [PROFILES['healthy']] * num_teams
+        self.services = [FakeTeamService(self, team_id, profiles[team_id - 1], seed)
+                         for team_id in range(1, num_teams + 1)]
+        # 每個請求的 ground truth (只在 event loop 執行緒 append)
+        self.records: List[Dict] = []
+        self._loop = None
+        self._thread = None
+
+    def use_virtual_addresses(self):
+        """不啟動伺服器，改以 FakeFleetSession 在同一個程序內回應；各隊使用虛擬的 host"""
+        for service in self.services:
+            service.host, service.port = f'team{service.team_id}.fake', 8000
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_all(), self._loop).result()
+
+    async def _start_all(self):
+        for service in self.services:
+            await service.start()
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+        self._loop = None
+
+    async def _shutdown(self):
+        for service in self.services:
+            if service.server is not None:
+                service.server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def teams(self) -> List[Dict]:
+        """轉成 config['teams'] / db.get_teams() 的格式"""
+        return [
+            {'id': service.team_id, 'name': f'Team {service.team_id}', 'host': service.host, 'port': service.port}
+            for service in self.services
+        ]
+
+    def request_counts(self) -> Dict[int, int]:
+        return {service.team_id: service.requests for service in self.services}
+
+    def reset_records(self):
+        self.records = []
+
+    def expected_status(self, timeout: float, records: List[Dict] = None) -> Dict[int, bool]:
+        """
+        依 ground truth 推算 checker 應得的結果：
+        在 timeout 內回應且內容正確的端點達 2 個以上視為在線 (與 ServiceChecker 的規則相同)
+        """
+        ok_counts = {service.team_id: 0 for service in self.services}
+        for record in (self.records if records is None else records):
+            if record['endpoint'] in ('/files', '/logs', '/monitor') and record['valid'] and record['delay'] < timeout:
+                ok_counts[record['team_id']] += 1
+        return {team_id: count >= 2 for team_id, count in ok_counts.items()}
+
+
+class FakeResponse:
+    """requests.Response 的最小替身 (支援 stream=True 時的 iter_content)"""
+
+    def __init__(self, status_code: int, content: bytes):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {'Content-Type': 'text/html; charset=utf-8', 'Content-Length': str(len(content))}
+        self.encoding = 'utf-8'
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def iter_content(self, chunk_size: int = 1, decode_unicode: bool = False):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeFleetSession:
+    """
+    在同一個程序內回應 ServiceChecker 的請求 (取代 requests 模組)，不經過網路
+    延遲與卡住會推進 clock (若有提供)，超過 timeout 時拋出 requests 的 Timeout
+    """
+
+    def __init__(self, fleet: FakeFleet, clock=None):
+        self.clock = clock
+        self._services = {(service.host, service.port): service for service in fleet.services}
+
+    def _advance(self, seconds: float):
+        if self.clock is not None:
+            self.clock.advance(seconds)
+
+    def request(self, method: str, url: str, timeout: float = None, **kwargs) -> FakeResponse:
+        parts = urlsplit(url)
+        service = self._services.get((parts.hostname, parts.port or 80))
+        if service is None or service.profile.down:
+            raise requests.exceptions.ConnectionError(f'Connection refused: {parts.netloc}')
+        status, body, delay = service.plan(method, parts.path)
+        if status is None or (timeout is not None and delay >= timeout):
+            self._advance(timeout if timeout is not None else delay)
+            raise requests.exceptions.ReadTimeout(f'Read timed out: {url}')
+        self._advance(delay)
+        return FakeResponse(status, body)
+
+    def get(self, url: str, **kwargs) -> FakeResponse:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, data=None, **kwargs) -> FakeResponse:
+        return self.request('POST', url, **kwargs)
@@ -0,0 +1,368 @@
+"""
+整場遊戲的負載測試
+以暫存資料庫啟動 backend (python app.py)，隊伍服務由本機替身 (FakeFleet) 提供，
+並同時執行：
+  - 每隊的 Flag 提交機器人 (有效 Flag / 暴力猜測)
+  - 模擬 Dashboard 輪詢的客戶端，以及保持 SocketIO 連線的客戶端 (需要 python-socketio)
+  - 正常運作的 game_loop (服務檢查會打到替身服務)
+結束後輸出每個端點的吞吐量與 p50 / p99 延遲
+
+用法 (在 backend/ 目錄下):
+    python -m bench.loadtest --teams 12 --duration 60 --json result.json
+"""
+import argparse
+import json
+import os
+import random
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import requests
+import yaml
+
+from bench.fake_fleet import FakeFleet
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dashboard 的輪詢間隔 (秒)，與 dashboard.html 相同
+DASHBOARD_POLLS = [
+    ('GET /api/status', '/api/status', 2),
+    ('GET /api/scoreboard', '/api/scoreboard', 5),
+    ('GET /api/service-status', '/api/service-status', 10),
+    ('GET /api/flag/history', '/api/flag/history', 5),
+    ('GET /api/patch/list', '/api/patch/list?token={token}', 10),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Stats:
+    """每個 worker 執行緒各自累積延遲，結束時才合併 (避免量測本身造成鎖競爭)"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._all: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def _mine(self) -> Dict:
+        mine = getattr(self._local, 'samples', None)
+        if mine is None:
+            mine = {}
+            self._local.samples = mine
+            with self._lock:
+                self._all.append(mine)
+        return mine
+
+    def record(self, name: str, latency: float, status):
+        entry = self._mine().setdefault(name, {'latencies': [], 'statuses': {}})
+        entry['latencies'].append(latency)
+        entry['statuses'][status] = entry['statuses'].get(status, 0) + 1
+
+    def summary(self, elapsed: float) -> Dict[str, Dict]:
+        merged: Dict[str, Dict] = {}
+        with self._lock:
+            for samples in self._all:
+                for name, entry in samples.items():
+                    target = merged.setdefault(name, {'latencies': [], 'statuses': {}})
+                    target['latencies'].extend(entry['latencies'])
+                    for status, count in entry['statuses'].items():
+                        target['statuses'][status] = target['statuses'].get(status, 0) + count
+
+        result = {}
+        for name, entry in sorted(merged.items()):
+            latencies = sorted(entry['latencies'])
+            result[name] = {
+                'requests': len(latencies),
+                'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+                'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+                'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+                'statuses': {str(status): count for status, count in sorted(entry['statuses'].items(), key=str)}
+            }
+        return result
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.stats = Stats()
+        self.stop_event = threading.Event()
+        self.workdir = tempfile.mkdtemp(prefix='ad-loadtest-')
+        self.port = free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        self.fleet = FakeFleet(args.teams)
+        self.backend = None
+        self.tokens = {}
+        self.socketio_events = 0
+        self._socketio_lock = threading.Lock()
+
+    # === 環境準備 ===
+
+    def write_config(self) -> str:
+        config = {
+            'game': {
+                'num_teams': self.args.teams,
+                # 預設讓整個測試都在第一個 Round 的比賽階段內
+                'round_duration': self.args.round_duration or self.args.duration + 120,
+                'patch_duration': self.args.patch_duration,
+                'flag_lifetime': 30,
+                'service_check_interval': self.args.check_interval,
+            },
+            'scoring': {
+                'sla_total_pool': 60,
+                'base_defense_score': 3,
+                'attack_score_per_flag': 1,
+                'defense_penalty_per_steal': 1,
+            },
+            'teams': self.fleet.teams(),
+            'server': {'host': '127.0.0.1', 'port': self.port, 'debug': False},
+            'database': {'path': os.path.join(self.workdir, 'game.db')},
+        }
+        path = os.path.join(self.workdir, 'config.yml')
+        with open(path, 'w', encoding='utf-8') as f:
+            yaml.safe_dump(config, f, allow_unicode=True)
+        return path
+
+    def start_backend(self):
+        config_path = self.write_config()
+        env = dict(os.environ)
+        env['CONFIG_FILE'] = config_path
+        env['TOKEN_FILE'] = os.path.join(self.workdir, 'tokens.json')
+        log = open(os.path.join(self.workdir, 'backend.log'), 'w')
+        self.backend = subprocess.Popen(
+            [sys.executable, 'app.py'], cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            if self.backend.poll() is not None:
+                raise RuntimeError(f'Backend exited early, see {log.name}')
+            try:
+                if requests.get(f'{self.base_url}/api/status', timeout=1).status_code == 200:
+                    break
+            except requests.exceptions.RequestException:
+                time.sleep(0.2)
+        else:
+            raise RuntimeError('Backend did not become ready within 30s')
+
+        with open(env['TOKEN_FILE'], 'r') as f:
+            self.tokens = json.load(f)
+
+    def start_game(self):
+        response = requests.post(f'{self.base_url}/api/game/start', json={'token': self.tokens['admin']}, timeout=5)
+        response.raise_for_status()
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            status = requests.get(f'{self.base_url}/api/status', timeout=5).json()
+            if status.get('round_info', {}).get('round_number'):
+                return
+            time.sleep(0.2)
+        raise RuntimeError('First round did not start within 30s')
+
+    # === 客戶端 ===
+
+    def timed(self, session: requests.Session, name: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=self.args.timeout, **kwargs)
+            status = response.status_code
+        except requests.exceptions.RequestException as e:
+            response = None
+            status = type(e).__name__
+        self.stats.record(name, time.perf_counter() - start, status)
+        return response
+
+    def pace(self, started: float):
+        """依 --bot-rate 控制每個機器人的請求速率 (0 = 不限速)"""
+        if self.args.bot_rate > 0:
+            delay = 1 / self.args.bot_rate - (time.perf_counter() - started)
+            if delay > 0:
+                self.stop_event.wait(delay)
+
+    def valid_flag_bot(self, team_id: int):
+        """提交其他隊伍當前的真實 Flag (以 Admin Token 取得，模擬成功的攻擊)"""
+        session = requests.Session()
+        token = self.tokens[f'team{team_id}']
+        targets = [t for t in range(1, self.args.teams + 1) if t != team_id]
+        while not self.stop_event.is_set() and targets:
+            started = time.perf_counter()
+            target = random.choice(targets)
+            response = self.timed(
+                session, 'GET /api/team/<id>/flags', 'GET',
+                f'{self.base_url}/api/team/{target}/flags', params={'token': self.tokens['admin']}
+            )
+            flags = response.json().get('flags', {}) if response is not None and response.status_code == 200 else {}
+            flag = random.choice(list(flags.values())) if flags else None
+            if flag:
+                self.timed(session, 'POST /api/flag/submit (valid)', 'POST',
+                           f'{self.base_url}/api/flag/submit', json={'token': token, 'flag': flag})
+            self.pace(started)
+
+    def brute_force_bot(self, team_id: int):
+        """隨機猜測 Flag"""
+        session = requests.Session()
+        token = self.tokens[f'team{team_id}']
+        while not self.stop_event.is_set():
+            started = time.perf_counter()
+            guess = f'FLAG{{{random.randint(1, self.args.teams)}_1_{secrets.token_hex(16)}}}'
+            self.timed(session, 'POST /api/flag/submit (guess)', 'POST',
+                       f'{self.base_url}/api/flag/submit', json={'token': token, 'flag': guess})
+            self.pace(started)
+
+    def dashboard_poller(self):
+        """以 dashboard.html 的輪詢間隔 (除以 --poll-speedup) 輪詢各端點"""
+        session = requests.Session()
+        token = self.tokens['team1']
+        self.timed(session, 'GET /', 'GET', f'{self.base_url}/', headers={'Accept-Encoding': 'gzip'})
+        # 錯開各客戶端的起始時間
+        next_due = {name: time.time() + random.random() * interval for name, _, interval in DASHBOARD_POLLS}
+        while not self.stop_event.is_set():
+            now = time.time()
+            for name, path, interval in DASHBOARD_POLLS:
+                if now >= next_due[name]:
+                    self.timed(session, name, 'GET', self.base_url + path.format(token=token))
+                    next_due[name] = now + interval / self.args.poll_speedup
+            self.stop_event.wait(max(0.0, min(next_due.values()) - time.time()))
+
+    def socketio_client(self):
+        """保持 SocketIO 連線並計算收到的廣播事件數"""
+        import socketio
+
+        client = socketio.Client(reconnection=False)
+
+        @client.on('*')
+        def on_event(event, data):
+            with self._socketio_lock:
+                self.socketio_events += 1
+
+        start = time.perf_counter()
+        try:
+            client.connect(self.base_url)
+            self.stats.record('SOCKETIO connect', time.perf_counter() - start, 'ok')
+        except Exception as e:
+            self.stats.record('SOCKETIO connect', time.perf_counter() - start, type(e).__name__)
+            return
+        self.stop_event.wait()
+        client.disconnect()
+
+    # === 執行 ===
+
+    def run(self) -> Dict:
+        args = self.args
+        self.fleet.start()
+        try:
+            self.start_backend()
+            self.start_game()
+
+            workers = []
+            for team_id in range(1, args.teams + 1):
+                for _ in range(args.valid_bots):
+                    workers.append(threading.Thread(target=self.valid_flag_bot, args=(team_id,)))
+                for _ in range(args.brute_bots):
+                    workers.append(threading.Thread(target=self.brute_force_bot, args=(team_id,)))
+            for _ in range(args.pollers):
+                workers.append(threading.Thread(target=self.dashboard_poller))
+
+            socketio_clients = args.socketio_clients
+            if socketio_clients:
+                try:
+                    import socketio  # noqa: F401
+                except ImportError:
+                    print('python-socketio not installed, skipping SocketIO clients', file=sys.stderr)
+                    socketio_clients = 0
+            for _ in range(socketio_clients):
+                workers.append(threading.Thread(target=self.socketio_client))
+
+            for worker in workers:
+                worker.daemon = True
+                worker.start()
+
+            started = time.time()
+            self.stop_event.wait(args.duration)
+            self.stop_event.set()
+            elapsed = time.time() - started
+            for worker in workers:
+                worker.join(timeout=args.timeout + 5)
+
+            return {
+                'config': {
+                    'teams': args.teams, 'duration': args.duration, 'valid_bots': args.valid_bots,
+                    'brute_bots': args.brute_bots, 'pollers': args.pollers,
+                    'socketio_clients': socketio_clients, 'bot_rate': args.bot_rate,
+                },
+                'elapsed': round(elapsed, 2),
+                'endpoints': self.stats.summary(elapsed),
+                'socketio_events': self.socketio_events,
+                'team_service_requests': sum(self.fleet.request_counts().values()),
+            }
+        finally:
+            self.stop_event.set()
+            if self.backend and self.backend.poll() is None:
+                self.backend.terminate()
+                try:
+                    self.backend.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    self.backend.kill()
+            self.fleet.stop()
+            if args.keep:
+                print(f'Work directory kept at {self.workdir}', file=sys.stderr)
+            else:
+                shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def print_report(result: Dict):
+    print(f"\nLoad test: {result['config']['teams']} teams, {result['elapsed']}s")
+    print(f"{'endpoint':<36} {'requests':>9} {'rps':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}  statuses")
+    for name, entry in result['endpoints'].items():
+        statuses = ', '.join(f'{status}:{count}' for status, count in entry['statuses'].items())
+        print(f"{name:<36} {entry['requests']:>9} {entry['throughput_rps']:>9} "
+              f"{entry['p50_ms']:>9} {entry['p99_ms']:>9} {entry['max_ms']:>9}  {statuses}")
+    print(f"SocketIO events received: {result['socketio_events']}")
+    print(f"Team service requests (checker): {result['team_service_requests']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='A&D CTF backend load test')
+    parser.add_argument('--teams', type=int, default=12)
+    parser.add_argument('--duration', type=float, default=60, help='測試時間 (秒)')
+    parser.add_argument('--valid-bots', type=int, default=1, help='每隊提交有效 Flag 的機器人數')
+    parser.add_argument('--brute-bots', type=int, default=1, help='每隊暴力猜測 Flag 的機器人數')
+    parser.add_argument('--bot-rate', type=float, default=0, help='每個機器人每秒請求數 (0 = 不限速)')
+    parser.add_argument('--pollers', type=int, default=10, help='Dashboard 輪詢客戶端數')
+    parser.add_argument('--poll-speedup', type=float, default=1.0, help='輪詢間隔縮短倍數')
+    parser.add_argument('--socketio-clients', type=int, default=0, help='SocketIO 連線數')
+    parser.add_argument('--check-interval', type=float, default=5, help='game_loop 服務檢查間隔 (秒)')
+    parser.add_argument('--round-duration', type=int, default=0, help='Round 時長 (秒)，預設為整個測試期間')
+    parser.add_argument('--patch-duration', type=int, default=60)
+    parser.add_argument('--timeout', type=float, default=10, help='單一請求逾時 (秒)')
+    parser.add_argument('--json', help='將結果寫入 JSON 檔')
+    parser.add_argument('--keep', action='store_true', help='保留暫存目錄 (資料庫與 backend log)')
+    args = parser.parse_args()
+
+    result = LoadTest(args).run()
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
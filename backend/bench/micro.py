@@ -0,0 +1,254 @@
+"""
+儲存層與計分的 micro-benchmark
+對 bench.datagen 產生的合成資料庫 (不同隊伍數 × Round 數) 量測：
+  Database.get_scoreboard / get_service_status / submit_flag / get_flag_steals / get_attack_scores
+  多執行緒同時寫入 service_status (依 config 的 database.writer 設定決定是否 group commit)
+  ScoringEngine.calculate_round_scores
+每個大小的資料庫先複製一份再量測，寫入類的操作不會污染快取的資料庫
+
+用法 (在 backend/ 目錄下):
+    python -m bench.micro --sizes 12x10,50x100 --json result.json
+    python -m bench.micro --save-baseline baseline.json
+    python -m bench.micro --baseline baseline.json --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+import yaml
+
+from bench.datagen import DEFAULT_DENSITY, generate
+from models import Database
+from scoring import ScoringEngine
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_FILE = os.path.join(os.path.dirname(BACKEND_DIR), 'config-docker.yml')
+
+DEFAULT_SIZES = '12x10,12x100,50x100'
+
+
+def parse_sizes(value: str) -> List[Tuple[int, int]]:
+    """'12x10,50x100' -> [(12, 10), (50, 100)]"""
+    sizes = []
+    for item in value.split(','):
+        teams, rounds = item.lower().split('x')
+        sizes.append((int(teams), int(rounds)))
+    return sizes
+
+
+def dataset_path(data_dir: str, teams: int, rounds: int, seed: int, density: Dict) -> str:
+    """依參數命名，已產生過的資料庫直接重用"""
+    name = (f"{teams}x{rounds}-s{seed}-c{density['checks_per_round']}"
+            f"-u{density['uptime']}-r{density['steal_rate']}.db")
+    path = os.path.join(data_dir, name)
+    if not os.path.exists(path):
+        print(f'[datagen] {name} ...', file=sys.stderr, flush=True)
+        generate(path + '.tmp', teams, rounds, seed, **density)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def unsubmitted_flags(db_path: str, round_id: int, limit: int) -> List[Tuple[int, str]]:
+    """找出尚未被提交過的 (提交隊伍, Flag)，供量測 submit_flag 的接受路徑"""
+    conn = sqlite3.connect(db_path)
+    flags = conn.execute('SELECT team_id, flag_value FROM flags WHERE round_id = ?', (round_id,)).fetchall()
+    team_ids = [row[0] for row in conn.execute('SELECT id FROM teams ORDER BY id')]
+    submitted = set(conn.execute('SELECT submitter_team_id, flag_value FROM flag_submissions WHERE round_id = ?',
+                                 (round_id,)).fetchall())
+    conn.close()
+    pairs = []
+    for owner, flag in flags:
+        for submitter in team_ids:
+            if submitter != owner and (submitter, flag) not in submitted:
+                pairs.append((submitter, flag))
+                if len(pairs) >= limit:
+                    return pairs
+    return pairs
+
+
+def summarize(samples: List[float]) -> Dict:
+    samples = sorted(samples)
+    return {
+        'runs': len(samples),
+        'min_ms': round(samples[0] * 1000, 4),
+        'median_ms': round(statistics.median(samples) * 1000, 4),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 4),
+        'p95_ms': round(samples[min(len(samples) - 1, int(0.95 * len(samples)))] * 1000, 4),
+    }
+
+
+def measure(func: Callable, repeat: int, warmup: int = 1) -> Dict:
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def concurrent_writes(db: Database, round_id: int, threads: int = 8, writes: int = 25):
+    """threads 個執行緒各自連續寫入 writes 筆服務狀態，模擬 checker 與 API 同時寫入"""
+    def writer(thread: int):
+        for i in range(writes):
+            db.record_service_status(thread + 1, round_id, True, 0.01, None)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(writer, range(threads)))
+
+
+def run_size(db_path: str, teams: int, config: Dict, repeat: int, only: List[str] = None) -> Dict:
+    """對單一資料庫量測所有項目"""
+    writer_config = config['database'].get('writer', {})
+    db = Database(db_path, writer_options=writer_config if writer_config.get('enabled', True) else None)
+    config = {**config, 'game': {**config['game'], 'num_teams': teams}}
+    engine = ScoringEngine(db, config)
+    active_round = db.get_current_round()
+    last_closed = active_round['id'] - 1 if active_round['id'] > 1 else active_round['id']
+
+    accept_pairs = iter(unsubmitted_flags(db_path, active_round['id'], repeat + 1))
+    conn = sqlite3.connect(db_path)
+    duplicate = conn.execute(
+        'SELECT submitter_team_id, flag_value FROM flag_submissions ORDER BY id DESC LIMIT 1'
+    ).fetchone()
+    conn.close()
+
+    def submit_accepted():
+        pair = next(accept_pairs, None)
+        if pair is not None:
+            db.submit_flag(pair[0], pair[1], active_round['id'])
+
+    benchmarks = {
+        'get_scoreboard': db.get_scoreboard,
+        'get_service_status': lambda: db.get_service_status(active_round['id']),
+        'get_flag_steals': lambda: db.get_flag_steals(last_closed),
+        'get_attack_scores': lambda: db.get_attack_scores(last_closed),
+        'submit_flag.accepted': submit_accepted,
+        'submit_flag.duplicate': lambda: db.submit_flag(duplicate[0], duplicate[1], active_round['id']),
+        'submit_flag.invalid': lambda: db.submit_flag(1, 'FLAG{not_a_real_flag}', active_round['id']),
+        'calculate_round_scores': lambda: engine.calculate_round_scores(last_closed),
+        'service_status.concurrent': lambda: concurrent_writes(db, active_round['id']),
+    }
+
+    results = {}
+    for name, func in benchmarks.items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        results[name] = measure(func, repeat)
+    db.close()
+    return results
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[Dict]:
+    """以 median 比較，ratio > 1 + threshold 視為退步"""
+    rows = []
+    for size, benches in results.items():
+        for name, stat in benches.items():
+            base = baseline.get('results', {}).get(size, {}).get(name)
+            if not base or not base['median_ms']:
+                continue
+            ratio = stat['median_ms'] / base['median_ms']
+            rows.append({
+                'size': size, 'benchmark': name,
+                'baseline_ms': base['median_ms'], 'current_ms': stat['median_ms'],
+                'ratio': round(ratio, 3),
+                'regression': ratio > 1 + threshold,
+            })
+    return rows
+
+
+def print_results(results: Dict):
+    print(f"{'size':<10} {'benchmark':<26} {'median ms':>11} {'p95 ms':>11} {'min ms':>11}")
+    for size, benches in results.items():
+        for name, stat in benches.items():
+            print(f"{size:<10} {name:<26} {stat['median_ms']:>11.3f} {stat['p95_ms']:>11.3f} {stat['min_ms']:>11.3f}")
+
+
+def print_comparison(rows: List[Dict]):
+    print(f"\n{'size':<10} {'benchmark':<26} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for row in rows:
+        flag = '  REGRESSION' if row['regression'] else ''
+        print(f"{row['size']:<10} {row['benchmark']:<26} {row['baseline_ms']:>10.3f} "
+              f"{row['current_ms']:>10.3f} {row['ratio']:>7.3f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Storage and scoring micro-benchmarks')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='teams x rounds, comma separated (e.g. 12x10,200x1000)')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--only', default='', help='comma separated benchmark name prefixes')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--checks-per-round', type=int, default=DEFAULT_DENSITY['checks_per_round'])
+    parser.add_argument('--uptime', type=float, default=DEFAULT_DENSITY['uptime'])
+    parser.add_argument('--steal-rate', type=float, default=DEFAULT_DENSITY['steal_rate'])
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'ad-bench-data'),
+                        help='cache directory for generated databases')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='compare against a previously saved result file')
+    parser.add_argument('--save-baseline', help='write results as a new baseline file')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown ratio before flagging')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    density = {'checks_per_round': args.checks_per_round, 'uptime': args.uptime, 'steal_rate': args.steal_rate}
+    only = [prefix for prefix in args.only.split(',') if prefix]
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix='ad-micro-')
+    try:
+        for teams, rounds in parse_sizes(args.sizes):
+            size = f'{teams}x{rounds}'
+            source = dataset_path(args.data_dir, teams, rounds, args.seed, density)
+            db_path = os.path.join(work_dir, f'{size}.db')
+            shutil.copyfile(source, db_path)
+            print(f'[bench] {size} ...', file=sys.stderr, flush=True)
+            results[size] = run_size(db_path, teams, config, args.repeat, only)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'density': density,
+        },
+        'results': results,
+    }
+    print_results(results)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            rows = compare(results, json.load(f), args.threshold)
+        report['comparison'] = rows
+        print_comparison(rows)
+        if args.fail_on_regression and any(row['regression'] for row in rows):
+            exit_code = 1
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
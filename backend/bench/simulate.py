@@ -0,0 +1,259 @@
+"""
+以虛擬時鐘模擬整場遊戲 (不需要 Docker，也不需要等待真實時間)
+直接執行 app.game_loop：Round / Patch 階段的狀態機、FlagManager、ServiceChecker、ScoringEngine 都是正式程式碼，
+只替換三個邊界：
+  - clock: VirtualClock，sleep 立即推進虛擬時間
+  - container_backend: FakeContainerBackend，記錄容器操作而不呼叫 docker
+  - service_checker 的 http: FakeFleetSession，依 ServiceProfile 在同一個程序內回應
+每個 Round 開始時，模擬的攻擊隊伍依 --steal-rate 透過 /api/flag/submit 提交其他隊伍的 Flag
+相同參數與 seed 的結果 (最終分數) 相同，可用於 CI 的效能回歸測試與 control plane 的 profiling
+
+用法 (在 backend/ 目錄下):
+    python -m bench.simulate --teams 12 --rounds 50
+    python -m bench.simulate --teams 100 --rounds 10 --mix healthy:0.9,down:0.1 --json sim.json
+    python -m bench.simulate --teams 300 --rounds 50 --storage memory
+    python -m cProfile -o sim.prof -m bench.simulate --rounds 20
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+from bench.fake_fleet import FakeFleet, FakeFleetSession, assign_profiles
+from clock import VirtualClock
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_FILE = os.path.join(os.path.dirname(BACKEND_DIR), 'config-docker.yml')
+
+
+class FakeContainerBackend:
+    """containers.DockerBackend 的替身：只記錄操作，重建容器的耗時以虛擬時間計算"""
+
+    def __init__(self, fleet: FakeFleet, clock: VirtualClock, recreate_seconds: float = 1.0,
+                 failure_rate: float = 0.0, seed: int = 1):
+        self.clock = clock
+        self.recreate_seconds = recreate_seconds
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.operations = Counter()
+        self._addresses = {service.team_id: (service.host, service.port) for service in fleet.services}
+
+    def remove_containers(self, team_ids: List[int]) -> Tuple[bool, str]:
+        self.operations['remove'] += len(team_ids)
+        return True, None
+
+    def ensure_network(self) -> Tuple[bool, str]:
+        self.operations['ensure_network'] += 1
+        return True, None
+
+    def run_team_container(self, team_id: int, slot: Dict = None) -> Tuple[bool, str]:
+        self.clock.advance(self.recreate_seconds)
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            self.operations['run_failed'] += 1
+            return False, 'simulated failure'
+        self.operations['run'] += 1
+        return True, None
+
+    def copy_into(self, team_id: int, source: str, dest: str, slot: Dict = None) -> Tuple[bool, str]:
+        self.operations['copy'] += 1
+        return True, None
+
+    def reload_app(self, team_id: int, slot: Dict = None) -> Tuple[bool, str]:
+        self.operations['reload'] += 1
+        return True, None
+
+    def health_url(self, team_id: int, slot: Dict = None) -> str:
+        host, port = self._addresses[team_id]
+        return f'http://{host}:{port}/health'
+
+    # blue/green：新容器沿用替身服務的位址 (FakeFleetSession 只認得原本的 host/port)
+
+    def sync_active(self, teams: List[Dict]):
+        pass
+
+    def start_next(self, team_id: int) -> Tuple[Optional[Dict], str]:
+        started, error = self.run_team_container(team_id)
+        if not started:
+            return None, error
+        host, port = self._addresses[team_id]
+        return {'container': f'team{team_id}-next', 'host': host, 'port': port}, None
+
+    def remove_slot(self, slot: Dict) -> Tuple[bool, str]:
+        self.operations['remove'] += 1
+        return True, None
+
+    def activate(self, team_id: int, slot: Dict) -> Tuple[bool, str]:
+        self.operations['switch'] += 1
+        return self.remove_slot(slot)
+
+
+def write_config(work_dir: str, args, teams: List[Dict]) -> str:
+    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    config['game']['num_teams'] = len(teams)
+    for key, value in (('round_duration', args.round_duration), ('patch_duration', args.patch_duration),
+                       ('service_check_interval', args.check_interval)):
+        if value is not None:
+            config['game'][key] = value
+    config['database']['path'] = os.path.join(work_dir, 'game.db')
+    config['database']['engine'] = args.storage
+    config.setdefault('containers', {})['swap'] = args.container_swap
+    config.setdefault('patches', {})['path'] = os.path.join(work_dir, 'patches')
+    config['teams'] = teams
+    path = os.path.join(work_dir, 'config.yml')
+    with open(path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    return path
+
+
+def step_summary(histogram) -> Dict:
+    """把 Histogram 的累計值轉成 {label: {'count', 'total_s'}}"""
+    summary = {}
+    for key, state in histogram.collect().items():
+        summary['/'.join(str(part) for part in key) or 'all'] = {
+            'count': sum(state[:-1]),
+            'total_s': round(state[-1], 4),
+        }
+    return summary
+
+
+def run(args) -> Dict:
+    work_dir = tempfile.mkdtemp(prefix='ad-simulate-')
+    try:
+        fleet = FakeFleet(args.teams, profiles=assign_profiles(args.teams, args.mix, args.seed), seed=args.seed)
+        fleet.use_virtual_addresses()
+        os.environ['CONFIG_FILE'] = write_config(work_dir, args, fleet.teams())
+        os.environ['TOKEN_FILE'] = os.path.join(work_dir, 'tokens.json')
+
+        import app as game
+        from checker import SWEEP_SECONDS, ServiceChecker
+
+        logging.getLogger().setLevel(getattr(logging, args.log_level))
+        logging.getLogger('checker').setLevel(max(logging.ERROR, logging.getLogger().level))
+
+        clock = VirtualClock()
+        game.clock = clock
+        game.container_backend = FakeContainerBackend(fleet, clock, args.recreate_seconds,
+                                                      args.recreate_failure_rate, args.seed)
+        game.service_checker = ServiceChecker(game.db, timeout=game.service_checker.timeout,
+                                              http=FakeFleetSession(fleet, clock), uptime=game.uptime_tracker,
+                                              max_body_bytes=game.service_checker.max_body_bytes)
+
+        # 攔截廣播：統計事件，並在每個 Round 開始時模擬攻擊
+        client = game.app.test_client()
+        rng = random.Random(args.seed)
+        events = Counter()
+        submissions = Counter()
+        emit = game.broadcast
+
+        def broadcast(event, data):
+            events[event] += 1
+            emit(event, data)
+            if event == 'round_started':
+                attack(data['round'])
+
+        def attack(round_number):
+            team_ids = [team['id'] for team in fleet.teams()]
+            for victim in team_ids:
+                flags = game.flag_manager.get_feed(victim)['flags'] or {}
+                for attacker in team_ids:
+                    if attacker == victim:
+                        continue
+                    for flag in flags.values():
+                        if rng.random() >= args.steal_rate:
+                            continue
+                        response = client.post('/api/flag/submit', json={
+                            'token': game.TOKENS[f'team{attacker}'], 'flag': flag
+                        })
+                        submissions[response.status_code] += 1
+
+        game.broadcast = broadcast
+        # 模擬的攻擊集中在 Round 開始的瞬間送出，不套用提交限流
+        game.flag_rate_limiter = None
+
+        game.init_teams()
+        game.game_state['started'] = True
+        game.game_state['start_time'] = clock.now()
+        wall_start = time.perf_counter()
+        game.game_loop(max_rounds=args.rounds)
+        wall_seconds = time.perf_counter() - wall_start
+        game.game_state['started'] = False
+
+        scoreboard = game.db.get_scoreboard()
+        digest = hashlib.sha256(json.dumps(
+            [(team['id'], team['total_score']) for team in scoreboard]
+        ).encode()).hexdigest()[:16]
+
+        return {
+            'teams': args.teams,
+            'rounds': game.game_state['current_round'],
+            'seed': args.seed,
+            'mix': args.mix,
+            'virtual_seconds': round(clock.elapsed, 1),
+            'wall_seconds': round(wall_seconds, 3),
+            'speedup': round(clock.elapsed / wall_seconds, 1) if wall_seconds else None,
+            'scoreboard_digest': digest,
+            'scoreboard_top': scoreboard[:5],
+            'events': dict(events),
+            'flag_submissions': {str(status): count for status, count in submissions.items()},
+            'container_operations': dict(game.container_backend.operations),
+            'checker_sweeps': step_summary(SWEEP_SECONDS),
+            'round_steps': step_summary(game.ROUND_STEP_SECONDS),
+            'db_methods': game.query_profiler.by_method()[:10],
+        }
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            print(f'[simulate] kept {work_dir}', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a full game on a virtual clock with fake containers and services')
+    parser.add_argument('--teams', type=int, default=12)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--round-duration', type=int, help='override game.round_duration (seconds)')
+    parser.add_argument('--patch-duration', type=int, help='override game.patch_duration (seconds)')
+    parser.add_argument('--check-interval', type=int, help='override game.service_check_interval (seconds)')
+    parser.add_argument('--mix', default='healthy:0.8,slow:0.05,flaky:0.05,partial:0.05,down:0.05',
+                        help='fake service profile mix (see bench.fake_fleet.PROFILES)')
+    parser.add_argument('--steal-rate', type=float, default=0.2, help='chance an attacker submits each foreign flag')
+    parser.add_argument('--recreate-seconds', type=float, default=1.0, help='virtual cost of recreating a container')
+    parser.add_argument('--recreate-failure-rate', type=float, default=0.0)
+    parser.add_argument('--container-swap', default='recreate', choices=['recreate', 'blue_green'],
+                        help='patch phase container replacement strategy')
+    parser.add_argument('--storage', default='sqlite', choices=['sqlite', 'memory'],
+                        help='storage engine (memory skips all disk I/O)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    parser.add_argument('--max-wall-seconds', type=float, help='exit with status 1 if the simulation is slower')
+    parser.add_argument('--json', help='write the report to this file')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary database and config')
+    args = parser.parse_args()
+
+    report = run(args)
+    print(f"{report['rounds']} rounds, {report['teams']} teams: "
+          f"{report['virtual_seconds']:.0f}s virtual in {report['wall_seconds']:.2f}s wall "
+          f"(x{report['speedup']}), scoreboard digest {report['scoreboard_digest']}")
+    for step, stat in sorted(report['round_steps'].items(), key=lambda item: -item[1]['total_s']):
+        print(f"  {step:<22} x{stat['count']:<5} {stat['total_s']:.3f}s")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+    if args.max_wall_seconds is not None and report['wall_seconds'] > args.max_wall_seconds:
+        print(f"Simulation took {report['wall_seconds']:.2f}s (limit {args.max_wall_seconds}s)", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
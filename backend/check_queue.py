@@ -0,0 +1,253 @@
+"""
+服務檢查工作佇列
+主伺服器每輪檢查把每隊一筆 job 放進 SQLite 佇列 (獨立於 game.db 的檔案)，
+由 checker_worker.py 取出 (lease) 並批次回報結果，主伺服器只負責排程與彙整。
+同一台機器的 worker 直接開啟佇列檔案；其他機器的 worker 透過
+/api/checker/lease 與 /api/checker/report 存取 (RemoteCheckQueue)
+"""
+import logging
+import sqlite3
+import time
+from typing import Dict, List
+
+import requests
+
+from checker import SWEEP_SECONDS, TEAM_UP
+from metrics import Counter
+from storage import Storage
+from uptime import UptimeTracker
+
+logger = logging.getLogger(__name__)
+
+CHECK_JOBS = Counter('ad_checker_jobs_total', '分派給 checker worker 的檢查工作', ['result'])
+
+
+class CheckQueue:
+    def __init__(self, path: str):
+        self.path = path
+        self.init_db()
+
+    def get_connection(self):
+        # isolation_level=None: 交易由 BEGIN IMMEDIATE 明確控制，避免多個 worker 同時 lease 同一筆
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def init_db(self):
+        conn = self.get_connection()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS check_sweeps (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                round_id INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS check_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sweep_id INTEGER NOT NULL,
+                round_id INTEGER NOT NULL,
+                team_id INTEGER NOT NULL,
+                host TEXT NOT NULL,
+                port INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                leased_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                is_up BOOLEAN,
+                response_time REAL,
+                error_message TEXT,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_check_jobs_status ON check_jobs (status, id);
+            CREATE INDEX IF NOT EXISTS idx_check_jobs_sweep ON check_jobs (sweep_id);
+        ''')
+        conn.close()
+
+    def enqueue_sweep(self, teams: List[Dict], round_id: int) -> int:
+        """新增一輪檢查，每隊一筆 job，返回 sweep id"""
+        conn = self.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            sweep_id = conn.execute(
+                'INSERT INTO check_sweeps (round_id, created_at) VALUES (?, ?)', (round_id, time.time())
+            ).lastrowid
+            conn.executemany(
+                'INSERT INTO check_jobs (sweep_id, round_id, team_id, host, port) VALUES (?, ?, ?, ?, ?)',
+                [(sweep_id, round_id, team['id'], team['host'], team['port']) for team in teams]
+            )
+            conn.execute('COMMIT')
+            return sweep_id
+        finally:
+            conn.close()
+
+    def lease(self, worker: str, limit: int = 10, lease_seconds: float = 30) -> List[Dict]:
+        """
+        取出最多 limit 筆待檢查的 job (包含 lease 已過期的 job)
+        lease 期間內沒有回報的 job 會被其他 worker 重新取走
+        """
+        now = time.time()
+        conn = self.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute('''
+                SELECT id, sweep_id, round_id, team_id, host, port FROM check_jobs
+                WHERE status = 'pending' OR (status = 'leased' AND leased_until < ?)
+                ORDER BY id LIMIT ?
+            ''', (now, limit)).fetchall()
+            conn.executemany('''
+                UPDATE check_jobs SET status = 'leased', worker = ?, leased_until = ?, attempts = attempts + 1
+                WHERE id = ?
+            ''', [(worker, now + lease_seconds, row['id']) for row in rows])
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+    def report(self, worker: str, results: List[Dict]) -> int:
+        """
+        批次回報檢查結果 (每筆包含 job_id / is_up / response_time / error_message)
+        已完成或已取消的 job 會被忽略，返回實際接受的筆數
+        """
+        if not results:
+            return 0
+        now = time.time()
+        conn = self.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            accepted = 0
+            for result in results:
+                accepted += conn.execute('''
+                    UPDATE check_jobs
+                    SET status = 'done', worker = ?, is_up = ?, response_time = ?, error_message = ?, finished_at = ?
+                    WHERE id = ? AND status IN ('pending', 'leased')
+                ''', (worker, bool(result['is_up']), result.get('response_time'), result.get('error_message'),
+                      now, result['job_id'])).rowcount
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return accepted
+
+    def sweep_results(self, sweep_id: int) -> Dict:
+        """返回 {'pending': 未完成數, 'results': [已完成的 job]}"""
+        conn = self.get_connection()
+        try:
+            rows = conn.execute('''
+                SELECT team_id, round_id, status, is_up, response_time, error_message
+                FROM check_jobs WHERE sweep_id = ?
+            ''', (sweep_id,)).fetchall()
+        finally:
+            conn.close()
+        done = [dict(row) for row in rows if row['status'] == 'done']
+        return {'pending': len(rows) - len(done), 'results': done}
+
+    def cancel_sweep(self, sweep_id: int) -> int:
+        """取消尚未完成的 job (逾時的一輪)，返回取消的筆數"""
+        conn = self.get_connection()
+        try:
+            return conn.execute('''
+                UPDATE check_jobs SET status = 'cancelled'
+                WHERE sweep_id = ? AND status IN ('pending', 'leased')
+            ''', (sweep_id,)).rowcount
+        finally:
+            conn.close()
+
+    def purge(self, keep_seconds: float = 3600) -> int:
+        """刪除超過 keep_seconds 的舊 job"""
+        cutoff = time.time() - keep_seconds
+        conn = self.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''
+                DELETE FROM check_jobs WHERE sweep_id IN (SELECT id FROM check_sweeps WHERE created_at < ?)
+            ''', (cutoff,))
+            deleted = conn.execute('DELETE FROM check_sweeps WHERE created_at < ?', (cutoff,)).rowcount
+            conn.execute('COMMIT')
+            return deleted
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        conn = self.get_connection()
+        try:
+            rows = conn.execute('SELECT status, COUNT(*) AS count FROM check_jobs GROUP BY status').fetchall()
+        finally:
+            conn.close()
+        return {row['status']: row['count'] for row in rows}
+
+
+class RemoteCheckQueue:
+    """透過主伺服器的 /api/checker/* 存取佇列 (供其他機器上的 worker 使用)"""
+
+    def __init__(self, server: str, token: str, timeout: float = 10):
+        self.server = server.rstrip('/')
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Bearer {token}'
+        self.timeout = timeout
+
+    def lease(self, worker: str, limit: int = 10, lease_seconds: float = 30) -> List[Dict]:
+        response = self.session.post(f'{self.server}/api/checker/lease', json={
+            'worker': worker, 'limit': limit, 'lease_seconds': lease_seconds
+        }, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['jobs']
+
+    def report(self, worker: str, results: List[Dict]) -> int:
+        response = self.session.post(f'{self.server}/api/checker/report', json={
+            'worker': worker, 'results': results
+        }, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['accepted']
+
+
+class QueuedChecker:
+    """
+    與 ServiceChecker.check_all_services 相同介面，但檢查交給 checker worker：
+    把一輪檢查放進佇列，等待 worker 回報 (最多 sweep_timeout 秒) 後批次寫入 service_status
+    逾時仍沒有結果的隊伍不記錄 (不因 checker 不足而判定隊伍離線)
+    舊 job 每 Round 清除一次 (不在每次檢查後清除)
+    """
+
+    def __init__(self, db: Storage, queue: CheckQueue, timeout: int = 5, sweep_timeout: float = 30,
+                 poll_interval: float = 0.2, http=None, uptime: UptimeTracker = None):
+        self.db = db
+        self.uptime = uptime
+        self.queue = queue
+        self.timeout = timeout
+        self.sweep_timeout = sweep_timeout
+        self.poll_interval = poll_interval
+        # Patch 階段的預熱請求仍由主伺服器發送
+        self.http = http or requests
+        self._purged_round = None
+
+    def check_all_services(self, teams: List[Dict], round_id: int) -> Dict[int, bool]:
+        sweep_start = time.perf_counter()
+        sweep_id = self.queue.enqueue_sweep(teams, round_id)
+
+        deadline = time.time() + self.sweep_timeout
+        while True:
+            sweep = self.queue.sweep_results(sweep_id)
+            if sweep['pending'] == 0 or time.time() >= deadline:
+                break
+            time.sleep(self.poll_interval)
+
+        if sweep['pending']:
+            cancelled = self.queue.cancel_sweep(sweep_id)
+            CHECK_JOBS.inc(cancelled, result='timeout')
+            logger.warning(f"Check sweep {sweep_id}: {cancelled} teams without worker result after {self.sweep_timeout}s")
+
+        results = {}
+        for row in sweep['results']:
+            results[row['team_id']] = bool(row['is_up'])
+            TEAM_UP.set(1 if row['is_up'] else 0, team=row['team_id'])
+            CHECK_JOBS.inc(result='up' if row['is_up'] else 'down')
+            if self.uptime is not None:
+                self.uptime.record(row['team_id'], row['round_id'], bool(row['is_up']), row['response_time'])
+        self.db.record_service_statuses(sweep['results'])
+        if self.uptime is not None:
+            self.uptime.flush()
+
+        SWEEP_SECONDS.observe(time.perf_counter() - sweep_start)
+        if round_id != self._purged_round:
+            self._purged_round = round_id
+            self.queue.purge()
+        return results
@@ -1,63 +1,157 @@
+import codecs
 import requests
 import time
-from typing import Dict, List, Tuple
-from models import Database
+from typing import Dict, Iterable, List, Tuple
+from storage import Storage
+from uptime import UptimeTracker
+from metrics import Gauge, Histogram
 import logging
 
 logger = logging.getLogger(__name__)
 
+PROBE_SECONDS = Histogram('ad_checker_probe_duration_seconds', '單一端點功能檢查耗時', ['team', 'endpoint', 'result'])
+SWEEP_SECONDS = Histogram('ad_checker_sweep_duration_seconds', '檢查所有隊伍一輪的耗時')
+TEAM_UP = Gauge('ad_checker_team_up', '隊伍服務最近一次檢查是否在線', ['team'])
+
+# 串流讀取回應時每次讀取的大小
+STREAM_CHUNK_SIZE = 8192
+
+# /monitor 的 dig 輸出通常包含這些關鍵字
+DIG_KEYWORDS = ('answer', 'query', 'status', 'opcode', 'google.com')
+
+
+class MarkerScan:
+    """在逐塊讀入的回應內容中尋找關鍵字 (不分大小寫)，保留跨塊邊界所需的尾端"""
+
+    def __init__(self, markers: Iterable[str]):
+        self.markers = tuple(markers)
+        self.found = set()
+        self.chars = 0
+        self._overlap = max(len(marker) for marker in self.markers) - 1
+        self._tail = ''
+
+    def feed(self, text: str):
+        self.chars += len(text)
+        window = self._tail + text.lower()
+        for marker in self.markers:
+            if marker not in self.found and marker in window:
+                self.found.add(marker)
+        self._tail = window[-self._overlap:] if self._overlap else ''
+
+
 class ServiceChecker:
-    def __init__(self, db: Database, timeout: int = 5):
+    def __init__(self, db: Storage, timeout: int = 5, http=None, uptime: UptimeTracker = None,
+                 max_body_bytes: int = 0):
+        """
+        http: 發送請求的物件 (需提供 get / post)，預設為 requests 模組；
+              模擬時換成不經過網路的替身 (bench.fake_fleet.FakeFleetSession)
+        uptime: 每得到一個檢查結果就累計到此 UptimeTracker
+        max_body_bytes: 大於 0 時以串流讀取回應，最多讀取此大小，找到足夠的關鍵字即停止；
+                        0 為讀取完整回應
+        """
         self.db = db
         self.timeout = timeout
+        self.http = http or requests
+        self.uptime = uptime
+        self.max_body_bytes = max_body_bytes
+
+    def request(self, method: str, url: str, **kwargs):
+        """發送請求 (串流模式時不預先下載內容)"""
+        if self.max_body_bytes:
+            kwargs['stream'] = True
+        return getattr(self.http, method)(url, timeout=self.timeout, **kwargs)
+
+    @staticmethod
+    def iter_body(response, chunk_size: int):
+        """
+        逐塊讀取回應內容；每塊有資料就返回 (urllib3 的 read1)，不會為了湊滿 chunk_size 而等待，
+        讓呼叫端能在每次收到資料後檢查截止時間
+        """
+        raw = getattr(response, 'raw', None)
+        if not hasattr(raw, 'read1'):
+            yield from response.iter_content(chunk_size=chunk_size)
+            return
+        while True:
+            chunk = raw.read1(chunk_size, decode_content=True)
+            if not chunk:
+                return
+            yield chunk
+
+    def scan_response(self, response, markers: Iterable[str], need: int = 1, min_chars: int = 0,
+                      deadline: float = None) -> MarkerScan:
+        """
+        在回應內容中尋找關鍵字
+        串流模式：找到 need 個關鍵字且已讀取 min_chars 個字元後即停止，最多讀取 max_body_bytes；
+        超過 deadline (time.monotonic()) 仍未讀完時拋出 Timeout (每次讀取各自的 timeout 擋不住慢速滴送)
+        返回的 MarkerScan 中 found 為找到的關鍵字，chars 為已讀取的字元數
+        """
+        scan = MarkerScan(markers)
+        if not self.max_body_bytes:
+            scan.feed(response.text)
+            return scan
+        try:
+            decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        remaining = self.max_body_bytes
+        for chunk in self.iter_body(response, min(STREAM_CHUNK_SIZE, remaining)):
+            if deadline is not None and time.monotonic() > deadline:
+                raise requests.exceptions.Timeout(f'Response body not read within {self.timeout}s')
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+            scan.feed(decoder.decode(chunk))
+            if (len(scan.found) >= need and scan.chars >= min_chars) or remaining <= 0:
+                break
+        else:
+            scan.feed(decoder.decode(b'', final=True))
+        return scan
 
     def check_endpoint_functionality(self, url: str, endpoint: str) -> Tuple[bool, str]:
         """
         檢查單一端點的功能性 - 測試實際功能是否可用
         返回: (是否正常, 錯誤訊息)
         """
+        response = None
+        # 整個端點檢查 (連線、回應標頭與串流讀取內容) 的截止時間
+        deadline = time.monotonic() + self.timeout
         try:
             # 根據不同端點測試不同功能
             if endpoint == '/files':
                 # 測試檔案列表功能 - 檢查是否返回檔案列表頁面
-                response = requests.get(f"{url}/files", timeout=self.timeout)
+                response = self.request('get', f"{url}/files")
                 if response.status_code != 200:
                     return False, f"HTTP {response.status_code}"
                 # 檢查是否有檔案列表相關內容
-                content = response.text.lower()
-                if 'file' not in content and 'download' not in content:
+                if not self.scan_response(response, ('file', 'download'), deadline=deadline).found:
                     return False, "No file listing found"
                 return True, None
                 
             elif endpoint == '/logs':
                 # 測試日誌搜尋功能 - 實際執行 grep 搜尋並檢查輸出
-                response = requests.post(
+                response = self.request(
+                    'post',
                     f"{url}/logs",
-                    data={'keyword': 'log'},
-                    timeout=self.timeout
+                    data={'keyword': 'log'}
                 )
                 if response.status_code != 200:
                     return False, f"HTTP {response.status_code}"
                 # 檢查 grep 搜尋是否有實際輸出（應該會找到 log 這個關鍵字）
-                content = response.text.lower()
-                if 'log' not in content or len(response.text) < 50:
+                scan = self.scan_response(response, ('log',), min_chars=50, deadline=deadline)
+                if not scan.found or scan.chars < 50:
                     return False, "Grep search not working properly"
                 return True, None
                 
             elif endpoint == '/monitor':
                 # 測試監控功能 - 實際執行 dig 指令並檢查是否返回 DNS 查詢結果
-                response = requests.post(
+                response = self.request(
+                    'post',
                     f"{url}/monitor",
-                    data={'host': 'google.com'},
-                    timeout=self.timeout
+                    data={'host': 'google.com'}
                 )
                 if response.status_code != 200:
                     return False, f"HTTP {response.status_code}"
                 # 檢查 dig 指令是否有實際輸出（dig 的典型輸出特徵）
-                content = response.text.lower()
-                # dig 的輸出通常包含這些關鍵字
-                dig_keywords = ['answer', 'query', 'status', 'opcode', 'google.com']
-                found_keywords = sum(1 for keyword in dig_keywords if keyword in content)
+                found_keywords = len(self.scan_response(response, DIG_KEYWORDS, need=2, deadline=deadline).found)
                 
                 if found_keywords < 2:  # 至少要有2個關鍵字才算正常
                     return False, f"Dig command not returning expected output (found {found_keywords}/5 keywords)"
@@ -71,6 +165,10 @@ class ServiceChecker:
             return False, "Connection refused"
         except Exception as e:
             return False, str(e)
+        finally:
+            # 串流模式：釋放連線，未讀取的內容直接捨棄
+            if response is not None and self.max_body_bytes:
+                response.close()
 
     def check_service(self, team_id: int, host: str, port: int, round_id: int = None) -> Tuple[bool, float, str]:
         """
@@ -93,7 +191,12 @@ class ServiceChecker:
         try:
             # 測試每個端點的實際功能
             for endpoint in endpoints:
+                probe_start = time.perf_counter()
                 is_ok, error_msg = self.check_endpoint_functionality(base_url, endpoint)
+                PROBE_SECONDS.observe(
+                    time.perf_counter() - probe_start,
+                    team=team_id, endpoint=endpoint, result='ok' if is_ok else 'fail'
+                )
                 
                 if is_ok:
                     successful_checks += 1
@@ -128,6 +231,8 @@ class ServiceChecker:
         返回: {team_id: is_up}
         """
         results = {}
+        pending_writes = []
+        sweep_start = time.perf_counter()
 
         for team in teams:
             team_id = team['id']
@@ -136,20 +241,30 @@ class ServiceChecker:
 
             is_up, response_time, error_msg = self.check_service(team_id, host, port, round_id)
 
-            # 記錄到資料庫
-            self.db.record_service_status(
+            # 記錄到資料庫 (不等待 commit，繼續檢查下一隊)
+            pending_writes.append(self.db.record_service_status(
                 team_id=team_id,
                 round_id=round_id,
                 is_up=is_up,
                 response_time=response_time,
-                error_message=error_msg
-            )
+                error_message=error_msg,
+                wait=False
+            ))
+            if self.uptime is not None:
+                self.uptime.record(team_id, round_id, is_up, response_time)
 
             results[team_id] = is_up
+            TEAM_UP.set(1 if is_up else 0, team=team_id)
 
             status = "UP" if is_up else "DOWN"
             logger.info(f"Team {team_id} ({host}:{port}): {status} - {response_time:.2f}s")
             if error_msg:
                 logger.warning(f"Team {team_id} status: {error_msg}")
 
+        if self.uptime is not None:
+            pending_writes.append(self.uptime.flush(wait=False))
+        for future in pending_writes:
+            if future is not None:
+                future.result()
+        SWEEP_SECONDS.observe(time.perf_counter() - sweep_start)
         return results
@@ -0,0 +1,97 @@
+"""
+獨立的服務檢查 worker
+從檢查佇列取出 job，以 ServiceChecker 平行檢查後批次回報結果。
+可以在多個程序或多台機器上同時執行 (config checker.mode 需設為 queue)
+
+同一台機器 (直接開啟佇列檔案):
+    python checker_worker.py --queue /app/data/checks.db --concurrency 16
+其他機器 (透過主伺服器 API，需要 Checker Token):
+    python checker_worker.py --server http://172.30.0.10:5000 --token <checker token>
+"""
+import argparse
+import logging
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from check_queue import CheckQueue, RemoteCheckQueue
+from checker import ServiceChecker
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('checker_worker')
+
+
+class CheckerWorker:
+    def __init__(self, queue, name: str, concurrency: int = 8, batch_size: int = 20,
+                 lease_seconds: float = 30, timeout: int = 5, idle_interval: float = 0.5,
+                 max_body_bytes: int = 65536):
+        self.queue = queue
+        self.name = name
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.idle_interval = idle_interval
+        # check_service 不會寫入資料庫，結果由主伺服器彙整
+        self.checker = ServiceChecker(db=None, timeout=timeout, max_body_bytes=max_body_bytes)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='check')
+
+    def check(self, job: Dict) -> Dict:
+        is_up, response_time, error_msg = self.checker.check_service(job['team_id'], job['host'], job['port'],
+                                                                     job['round_id'])
+        return {'job_id': job['id'], 'is_up': is_up, 'response_time': response_time, 'error_message': error_msg}
+
+    def run_once(self) -> int:
+        """取一批 job 檢查並回報，返回處理的筆數"""
+        jobs = self.queue.lease(self.name, self.batch_size, self.lease_seconds)
+        if not jobs:
+            return 0
+        results = list(self.executor.map(self.check, jobs))
+        accepted = self.queue.report(self.name, results)
+        up = sum(1 for result in results if result['is_up'])
+        logger.info(f"Checked {len(jobs)} teams ({up} up), {accepted} results accepted")
+        return len(jobs)
+
+    def run(self):
+        logger.info(f"Checker worker {self.name} started")
+        while True:
+            try:
+                if not self.run_once():
+                    time.sleep(self.idle_interval)
+            except Exception as e:
+                logger.error(f"Worker error: {e}")
+                time.sleep(5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Service checker worker')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--queue', help='path of the SQLite check queue')
+    source.add_argument('--server', help='main server URL (uses /api/checker/*)')
+    parser.add_argument('--token', default=os.environ.get('CHECKER_TOKEN'), help='checker token for --server')
+    parser.add_argument('--name', default=f'{socket.gethostname()}-{os.getpid()}')
+    parser.add_argument('--concurrency', type=int, default=8, help='teams checked in parallel')
+    parser.add_argument('--batch', type=int, default=20, help='jobs leased and reported per batch')
+    parser.add_argument('--lease-seconds', type=float, default=30)
+    parser.add_argument('--timeout', type=int, default=5, help='per-request timeout (seconds)')
+    parser.add_argument('--max-body-bytes', type=int, default=65536,
+                        help='stream at most this many bytes of each response (0 reads the whole body)')
+    args = parser.parse_args()
+
+    if args.server:
+        if not args.token:
+            parser.error('--server requires --token or CHECKER_TOKEN')
+        queue = RemoteCheckQueue(args.server, args.token)
+    else:
+        queue = CheckQueue(args.queue)
+
+    logging.getLogger('checker').setLevel(logging.WARNING)
+    CheckerWorker(queue, args.name, args.concurrency, args.batch, args.lease_seconds, args.timeout,
+                  max_body_bytes=args.max_body_bytes).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+遊戲循環使用的時鐘
+正式環境使用 SystemClock；模擬 (bench.simulate) 使用 VirtualClock，
+sleep 直接推進虛擬時間，數十個 Round 的比賽可以在數秒內跑完
+"""
+import threading
+import time
+from datetime import datetime, tzinfo
+from zoneinfo import ZoneInfo
+
+TAIPEI = ZoneInfo('Asia/Taipei')
+
+
+class SystemClock:
+    def time(self) -> float:
+        return time.time()
+
+    def now(self, tz: tzinfo = TAIPEI) -> datetime:
+        return datetime.now(tz=tz)
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+
+class VirtualClock:
+    def __init__(self, start: float = 1735693200.0):
+        """start: 虛擬時間起點 (epoch 秒)，預設 2025-01-01 09:00 (台北)"""
+        self._start = start
+        self._now = start
+        self._lock = threading.Lock()
+
+    def time(self) -> float:
+        return self._now
+
+    def now(self, tz: tzinfo = TAIPEI) -> datetime:
+        return datetime.fromtimestamp(self._now, tz=tz)
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+    def advance(self, seconds: float):
+        if seconds > 0:
+            with self._lock:
+                self._now += seconds
+
+    @property
+    def elapsed(self) -> float:
+        """自起點以來經過的虛擬秒數"""
+        return self._now - self._start
@@ -0,0 +1,79 @@
+"""
+HTTP 回應壓縮
+依 Accept-Encoding 協商 br / gzip，brotli 套件未安裝時只提供 gzip
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:  # brotli 為選用套件
+    brotli = None
+
+# 依偏好順序排列
+SUPPORTED_ENCODINGS = ['br', 'gzip'] if brotli else ['gzip']
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """以指定編碼壓縮資料"""
+    if encoding == 'br':
+        return brotli.compress(data)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    return data
+
+
+def negotiate_encoding(accept_encoding: str, available=None) -> str:
+    """
+    根據 Accept-Encoding 選擇最佳的壓縮編碼
+    返回: 'br' | 'gzip' | 'identity'
+    """
+    if available is None:
+        available = SUPPORTED_ENCODINGS
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        if not part.strip():
+            continue
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    for encoding in SUPPORTED_ENCODINGS:
+        if encoding in available and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+def init_json_compression(app, min_size: int = 1024):
+    """對超過 min_size 的 JSON 回應自動壓縮 (已壓縮或串流的回應不處理)"""
+    from flask import request
+
+    @app.after_request
+    def compress_json_response(response):
+        if (response.mimetype != 'application/json'
+                or response.status_code != 200
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding == 'identity':
+            return response
+
+        response.set_data(compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        if response.get_etag()[0]:
+            # 不同編碼的表示法需要不同的強 ETag
+            etag, _ = response.get_etag()
+            response.set_etag(f'{etag}-{encoding}')
+        return response
@@ -0,0 +1,127 @@
+"""
+隊伍容器操作
+遊戲循環透過 container backend 重建容器與套用 Patch，而不直接呼叫 docker CLI；
+模擬時 (bench.simulate) 換成不需要 Docker 的替身
+
+blue/green 切換 (containers.swap: blue_green)：每隊有主要與備用兩個 slot，
+新一代容器在目前沒有使用的 slot 啟動，健康檢查通過後才成為 active，再移除舊容器
+"""
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+from team_registry import TeamRegistry
+
+
+class DockerBackend:
+    def __init__(self, registry: TeamRegistry):
+        """容器名稱、IP、port 與網路皆由 registry 分配"""
+        self.registry = registry
+        self._active: Dict[int, Dict] = {}  # team_id -> 目前提供服務的 slot (預設為主要 slot)
+
+    def active_slot(self, team_id: int) -> Optional[Dict]:
+        return self._active.get(team_id) or self.registry.slot(team_id)
+
+    def container_name(self, team_id: int, slot: Dict = None) -> str:
+        slot = slot or self.active_slot(team_id)
+        return slot['container'] if slot else f'team{team_id}'
+
+    def sync_active(self, teams: List[Dict]):
+        """依資料庫中註冊的 host 判斷每隊目前使用的 slot (伺服器重啟後)"""
+        for team in teams:
+            spare = self.registry.spare_slot(team['id'])
+            if spare and team['host'] == spare['host']:
+                self._active[team['id']] = spare
+            else:
+                self._active.pop(team['id'], None)
+
+    def _run(self, cmd: List[str], timeout: int) -> Tuple[bool, str]:
+        """執行 docker 指令，返回: (是否成功, 錯誤訊息)"""
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return False, 'Timeout'
+        except Exception as e:
+            return False, str(e)
+        if result.returncode != 0:
+            return False, result.stderr.strip()
+        return True, None
+
+    def remove_containers(self, team_ids: List[int]) -> Tuple[bool, str]:
+        names = [self.container_name(team_id) for team_id in team_ids]
+        return self._run(['docker', 'rm', '-f'] + names, timeout=30)
+
+    def remove_slot(self, slot: Dict) -> Tuple[bool, str]:
+        """移除某個 slot 的容器"""
+        return self._run(['docker', 'rm', '-f', slot['container']], timeout=30)
+
+    def ensure_network(self) -> Tuple[bool, str]:
+        """網路不存在時建立"""
+        network = self.registry.network_name
+        exists, _ = self._run(['docker', 'network', 'inspect', network], timeout=10)
+        if exists:
+            return True, None
+        return self._run(['docker', 'network', 'create', f'--subnet={self.registry.subnet}', network], timeout=10)
+
+    def run_team_container(self, team_id: int, slot: Dict = None) -> Tuple[bool, str]:
+        """從映像重新創建隊伍容器 (slot 預設為目前使用的 slot)"""
+        slot = slot or self.active_slot(team_id)
+        if slot is None:
+            return False, f'Team {team_id} is not in the registry'
+        # TEAM_ID 與 SECRET_KEY 使用隊伍名稱 (team{N})，備用 slot 的容器名稱不同但身分相同
+        team_name = slot['team_name']
+        service_port = self.registry.network['service_port']
+        cmd = [
+            'docker', 'run', '-d',
+            '--name', slot['container'],
+            '--network', self.registry.network_name,
+            '--ip', slot['ip'],
+            '-p', f"{slot['host_port']}:{service_port}",
+            '-e', f'TEAM_ID={team_name}',
+            '-e', f'MAIN_SERVER={self.registry.main_server}',
+            '-e', f'PORT={service_port}',
+            '-e', f'SECRET_KEY={team_name}-secret-key',
+            '-e', 'APACHE_LOG_DIR=/var/log/apache2',
+        ]
+        for volume, mount in slot['volumes'].items():
+            cmd += ['-v', f'{volume}:{mount}']
+        return self._run(cmd + [slot['image']], timeout=30)
+
+    def copy_into(self, team_id: int, source: str, dest: str, slot: Dict = None) -> Tuple[bool, str]:
+        """將檔案複製到正在運行的容器"""
+        return self._run(['docker', 'cp', source, f'{self.container_name(team_id, slot)}:{dest}'], timeout=10)
+
+    def reload_app(self, team_id: int, slot: Dict = None) -> Tuple[bool, str]:
+        """重啟容器內的 Apache 以載入新代碼"""
+        return self._run([
+            'docker', 'exec', self.container_name(team_id, slot),
+            'bash', '-c', 'pkill -HUP apache2 || apachectl graceful'
+        ], timeout=10)
+
+    def health_url(self, team_id: int, slot: Dict = None) -> str:
+        slot = slot or self.active_slot(team_id)
+        return f"http://{slot['ip']}:{self.registry.network['service_port']}/health"
+
+    # ---- blue/green ----
+
+    def start_next(self, team_id: int) -> Tuple[Optional[Dict], str]:
+        """
+        在目前沒有使用的 slot 從映像啟動新一代容器 (舊容器繼續提供服務)
+        返回: (新容器的 slot, 錯誤訊息)
+        """
+        active = self.active_slot(team_id)
+        spare = self.registry.spare_slot(team_id)
+        if active is None or spare is None:
+            return None, f'Team {team_id} has no spare slot'
+        slot = self.registry.slot(team_id) if active['container'] == spare['container'] else spare
+        # 清除上次切換失敗留下的容器
+        self.remove_slot(slot)
+        started, error = self.run_team_container(team_id, slot)
+        return (slot, None) if started else (None, error)
+
+    def activate(self, team_id: int, slot: Dict) -> Tuple[bool, str]:
+        """新容器成為 active 後移除舊容器 (呼叫前需已把註冊的 host/port 切換到 slot)"""
+        previous = self.active_slot(team_id)
+        self._active[team_id] = slot
+        if previous is None or previous['container'] == slot['container']:
+            return True, None
+        return self.remove_slot(previous)
@@ -0,0 +1,180 @@
+"""
+SQLite 查詢量測
+以自訂的 Connection / Cursor 類別記錄每條 SQL 的執行時間、回傳列數與等待寫鎖的時間，
+依 (Database 方法, SQL) 彙總，並保留最近的慢查詢紀錄
+寫鎖衝突由 SQLite 本身的 busy handler (connect 的 timeout) 等待；BEGIN IMMEDIATE / EXCLUSIVE
+除了取得寫鎖不做其他事，其執行時間即記為等待寫鎖的時間 (writer 執行緒的每批寫入都以此開始)。
+其他 SQL 的等待時間包含在各自的執行時間內
+"""
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from metrics import Counter, current_method
+
+LOCK_WAIT_SECONDS = Counter('ad_db_lock_wait_seconds_total', '等待 SQLite 寫鎖的累計時間', ['method'])
+
+_WHITESPACE = re.compile(r'\s+')
+_LOCKING_BEGIN = re.compile(r'\s*BEGIN\s+(IMMEDIATE|EXCLUSIVE)\b', re.IGNORECASE)
+
+
+def normalize_sql(sql: str) -> str:
+    """合併空白，使相同的 SQL 彙總到同一筆統計"""
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class QueryProfiler:
+    def __init__(self, slow_threshold: float = 0.1, slow_log_size: int = 200):
+        """
+        slow_threshold: 超過此秒數的 SQL 記入慢查詢紀錄
+        slow_log_size: 慢查詢紀錄保留的筆數
+        """
+        self.slow_threshold = slow_threshold
+        self._stats: Dict[tuple, Dict] = {}
+        self._slow_log = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+
+    def record(self, sql: str, method: Optional[str], elapsed: float, rows: int = 0,
+               lock_wait: float = 0.0, executions: int = 1):
+        """累加一條 SQL 的量測結果 (fetch 階段以 executions=0 追加時間與列數)"""
+        key = (method or '-', sql)
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                stat = {'method': key[0], 'sql': sql, 'count': 0, 'total_time': 0.0,
+                        'max_time': 0.0, 'rows': 0, 'lock_wait': 0.0}
+                self._stats[key] = stat
+            stat['count'] += executions
+            stat['total_time'] += elapsed
+            stat['rows'] += rows
+            stat['lock_wait'] += lock_wait
+            if elapsed > stat['max_time']:
+                stat['max_time'] = elapsed
+        if lock_wait:
+            LOCK_WAIT_SECONDS.inc(lock_wait, method=key[0])
+
+    def record_slow(self, sql: str, method: Optional[str], elapsed: float, rows: int, lock_wait: float):
+        self._slow_log.append({
+            'at': datetime.now(tz=ZoneInfo('Asia/Taipei')).isoformat(),
+            'method': method or '-',
+            'sql': sql,
+            'duration_ms': round(elapsed * 1000, 3),
+            'rows': rows,
+            'lock_wait_ms': round(lock_wait * 1000, 3)
+        })
+
+    def top(self, n: int = 20, sort: str = 'total_time') -> List[Dict]:
+        """依 sort 欄位 (total_time / max_time / count / rows / lock_wait / avg_time) 取前 n 條 SQL"""
+        with self._lock:
+            stats = [dict(stat) for stat in self._stats.values()]
+        for stat in stats:
+            stat['avg_time'] = stat['total_time'] / stat['count'] if stat['count'] else 0.0
+        stats.sort(key=lambda stat: stat.get(sort, 0), reverse=True)
+        return stats[:n]
+
+    def by_method(self) -> List[Dict]:
+        """依 Database 方法彙總"""
+        methods: Dict[str, Dict] = {}
+        with self._lock:
+            for stat in self._stats.values():
+                entry = methods.setdefault(stat['method'], {
+                    'method': stat['method'], 'statements': 0, 'total_time': 0.0, 'rows': 0, 'lock_wait': 0.0
+                })
+                entry['statements'] += stat['count']
+                entry['total_time'] += stat['total_time']
+                entry['rows'] += stat['rows']
+                entry['lock_wait'] += stat['lock_wait']
+        return sorted(methods.values(), key=lambda entry: entry['total_time'], reverse=True)
+
+    def slow_queries(self, n: int = 50) -> List[Dict]:
+        """最近的 n 筆慢查詢 (新的在前)"""
+        return list(self._slow_log)[-n:][::-1]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._slow_log.clear()
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    def _run(self, run, sql: str):
+        """執行 SQL 並量測耗時 (只執行一次，不重試)"""
+        profiler = self.connection.profiler
+        method = current_method()
+        normalized = normalize_sql(sql)
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        rows = self.rowcount if self.rowcount > 0 else 0
+        lock_wait = elapsed if _LOCKING_BEGIN.match(sql) else 0.0
+
+        profiler.record(normalized, method, elapsed, rows, lock_wait)
+        self._profile_state = [normalized, method, elapsed, rows, lock_wait, elapsed >= profiler.slow_threshold]
+        if self._profile_state[5]:
+            profiler.record_slow(normalized, method, elapsed, rows, lock_wait)
+        return result
+
+    def _fetched(self, start: float, rows: int):
+        """fetch 階段的時間與列數追加到最近一次執行的 SQL"""
+        state = getattr(self, '_profile_state', None)
+        if state is None:
+            return
+        elapsed = time.perf_counter() - start
+        profiler = self.connection.profiler
+        profiler.record(state[0], state[1], elapsed, rows, executions=0)
+        state[2] += elapsed
+        state[3] += rows
+        if not state[5] and state[2] >= profiler.slow_threshold:
+            state[5] = True
+            profiler.record_slow(state[0], state[1], state[2], state[3], state[4])
+
+    def execute(self, sql, parameters=()):
+        return self._run(lambda: super(ProfiledCursor, self).execute(sql, parameters), sql)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(lambda: super(ProfiledCursor, self).executemany(sql, seq_of_parameters), sql)
+
+    def executescript(self, sql_script):
+        return self._run(lambda: super(ProfiledCursor, self).executescript(sql_script), sql_script)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, 1 if row is not None else 0)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """搭配 sqlite3.connect(factory=ProfiledConnection) 使用，建立後需設定 profiler"""
+    profiler: QueryProfiler = None
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        start = time.perf_counter()
+        super().commit()
+        self.profiler.record('COMMIT', current_method(), time.perf_counter() - start)
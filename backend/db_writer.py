@@ -0,0 +1,136 @@
+"""
+單一寫入執行緒 (group commit)
+所有寫入操作透過佇列交給唯一持有寫入連線的執行緒，呼叫端拿到 Future。
+writer 每次取出佇列中累積的操作 (最多 max_batch 筆，最多多等 max_delay 秒)，
+在同一個交易中依序執行後只 commit 一次；每個操作包在自己的 SAVEPOINT 內，
+單一操作失敗只回滾該操作，不影響同批的其他操作。
+寫入只剩一個連線，程序內不再互相搶寫鎖 (database is locked)。
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Tuple
+
+from metrics import Gauge, Histogram, method_scope
+
+logger = logging.getLogger(__name__)
+
+WRITER_BATCH_SIZE = Histogram('ad_db_writer_batch_size', '每次 group commit 包含的寫入操作數',
+                              buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024))
+WRITER_COMMIT_SECONDS = Histogram('ad_db_writer_commit_duration_seconds', '每批寫入從 BEGIN 到 COMMIT 的時間')
+WRITER_QUEUE_WAIT_SECONDS = Histogram('ad_db_writer_queue_wait_seconds', '寫入操作在佇列中等待的時間')
+WRITER_QUEUE_DEPTH = Gauge('ad_db_writer_queue_depth', '等待寫入的操作數')
+
+_STOP = object()
+
+
+class DatabaseWriter:
+    def __init__(self, connect: Callable[[], sqlite3.Connection], max_batch: int = 256, max_delay: float = 0.0):
+        """
+        connect: 建立寫入連線的函式 (只在 writer 執行緒中呼叫一次)
+        max_batch: 每次 commit 最多包含的操作數
+        max_delay: 佇列清空後最多再等多少秒收集更多操作；0 表示只合併已在佇列中的操作
+        """
+        self.connect = connect
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        # submit 與 close 互斥：_STOP 之後不會再有操作排入佇列
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, op: Callable, *args) -> Future:
+        """
+        排入一個寫入操作，op(cursor, *args) 會在 writer 執行緒中執行
+        返回的 Future 在所屬批次 commit 後才完成 (結果為 op 的返回值)
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Database writer is closed')
+            self._queue.put((op, args, future, time.perf_counter()))
+        WRITER_QUEUE_DEPTH.set(self._queue.qsize())
+        return future
+
+    def close(self, timeout: float = None):
+        """處理完已排入的操作後停止 writer"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        # isolation_level=None: 交易由 BEGIN IMMEDIATE / SAVEPOINT 明確控制
+        conn = self.connect()
+        conn.isolation_level = None
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.perf_counter() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            WRITER_QUEUE_DEPTH.set(self._queue.qsize())
+            self._commit_batch(conn, batch)
+        conn.close()
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: List[Tuple]):
+        start = time.perf_counter()
+        outcomes = []
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for op, args, future, queued_at in batch:
+                WRITER_QUEUE_WAIT_SECONDS.observe(start - queued_at)
+                cursor.execute('SAVEPOINT write_op')
+                try:
+                    # SQL 量測歸屬到原本的 Database 方法 (例如 _save_scores -> save_scores)
+                    with method_scope(op.__name__.lstrip('_')):
+                        result = op(cursor, *args)
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO write_op')
+                    cursor.execute('RELEASE write_op')
+                    outcomes.append((future, None, e))
+                else:
+                    cursor.execute('RELEASE write_op')
+                    outcomes.append((future, result, None))
+            cursor.execute('COMMIT')
+        except Exception as e:
+            # BEGIN / COMMIT 本身失敗：整批都沒有寫入
+            logger.error(f"Group commit of {len(batch)} writes failed: {e}")
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finally:
+            WRITER_BATCH_SIZE.observe(len(batch))
+            WRITER_COMMIT_SECONDS.observe(time.perf_counter() - start)
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
@@ -1,15 +1,21 @@
 import secrets
 import hashlib
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List
-from models import Database
+from storage import Storage
 from zoneinfo import ZoneInfo
 
 class FlagManager:
-    def __init__(self, db: Database, flag_format: str = "FLAG{{{team_id}_{round}_{secret}}}"):
+    def __init__(self, db: Storage, flag_format: str = "FLAG{{{team_id}_{round}_{secret}}}"):
         self.db = db
         self.flag_format = flag_format
         self.vulnerability_types = ['monitor', 'logs', 'download']  # 三種漏洞類型
+        # 版本化 Flag feed：Flags 每次變動（新 Round 開始 / Round 結束）版本號 +1
+        self.feed_version = 0
+        self.feed_epoch = secrets.token_hex(4)  # 伺服器重啟後舊的 ETag 一律失效
+        self._feed_round = None  # {'round_id', 'round_number', 'flags': {team_id: {vuln_type: flag}}}
+        self._feed_cond = threading.Condition()
     
     def generate_flag(self, team_id: int, round_number: int, vuln_type: str = '') -> str:
         """生成唯一的 Flag（Hash 格式）"""
@@ -24,42 +30,101 @@ class FlagManager:
         )
         return flag
     
+    def generate_round_flags(self, round_number: int, teams: List[Dict]) -> Dict[int, Dict[str, str]]:
+        """預先生成某 Round 所有隊伍的 Flag 值 {team_id: {vuln_type: flag}}（不寫入資料庫、不發布）"""
+        return {
+            team['id']: {vuln_type: self.generate_flag(team['id'], round_number, vuln_type)
+                         for vuln_type in self.vulnerability_types}
+            for team in teams
+        }
+    
     def create_flags_for_round(self, round_id: int, round_number: int, 
-                               teams: List[Dict], flag_lifetime: int = None):
-        """為所有隊伍生成本 Round 的 Flags（每個漏洞一個）"""
+                               teams: List[Dict], flag_lifetime: int = None,
+                               pregenerated: Dict[int, Dict[str, str]] = None):
+        """
+        為所有隊伍生成本 Round 的 Flags（每個漏洞一個）
+        pregenerated: generate_round_flags 預先生成的 Flag 值，缺少的隊伍才重新生成
+        """
         # 不再使用過期時間，flags 在整個遊戲期間都有效
         flags = {}
+        rows = []
+        pregenerated = pregenerated or {}
         
         for team in teams:
-            team_flags = {}
-            for vuln_type in self.vulnerability_types:
-                flag_value = self.generate_flag(team['id'], round_number, vuln_type)
-                self.db.add_flag(team['id'], round_id, flag_value, None, vuln_type)
-                team_flags[vuln_type] = flag_value
+            team_flags = pregenerated.get(team['id'])
+            if team_flags is None or set(team_flags) != set(self.vulnerability_types):
+                team_flags = self.generate_round_flags(round_number, [team])[team['id']]
+            for vuln_type, flag_value in team_flags.items():
+                rows.append({'team_id': team['id'], 'round_id': round_id, 'flag_value': flag_value,
+                             'vuln_type': vuln_type})
             flags[team['id']] = team_flags
         
+        # 整輪的 Flags 一次寫入
+        self.db.add_flags(rows)
+        
+        self.publish_feed(round_id, round_number, flags)
         return flags
     
+    def publish_feed(self, round_id: int, round_number: int, flags: Dict[int, Dict[str, str]]):
+        """發布新 Round 的 Flags 到 feed，並喚醒所有等待中的 long-poll"""
+        with self._feed_cond:
+            self._feed_round = {
+                'round_id': round_id,
+                'round_number': round_number,
+                'flags': flags
+            }
+            self.feed_version += 1
+            self._feed_cond.notify_all()
+    
+    def clear_feed(self):
+        """Round 結束（進入 patch 階段或遊戲停止）時清空 feed"""
+        with self._feed_cond:
+            if self._feed_round is None:
+                return
+            self._feed_round = None
+            self.feed_version += 1
+            self._feed_cond.notify_all()
+    
+    def feed_etag(self) -> str:
+        """當前 feed 版本的 ETag"""
+        return f'"flags-{self.feed_epoch}-{self.feed_version}"'
+    
+    def get_feed(self, team_id: int, known_etag: str = None, wait: float = 0) -> Dict:
+        """
+        讀取某隊伍在 feed 中的當前 Flags
+        如果 known_etag 等於當前版本的 ETag，最多等待 wait 秒直到版本變動
+        
+        Returns:
+            {
+                'etag': str,
+                'version': int,
+                'round': int (沒有 active round 時為 0),
+                'flags': {vuln_type: flag} 或 None (該隊伍沒有 Flags)
+            }
+        """
+        with self._feed_cond:
+            if known_etag == self.feed_etag() and wait > 0:
+                self._feed_cond.wait_for(lambda: self.feed_etag() != known_etag, timeout=wait)
+            
+            feed_round = self._feed_round
+            if feed_round is None:
+                return {
+                    'etag': self.feed_etag(),
+                    'version': self.feed_version,
+                    'round': 0,
+                    'flags': {vuln_type: '' for vuln_type in self.vulnerability_types}
+                }
+            return {
+                'etag': self.feed_etag(),
+                'version': self.feed_version,
+                'round': feed_round['round_number'],
+                'flags': feed_round['flags'].get(team_id)
+            }
+    
     def get_team_flag(self, team_id: int, round_id: int, vuln_type: str = 'monitor') -> str:
         """獲取特定隊伍在特定 Round 的特定漏洞的 Flag"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT flag_value FROM flags WHERE team_id = ? AND round_id = ? AND vuln_type = ?',
-            (team_id, round_id, vuln_type)
-        )
-        result = cursor.fetchone()
-        conn.close()
-        return result['flag_value'] if result else None
+        return self.db.get_team_flags(team_id, round_id).get(vuln_type)
     
     def get_team_all_flags(self, team_id: int, round_id: int) -> Dict[str, str]:
         """獲取特定隊伍在特定 Round 的所有 Flag"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT vuln_type, flag_value FROM flags WHERE team_id = ? AND round_id = ?',
-            (team_id, round_id)
-        )
-        results = cursor.fetchall()
-        conn.close()
-        return {row['vuln_type']: row['flag_value'] for row in results} if results else {}
+        return self.db.get_team_flags(team_id, round_id)
@@ -0,0 +1,434 @@
+"""
+純記憶體的 Storage 實作
+資料放在 dict 與排序好的 list 中，沒有 SQL 也沒有磁碟 I/O，供模擬、benchmark 與 what-if 重播使用。
+查詢結果 (欄位名稱、型別、排序) 與 models.Database 相同；差異：
+  - 服務狀態只保留每隊每 Round 的最新一筆 (查詢也只會用到最新一筆)
+  - 排行榜的總分隨 save_scores 增量更新，get_scoreboard 不需重新加總
+"""
+import bisect
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from storage import Storage, build_timeline, completed, rank_scores
+
+TAIPEI = ZoneInfo('Asia/Taipei')
+
+
+def _now() -> str:
+    """與 SQLite 儲存 datetime 參數的格式相同"""
+    return str(datetime.now(tz=TAIPEI))
+
+
+def _current_timestamp() -> str:
+    """與 SQLite 的 CURRENT_TIMESTAMP 相同 (UTC，精確到秒)"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class MemoryDatabase(Storage):
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._teams: Dict[int, Dict] = {}
+        self._rounds: Dict[int, Dict] = {}
+        self._round_ids_by_number: Dict[int, List[int]] = {}
+        self._active_round_ids: List[int] = []  # 依 id 排序
+        self._flags: Dict[str, Dict] = {}
+        self._team_round_flags: Dict[Tuple[int, int], Dict[str, str]] = {}
+        self._submissions: List[Dict] = []
+        self._submitted: set = set()  # (submitter_team_id, flag_value)
+        self._steals: Dict[int, Dict[int, int]] = {}  # round_id -> {target_team_id: count}
+        self._attacks: Dict[int, Dict[int, int]] = {}  # round_id -> {submitter_team_id: count}
+        self._latest_status: Dict[int, Dict[int, Dict]] = {}  # round_id -> {team_id: row}
+        self._scores: Dict[Tuple[int, int], Dict] = {}  # (team_id, round_id) -> row，順序同 SQLite rowid
+        self._totals: Dict[int, List[float]] = {}  # team_id -> [sla, defense, attack, total]
+        self._ranking: List[Tuple[float, int]] = []  # (-total_score, team_id) 排序
+        self._uptime: Dict[int, Dict[int, Dict]] = {}  # round_id -> {team_id: counter}
+        self._snapshots: Dict[int, Dict] = {}  # round_id -> {'round_number', 'totals', 'ranks'}
+        self._game_state: Optional[Dict] = None
+        self._patches: Dict[int, Dict] = {}  # team_id -> 目前的 Patch 紀錄
+        self._ids = {'rounds': 0, 'flags': 0, 'flag_submissions': 0, 'service_status': 0, 'scores': 0}
+
+    def _next_id(self, table: str) -> int:
+        self._ids[table] += 1
+        return self._ids[table]
+
+    # ---- 隊伍 ----
+
+    def add_team(self, team_id: int, name: str, host: str, port: int, wait: bool = True):
+        """新增隊伍"""
+        with self._lock:
+            self._teams[team_id] = {'id': team_id, 'name': name, 'host': host, 'port': port,
+                                    'created_at': _current_timestamp()}
+            if team_id not in self._totals:
+                self._set_totals(team_id, self._sum_scores(team_id))
+        return completed(None, wait)
+
+    def get_teams(self) -> List[Dict]:
+        """獲取所有隊伍"""
+        with self._lock:
+            return [dict(self._teams[team_id]) for team_id in sorted(self._teams)]
+
+    # ---- Round ----
+
+    def create_round(self, round_number: int) -> int:
+        """創建新 Round"""
+        with self._lock:
+            round_id = self._next_id('rounds')
+            self._rounds[round_id] = {
+                'id': round_id, 'round_number': round_number, 'start_time': _now(), 'end_time': None,
+                'status': 'active', 'created_at': _current_timestamp()
+            }
+            self._round_ids_by_number.setdefault(round_number, []).append(round_id)
+            self._active_round_ids.append(round_id)
+            return round_id
+
+    def get_current_round(self) -> Optional[Dict]:
+        """獲取當前 Round"""
+        with self._lock:
+            if not self._active_round_ids:
+                return None
+            return dict(self._rounds[self._active_round_ids[-1]])
+
+    def get_round_by_number(self, round_number: int) -> Optional[Dict]:
+        """依 Round 編號查詢"""
+        with self._lock:
+            round_ids = self._round_ids_by_number.get(round_number)
+            return dict(self._rounds[round_ids[0]]) if round_ids else None
+
+    def get_last_round_number(self) -> int:
+        """已建立的最大 Round 編號"""
+        with self._lock:
+            return max(self._round_ids_by_number, default=0)
+
+    def close_round(self, round_id: int):
+        """結束 Round"""
+        with self._lock:
+            round_data = self._rounds.get(round_id)
+            if round_data is None:
+                return
+            round_data['status'] = 'closed'
+            round_data['end_time'] = _now()
+            if round_id in self._active_round_ids:
+                self._active_round_ids.remove(round_id)
+
+    # ---- Flag ----
+
+    def add_flag(self, team_id: int, round_id: int, flag_value: str, expires_at: datetime = None,
+                 vuln_type: str = 'monitor'):
+        """新增 Flag（expires_at 設為 None 表示永不過期）"""
+        return self.add_flags([{
+            'team_id': team_id, 'round_id': round_id, 'flag_value': flag_value,
+            'expires_at': expires_at, 'vuln_type': vuln_type
+        }])
+
+    def add_flags(self, flags: List[Dict]):
+        """批次新增 Flags（flag_value 重複時整批不寫入）"""
+        with self._lock:
+            values = [flag['flag_value'] for flag in flags]
+            if len(set(values)) != len(values) or any(value in self._flags for value in values):
+                raise ValueError('Duplicate flag value')
+            created_at = _current_timestamp()
+            for flag in flags:
+                expires_at = flag.get('expires_at')
+                row = {
+                    'id': self._next_id('flags'),
+                    'team_id': flag['team_id'],
+                    'round_id': flag['round_id'],
+                    'flag_value': flag['flag_value'],
+                    'vuln_type': flag.get('vuln_type', 'monitor'),
+                    'created_at': created_at,
+                    'expires_at': str(expires_at) if expires_at is not None else None,
+                }
+                self._flags[row['flag_value']] = row
+                self._team_round_flags.setdefault((row['team_id'], row['round_id']), {})[row['vuln_type']] = \
+                    row['flag_value']
+
+    def get_flag(self, flag_value: str) -> Optional[Dict]:
+        """根據 Flag 值查詢 Flag"""
+        with self._lock:
+            flag = self._flags.get(flag_value)
+            return dict(flag) if flag else None
+
+    def get_team_flags(self, team_id: int, round_id: int) -> Dict[str, str]:
+        """獲取特定隊伍在特定 Round 的所有 Flag"""
+        with self._lock:
+            return dict(self._team_round_flags.get((team_id, round_id), {}))
+
+    # ---- 提交紀錄 ----
+
+    def submit_flag(self, submitter_team_id: int, flag_value: str, round_id: int) -> Dict:
+        """提交 Flag"""
+        with self._lock:
+            flag = self._flags.get(flag_value)
+            if not flag:
+                return {'success': False, 'message': "Invalid flag", 'target_team_id': None}
+
+            target_team_id = flag['team_id']
+            # 不能提交自己的 flag
+            if target_team_id == submitter_team_id:
+                return {'success': False, 'message': "Cannot submit your own flag", 'target_team_id': target_team_id}
+
+            if (submitter_team_id, flag_value) in self._submitted:
+                return {'success': False, 'message': "This flag has already been submitted",
+                        'target_team_id': target_team_id}
+
+            self._submitted.add((submitter_team_id, flag_value))
+            self._submissions.append({
+                'id': self._next_id('flag_submissions'),
+                'submitter_team_id': submitter_team_id,
+                'target_team_id': target_team_id,
+                'round_id': round_id,
+                'flag_value': flag_value,
+                'is_valid': 1,
+                'submitted_at': _now(),
+            })
+            steals = self._steals.setdefault(round_id, {})
+            steals[target_team_id] = steals.get(target_team_id, 0) + 1
+            attacks = self._attacks.setdefault(round_id, {})
+            attacks[submitter_team_id] = attacks.get(submitter_team_id, 0) + 1
+            return {'success': True, 'message': "Flag accepted", 'target_team_id': target_team_id}
+
+    def get_recent_submissions(self, limit: int = 100) -> List[Dict]:
+        """最近的 Flag 提交紀錄（新到舊）"""
+        with self._lock:
+            recent = self._submissions[-limit:] if limit > 0 else []
+            history = []
+            for submission in reversed(recent):
+                attacker = self._teams.get(submission['submitter_team_id'])
+                victim = self._teams.get(submission['target_team_id'])
+                history.append({
+                    'timestamp': submission['submitted_at'],
+                    'flag': submission['flag_value'],
+                    'success': submission['is_valid'],
+                    'attacker_team': attacker['name'] if attacker else None,
+                    'victim_team': victim['name'] if victim else None,
+                })
+            return history
+
+    def get_flag_steals(self, round_id: int) -> Dict[int, int]:
+        """獲取每隊在本 Round 被竊取的次數"""
+        with self._lock:
+            return dict(self._steals.get(round_id, {}))
+
+    def get_attack_scores(self, round_id: int) -> Dict[int, int]:
+        """獲取每隊在本 Round 的攻擊分數"""
+        with self._lock:
+            return dict(self._attacks.get(round_id, {}))
+
+    # ---- 服務狀態 ----
+
+    def record_service_status(self, team_id: int, round_id: int, is_up: bool,
+                              response_time: float = None, error_message: str = None, wait: bool = True):
+        """記錄服務狀態"""
+        return self.record_service_statuses([{
+            'team_id': team_id, 'round_id': round_id, 'is_up': is_up,
+            'response_time': response_time, 'error_message': error_message
+        }], wait=wait)
+
+    def record_service_statuses(self, statuses: List[Dict], wait: bool = True):
+        """批次記錄服務狀態"""
+        with self._lock:
+            checked_at = _current_timestamp()
+            for status in statuses:
+                self._latest_status.setdefault(status['round_id'], {})[status['team_id']] = {
+                    'id': self._next_id('service_status'),
+                    'team_id': status['team_id'],
+                    'round_id': status['round_id'],
+                    'is_up': 1 if status['is_up'] else 0,
+                    'response_time': status.get('response_time'),
+                    'error_message': status.get('error_message'),
+                    'checked_at': checked_at,
+                }
+        return completed(None, wait)
+
+    def get_service_status(self, round_id: int) -> List[Dict]:
+        """獲取所有隊伍的最新服務狀態"""
+        with self._lock:
+            return [dict(row) for row in self._latest_status.get(round_id, {}).values()]
+
+    def save_uptime_counters(self, counters: List[Dict], wait: bool = True):
+        """寫入每隊每 Round 的檢查累計計數"""
+        with self._lock:
+            for counter in counters:
+                self._uptime.setdefault(counter['round_id'], {})[counter['team_id']] = dict(
+                    counter, latency_buckets=list(counter['latency_buckets']))
+        return completed(None, wait)
+
+    def get_uptime_counters(self, round_id: int) -> Dict[int, Dict]:
+        """某 Round 每隊的檢查累計計數"""
+        with self._lock:
+            return {team_id: dict(counter, latency_buckets=list(counter['latency_buckets']))
+                    for team_id, counter in self._uptime.get(round_id, {}).items()}
+
+    # ---- 分數 ----
+
+    def save_scores(self, team_id: int, round_id: int, sla_score: float,
+                    defense_score: float, attack_score: float, wait: bool = True):
+        """保存分數"""
+        with self._lock:
+            # 與 SQLite 的 REAL 欄位相同，一律存成 float
+            sla_score, defense_score, attack_score = float(sla_score), float(defense_score), float(attack_score)
+            key = (team_id, round_id)
+            replaced = self._scores.pop(key, None)
+            row = {
+                'id': self._next_id('scores'),
+                'team_id': team_id,
+                'round_id': round_id,
+                'sla_score': sla_score,
+                'defense_score': defense_score,
+                'attack_score': attack_score,
+                'total_score': sla_score + defense_score + attack_score,
+                'calculated_at': _now(),
+            }
+            self._scores[key] = row
+            if replaced is None and team_id in self._totals:
+                totals = self._totals[team_id]
+                self._set_totals(team_id, [totals[0] + sla_score, totals[1] + defense_score,
+                                           totals[2] + attack_score, totals[3] + row['total_score']])
+            else:
+                # 覆蓋既有分數時重新加總，避免浮點數加減造成誤差
+                self._set_totals(team_id, self._sum_scores(team_id))
+        return completed(None, wait)
+
+    def _sum_scores(self, team_id: int) -> List[float]:
+        totals = [0, 0, 0, 0]
+        for (score_team_id, _), row in self._scores.items():
+            if score_team_id == team_id:
+                totals = [totals[0] + row['sla_score'], totals[1] + row['defense_score'],
+                          totals[2] + row['attack_score'], totals[3] + row['total_score']]
+        return totals
+
+    def _set_totals(self, team_id: int, totals: List[float]):
+        """更新隊伍總分並維持 _ranking 的排序 (呼叫時需持有 _lock)"""
+        old = self._totals.get(team_id)
+        if old is not None:
+            index = bisect.bisect_left(self._ranking, (-old[3], team_id))
+            del self._ranking[index]
+        self._totals[team_id] = totals
+        bisect.insort(self._ranking, (-totals[3], team_id))
+
+    def get_scoreboard(self) -> List[Dict]:
+        """獲取總排行榜"""
+        with self._lock:
+            current = None
+            for round_id in self._active_round_ids:
+                round_data = self._rounds[round_id]
+                if current is None or round_data['round_number'] >= current['round_number']:
+                    current = round_data
+            statuses = self._latest_status.get(current['id'], {}) if current else {}
+
+            scoreboard = []
+            for _, team_id in self._ranking:
+                team = self._teams.get(team_id)
+                if team is None:
+                    continue
+                totals = self._totals[team_id]
+                status = statuses.get(team_id)
+                scoreboard.append({
+                    'id': team_id,
+                    'name': team['name'],
+                    'total_sla': totals[0],
+                    'total_defense': totals[1],
+                    'total_attack': totals[2],
+                    'total_score': totals[3],
+                    'is_up': status['is_up'] if status else 0,
+                })
+            return scoreboard
+
+    def get_round_scores(self, round_id: int) -> List[Dict]:
+        """獲取特定 Round 的分數"""
+        with self._lock:
+            scores = []
+            for team_id in sorted(self._teams):
+                row = self._scores.get((team_id, round_id))
+                if row is None:
+                    row = {key: None for key in ('id', 'team_id', 'round_id', 'sla_score', 'defense_score',
+                                                 'attack_score', 'total_score', 'calculated_at')}
+                # 與 SQL 的 SELECT t.id, t.name, s.* 相同：重複的 id 欄位取 t.id
+                scores.append({**row, 'id': team_id, 'name': self._teams[team_id]['name']})
+            scores.sort(key=lambda score: -(score['total_score'] or 0))
+            return scores
+
+    # ---- 分數時間軸 ----
+
+    def save_score_snapshot(self, round_id: int, wait: bool = True):
+        """記錄某 Round 結算後每隊的累計總分與名次"""
+        with self._lock:
+            round_data = self._rounds.get(round_id)
+            if round_data is None:
+                return completed(None, wait)
+            base_round_id = max((snapshot_id for snapshot_id in self._snapshots if snapshot_id < round_id), default=0)
+            totals = dict(self._snapshots[base_round_id]['totals']) if base_round_id else {}
+            for score_round_id in range(base_round_id + 1, round_id + 1):
+                for team_id in self._teams:
+                    row = self._scores.get((team_id, score_round_id))
+                    if row is not None:
+                        totals[team_id] = totals.get(team_id, 0) + row['total_score']
+            for team_id in self._teams:
+                totals.setdefault(team_id, 0.0)
+            self._snapshots[round_id] = {
+                'round_number': round_data['round_number'],
+                'totals': totals,
+                'ranks': rank_scores(totals),
+            }
+        return completed(None, wait)
+
+    def get_timeline(self, since_round: int = 0) -> Dict:
+        """分數時間軸 (欄式格式，見 storage.build_timeline)"""
+        with self._lock:
+            snapshots = []
+            for round_id in sorted(self._snapshots):
+                snapshot = self._snapshots[round_id]
+                if snapshot['round_number'] <= since_round:
+                    continue
+                for team_id, total in snapshot['totals'].items():
+                    snapshots.append({'round_number': snapshot['round_number'], 'team_id': team_id,
+                                      'total_score': total, 'rank': snapshot['ranks'][team_id]})
+            teams = [dict(self._teams[team_id]) for team_id in sorted(self._teams)]
+        return build_timeline(teams, snapshots)
+
+    # ---- 遊戲狀態紀錄 ----
+
+    def save_game_state(self, state: Dict, wait: bool = True):
+        """記錄遊戲階段轉換 (只保留最後一筆)"""
+        with self._lock:
+            self._game_state = dict(state, recorded_at=_current_timestamp())
+        return completed(None, wait)
+
+    def get_game_state(self) -> Optional[Dict]:
+        """最後一次記錄的遊戲階段"""
+        with self._lock:
+            return dict(self._game_state) if self._game_state else None
+
+    # ---- Patch ----
+
+    def save_patch(self, patch: Dict, wait: bool = True):
+        """記錄隊伍目前的 Patch"""
+        with self._lock:
+            current = self._patches.get(patch['team_id'])
+            self._patches[patch['team_id']] = dict(patch, status='pending', validation_error=None,
+                                                   valid_sha256=current['valid_sha256'] if current else None)
+        return completed(None, wait)
+
+    def set_patch_status(self, team_id: int, sha256: str, status: str, error: str = None, wait: bool = True):
+        """記錄 Patch 的檢查結果"""
+        with self._lock:
+            patch = self._patches.get(team_id)
+            if patch is not None and patch['sha256'] == sha256:
+                patch['status'] = status
+                patch['validation_error'] = error
+                if status == 'valid':
+                    patch['valid_sha256'] = sha256
+        return completed(None, wait)
+
+    def get_patch(self, team_id: int) -> Optional[Dict]:
+        """隊伍目前的 Patch 紀錄"""
+        with self._lock:
+            patch = self._patches.get(team_id)
+            return dict(patch) if patch else None
+
+    def get_patches(self) -> List[Dict]:
+        """所有隊伍目前的 Patch 紀錄"""
+        with self._lock:
+            return [dict(self._patches[team_id]) for team_id in sorted(self._patches)]
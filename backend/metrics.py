@@ -0,0 +1,223 @@
+"""
+Prometheus 格式的指標 (Counter / Gauge / Histogram)
+每個指標一把鎖，紀錄時只在鎖內更新一個 dict 項目 (臨界區很短，不會拖慢 API 請求等熱路徑)
+"""
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+# 預設的延遲分桶 (秒)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List['_Metric'] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: '_Metric'):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """輸出 Prometheus text exposition format"""
+        lines = []
+        for metric in list(self._metrics):
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence, extra: str = '') -> str:
+    parts = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class _LockedMetric(_Metric):
+    """數值存在 _values (label 值 tuple -> 數值)，讀寫都在 _lock 內"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict = {}
+        self._lock = threading.Lock()
+
+    def _copy(self, value):
+        return value
+
+    def collect(self) -> Dict:
+        """目前數值的複本"""
+        with self._lock:
+            return {key: self._copy(value) for key, value in self._values.items()}
+
+
+class Counter(_LockedMetric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in sorted(self.collect().items())
+        ]
+
+
+class Histogram(_LockedMetric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Registry = REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各分桶計數..., +Inf 計數, 總和]
+                state = [0] * (len(self.buckets) + 1) + [0.0]
+                self._values[key] = state
+            state[bucket] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """以 with 區塊計時"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _copy(self, state: List) -> List:
+        return list(state)
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, state in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-1])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+class Gauge(_Metric):
+    """Gauge 為「最新值」語意，直接寫入共享 dict (單一賦值在 GIL 下為原子操作)"""
+    type = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in sorted(self._values.copy().items())
+        ]
+
+
+def instrument_methods(cls, histogram: Histogram, label: str = 'method', exclude: Sequence[str] = ()):
+    """
+    類別裝飾器：量測所有公開方法的執行時間，以方法名稱為 label
+    同時記錄目前執行中的方法 (current_method)，供更細的量測 (例如單一 SQL) 歸屬來源
+    """
+    for name, attr in list(vars(cls).items()):
+        if name.startswith('_') or name in exclude or not callable(attr):
+            continue
+        setattr(cls, name, _timed_method(attr, name, histogram, label))
+    return cls
+
+
+_method_context = threading.local()
+
+
+def current_method() -> str:
+    """目前執行緒中最外層被 instrument_methods 量測的方法名稱"""
+    return getattr(_method_context, 'name', None)
+
+
+@contextmanager
+def method_scope(name: str):
+    """在 instrument_methods 之外標記目前的方法名稱 (例如 writer 執行緒代為執行的寫入)"""
+    outer = getattr(_method_context, 'name', None)
+    if outer is None:
+        _method_context.name = name
+    try:
+        yield
+    finally:
+        if outer is None:
+            _method_context.name = None
+
+
+def _timed_method(func, name: str, histogram: Histogram, label: str):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_method_context, 'name', None)
+        if outer is None:
+            _method_context.name = name
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start, **{label: name})
+            if outer is None:
+                _method_context.name = None
+    return wrapper
@@ -2,20 +2,37 @@ import sqlite3
 from datetime import datetime
 from typing import List, Dict, Optional
 import json
+from concurrent.futures import Future
 from zoneinfo import ZoneInfo
 
-class Database:
-    def __init__(self, db_path: str):
+from metrics import Histogram, instrument_methods
+from db_profiler import ProfiledConnection, QueryProfiler
+from db_writer import DatabaseWriter
+from storage import Storage, build_timeline, rank_scores
+
+DB_METHOD_SECONDS = Histogram('ad_db_method_duration_seconds', 'Database 方法執行時間', ['method'])
+
+class Database(Storage):
+    def __init__(self, db_path: str, profiler: QueryProfiler = None, writer_options: Dict = None):
         self.db_path = db_path
+        # 記錄每條 SQL 的耗時、列數與等待寫鎖時間
+        self.profiler = profiler or QueryProfiler()
         self.init_db()
+        # 有 writer_options 時所有寫入交給單一 writer 執行緒 group commit；否則每次寫入各自開連線 commit
+        self.writer = None
+        if writer_options is not None:
+            self.writer = DatabaseWriter(
+                self.get_connection,
+                max_batch=writer_options.get('max_batch', 256),
+                max_delay=writer_options.get('max_delay_ms', 0) / 1000
+            )
     
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path, timeout=30.0, check_same_thread=False)
+        conn = sqlite3.connect(self.db_path, timeout=30.0, check_same_thread=False, factory=ProfiledConnection)
+        conn.profiler = self.profiler
         conn.row_factory = sqlite3.Row
         # 啟用 WAL 模式以提高並發性能
         conn.execute('PRAGMA journal_mode=WAL')
-        # 設置較短的 busy timeout
-        conn.execute('PRAGMA busy_timeout=30000')
         return conn
     
     def init_db(self):
@@ -82,6 +99,11 @@ class Database:
                 FOREIGN KEY (round_id) REFERENCES rounds(id)
             )
         ''')
+        # 重複提交檢查在 writer 中執行，需要索引避免掃描整張表
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_flag_submissions_submitter_flag
+            ON flag_submissions (submitter_team_id, flag_value)
+        ''')
         
         # Service Status 表
         cursor.execute('''
@@ -115,19 +137,108 @@ class Database:
             )
         ''')
         
+        # 每隊每 Round 的服務檢查累計計數 (uptime.UptimeTracker)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS uptime_counters (
+                round_id INTEGER NOT NULL,
+                team_id INTEGER NOT NULL,
+                checks INTEGER NOT NULL DEFAULT 0,
+                successes INTEGER NOT NULL DEFAULT 0,
+                last_up BOOLEAN NOT NULL DEFAULT 0,
+                latency_sum REAL NOT NULL DEFAULT 0,
+                latency_buckets TEXT NOT NULL DEFAULT '[]',
+                PRIMARY KEY (round_id, team_id),
+                FOREIGN KEY (team_id) REFERENCES teams(id),
+                FOREIGN KEY (round_id) REFERENCES rounds(id)
+            )
+        ''')
+        
+        # 每 Round 結算後的累計總分與名次 (分數時間軸)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS score_snapshots (
+                round_id INTEGER NOT NULL,
+                round_number INTEGER NOT NULL,
+                team_id INTEGER NOT NULL,
+                total_score REAL NOT NULL,
+                rank INTEGER NOT NULL,
+                PRIMARY KEY (round_id, team_id),
+                FOREIGN KEY (team_id) REFERENCES teams(id),
+                FOREIGN KEY (round_id) REFERENCES rounds(id)
+            )
+        ''')
+        
+        # 遊戲階段轉換紀錄 (伺服器重啟後從最後一筆恢復)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS game_journal (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                phase TEXT NOT NULL,
+                round_number INTEGER NOT NULL,
+                round_id INTEGER,
+                deadline REAL,
+                game_start_time TEXT,
+                recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 每隊目前的 Patch (內容存放在 PatchStore，以 sha256 定位)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS patches (
+                team_id INTEGER PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                filename TEXT NOT NULL,
+                uploaded_at REAL NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                validation_error TEXT,
+                valid_sha256 TEXT
+            )
+        ''')
+        
+        # 檢查並添加 Patch 檢查結果欄位（如果不存在）
+        cursor.execute("PRAGMA table_info(patches)")
+        columns = [col[1] for col in cursor.fetchall()]
+        if 'status' not in columns:
+            cursor.execute("ALTER TABLE patches ADD COLUMN status TEXT NOT NULL DEFAULT 'pending'")
+            cursor.execute('ALTER TABLE patches ADD COLUMN validation_error TEXT')
+            cursor.execute('ALTER TABLE patches ADD COLUMN valid_sha256 TEXT')
+        
         conn.commit()
         conn.close()
     
-    def add_team(self, team_id: int, name: str, host: str, port: int):
+    def close(self):
+        """停止 writer (先寫完已排入的操作)"""
+        if self.writer is not None:
+            self.writer.close()
+    
+    def _write(self, op, *args, wait: bool = True):
+        """
+        執行寫入操作 op(cursor, *args)，有 writer 時排入 writer 佇列
+        wait=False 時不等待 commit，直接返回 Future
+        """
+        if self.writer is not None:
+            future = self.writer.submit(op, *args)
+        else:
+            future = Future()
+            conn = self.get_connection()
+            try:
+                result = op(conn.cursor(), *args)
+                conn.commit()
+                future.set_result(result)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                conn.close()
+        return future.result() if wait else future
+    
+    def add_team(self, team_id: int, name: str, host: str, port: int, wait: bool = True):
         """新增隊伍"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        return self._write(self._add_team, team_id, name, host, port, wait=wait)
+    
+    def _add_team(self, cursor, team_id: int, name: str, host: str, port: int):
         cursor.execute(
             'INSERT OR REPLACE INTO teams (id, name, host, port) VALUES (?, ?, ?, ?)',
             (team_id, name, host, port)
         )
-        conn.commit()
-        conn.close()
     
     def get_teams(self) -> List[Dict]:
         """獲取所有隊伍"""
@@ -140,16 +251,14 @@ class Database:
     
     def create_round(self, round_number: int) -> int:
         """創建新 Round"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        return self._write(self._create_round, round_number)
+    
+    def _create_round(self, cursor, round_number: int) -> int:
         cursor.execute(
             'INSERT INTO rounds (round_number, start_time, status) VALUES (?, ?, ?)',
             (round_number, datetime.now(tz=ZoneInfo('Asia/Taipei')), 'active')
         )
-        round_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return round_id
+        return cursor.lastrowid
     
     def get_current_round(self) -> Optional[Dict]:
         """獲取當前 Round"""
@@ -162,28 +271,54 @@ class Database:
         conn.close()
         return dict(round_data) if round_data else None
     
-    def close_round(self, round_id: int):
-        """結束 Round"""
+    def get_round_by_number(self, round_number: int) -> Optional[Dict]:
+        """依 Round 編號查詢"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        cursor.execute('SELECT * FROM rounds WHERE round_number = ? ORDER BY id LIMIT 1', (round_number,))
+        round_data = cursor.fetchone()
+        conn.close()
+        return dict(round_data) if round_data else None
+    
+    def get_last_round_number(self) -> int:
+        """已建立的最大 Round 編號"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT MAX(round_number) FROM rounds')
+        last = cursor.fetchone()[0]
+        conn.close()
+        return last or 0
+    
+    def close_round(self, round_id: int):
+        """結束 Round"""
+        return self._write(self._close_round, round_id)
+    
+    def _close_round(self, cursor, round_id: int):
         cursor.execute(
             'UPDATE rounds SET status = "closed", end_time = ? WHERE id = ?',
             (datetime.now(tz=ZoneInfo('Asia/Taipei')), round_id)
         )
-        conn.commit()
-        conn.close()
     
     def add_flag(self, team_id: int, round_id: int, flag_value: str, expires_at: datetime = None, vuln_type: str = 'monitor'):
         """新增 Flag（expires_at 設為 None 表示永不過期）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        return self.add_flags([{
+            'team_id': team_id, 'round_id': round_id, 'flag_value': flag_value,
+            'expires_at': expires_at, 'vuln_type': vuln_type
+        }])
+    
+    def add_flags(self, flags: List[Dict]):
+        """批次新增 Flags (每筆包含 team_id / round_id / flag_value / vuln_type / expires_at)"""
+        if not flags:
+            return
+        return self._write(self._add_flags, flags)
+    
+    def _add_flags(self, cursor, flags: List[Dict]):
         # expires_at 可以是 None，表示永不過期
-        cursor.execute(
+        cursor.executemany(
             'INSERT INTO flags (team_id, round_id, flag_value, expires_at, vuln_type) VALUES (?, ?, ?, ?, ?)',
-            (team_id, round_id, flag_value, expires_at, vuln_type)
+            [(f['team_id'], f['round_id'], f['flag_value'], f.get('expires_at'), f.get('vuln_type', 'monitor'))
+             for f in flags]
         )
-        conn.commit()
-        conn.close()
     
     def get_flag(self, flag_value: str) -> Optional[Dict]:
         """根據 Flag 值查詢 Flag（不再檢查過期時間）"""
@@ -198,64 +333,93 @@ class Database:
         
         return dict(flag) if flag else None
     
+    def get_team_flags(self, team_id: int, round_id: int) -> Dict[str, str]:
+        """獲取特定隊伍在特定 Round 的所有 Flag"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT vuln_type, flag_value FROM flags WHERE team_id = ? AND round_id = ?',
+            (team_id, round_id)
+        )
+        flags = {row['vuln_type']: row['flag_value'] for row in cursor.fetchall()}
+        conn.close()
+        return flags
+    
     def submit_flag(self, submitter_team_id: int, flag_value: str, round_id: int) -> Dict:
         """提交 Flag"""
         flag = self.get_flag(flag_value)
-        is_valid = False
-        target_team_id = None
-        message = "Invalid flag"
+        if not flag:
+            return {'success': False, 'message': "Invalid flag", 'target_team_id': None}
         
-        if flag:
-            target_team_id = flag['team_id']
-            # 不能提交自己的 flag
-            if target_team_id == submitter_team_id:
-                message = "Cannot submit your own flag"
-            else:
-                # 檢查是否已經提交過這個具體的 flag
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT * FROM flag_submissions 
-                    WHERE submitter_team_id = ? AND flag_value = ?
-                ''', (submitter_team_id, flag_value))
-                
-                if cursor.fetchone():
-                    message = "This flag has already been submitted"
-                else:
-                    is_valid = True
-                    message = "Flag accepted"
-                conn.close()
+        target_team_id = flag['team_id']
+        # 不能提交自己的 flag
+        if target_team_id == submitter_team_id:
+            return {'success': False, 'message': "Cannot submit your own flag", 'target_team_id': target_team_id}
         
-        # 只記錄有效的提交（避免 NULL target_team_id）
-        if is_valid and target_team_id is not None:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO flag_submissions 
-                (submitter_team_id, target_team_id, round_id, flag_value, is_valid, submitted_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (submitter_team_id, target_team_id, round_id, flag_value, is_valid, datetime.now(tz=ZoneInfo('Asia/Taipei'))))
-            conn.commit()
-            conn.close()
+        # 重複檢查與寫入在同一個寫入操作中執行，同一個 flag 同時提交兩次也只會接受一次
+        return self._write(self._submit_flag, submitter_team_id, target_team_id, flag_value, round_id)
+    
+    def _submit_flag(self, cursor, submitter_team_id: int, target_team_id: int, flag_value: str,
+                     round_id: int) -> Dict:
+        # 檢查是否已經提交過這個具體的 flag
+        cursor.execute('''
+            SELECT 1 FROM flag_submissions 
+            WHERE submitter_team_id = ? AND flag_value = ?
+        ''', (submitter_team_id, flag_value))
+        if cursor.fetchone():
+            return {'success': False, 'message': "This flag has already been submitted",
+                    'target_team_id': target_team_id}
         
-        return {
-            'success': is_valid,
-            'message': message,
-            'target_team_id': target_team_id
-        }
+        # 只記錄有效的提交（避免 NULL target_team_id）
+        cursor.execute('''
+            INSERT INTO flag_submissions 
+            (submitter_team_id, target_team_id, round_id, flag_value, is_valid, submitted_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (submitter_team_id, target_team_id, round_id, flag_value, True, datetime.now(tz=ZoneInfo('Asia/Taipei'))))
+        return {'success': True, 'message': "Flag accepted", 'target_team_id': target_team_id}
     
-    def record_service_status(self, team_id: int, round_id: int, is_up: bool, 
-                             response_time: float = None, error_message: str = None):
-        """記錄服務狀態"""
+    def get_recent_submissions(self, limit: int = 100) -> List[Dict]:
+        """最近的 Flag 提交紀錄（新到舊）"""
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('''
+            SELECT 
+                fs.submitted_at as timestamp,
+                fs.flag_value as flag,
+                fs.is_valid as success,
+                t1.name as attacker_team,
+                t2.name as victim_team
+            FROM flag_submissions fs
+            LEFT JOIN teams t1 ON fs.submitter_team_id = t1.id
+            LEFT JOIN teams t2 ON fs.target_team_id = t2.id
+            ORDER BY fs.submitted_at DESC
+            LIMIT ?
+        ''', (limit,))
+        submissions = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return submissions
+    
+    def record_service_status(self, team_id: int, round_id: int, is_up: bool, 
+                             response_time: float = None, error_message: str = None, wait: bool = True):
+        """記錄服務狀態"""
+        return self.record_service_statuses([{
+            'team_id': team_id, 'round_id': round_id, 'is_up': is_up,
+            'response_time': response_time, 'error_message': error_message
+        }], wait=wait)
+    
+    def record_service_statuses(self, statuses: List[Dict], wait: bool = True):
+        """批次記錄服務狀態 (每筆包含 team_id / round_id / is_up / response_time / error_message)"""
+        if not statuses:
+            return
+        return self._write(self._record_service_statuses, statuses, wait=wait)
+    
+    def _record_service_statuses(self, cursor, statuses: List[Dict]):
+        cursor.executemany('''
             INSERT INTO service_status 
             (team_id, round_id, is_up, response_time, error_message)
             VALUES (?, ?, ?, ?, ?)
-        ''', (team_id, round_id, is_up, response_time, error_message))
-        conn.commit()
-        conn.close()
+        ''', [(s['team_id'], s['round_id'], s['is_up'], s.get('response_time'), s.get('error_message'))
+              for s in statuses])
     
     def get_service_status(self, round_id: int) -> List[Dict]:
         """獲取所有隊伍的最新服務狀態"""
@@ -275,19 +439,46 @@ class Database:
         conn.close()
         return statuses
     
+    def save_uptime_counters(self, counters: List[Dict], wait: bool = True):
+        """寫入每隊每 Round 的檢查累計計數"""
+        if not counters:
+            return
+        return self._write(self._save_uptime_counters, counters, wait=wait)
+    
+    def _save_uptime_counters(self, cursor, counters: List[Dict]):
+        cursor.executemany('''
+            INSERT OR REPLACE INTO uptime_counters
+            (round_id, team_id, checks, successes, last_up, latency_sum, latency_buckets)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(c['round_id'], c['team_id'], c['checks'], c['successes'], c['last_up'], c['latency_sum'],
+               json.dumps(c['latency_buckets'])) for c in counters])
+    
+    def get_uptime_counters(self, round_id: int) -> Dict[int, Dict]:
+        """某 Round 每隊的檢查累計計數"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM uptime_counters WHERE round_id = ?', (round_id,))
+        counters = {}
+        for row in cursor.fetchall():
+            counter = dict(row)
+            counter['latency_buckets'] = json.loads(counter['latency_buckets'])
+            counters[counter['team_id']] = counter
+        conn.close()
+        return counters
+    
     def save_scores(self, team_id: int, round_id: int, sla_score: float, 
-                   defense_score: float, attack_score: float):
+                   defense_score: float, attack_score: float, wait: bool = True):
         """保存分數"""
+        return self._write(self._save_scores, team_id, round_id, sla_score, defense_score, attack_score, wait=wait)
+    
+    def _save_scores(self, cursor, team_id: int, round_id: int, sla_score: float,
+                     defense_score: float, attack_score: float):
         total_score = sla_score + defense_score + attack_score
-        conn = self.get_connection()
-        cursor = conn.cursor()
         cursor.execute('''
             INSERT OR REPLACE INTO scores 
             (team_id, round_id, sla_score, defense_score, attack_score, total_score, calculated_at)
             VALUES (?, ?, ?, ?, ?, ?, ?)
         ''', (team_id, round_id, sla_score, defense_score, attack_score, total_score, datetime.now(tz=ZoneInfo('Asia/Taipei'))))
-        conn.commit()
-        conn.close()
     
     def get_scoreboard(self) -> List[Dict]:
         """獲取總排行榜"""
@@ -365,3 +556,116 @@ class Database:
         attacks = {row['submitter_team_id']: row['attack_count'] for row in cursor.fetchall()}
         conn.close()
         return attacks
+    
+    def save_score_snapshot(self, round_id: int, wait: bool = True):
+        """記錄某 Round 結算後每隊的累計總分與名次"""
+        return self._write(self._save_score_snapshot, round_id, wait=wait)
+    
+    def _save_score_snapshot(self, cursor, round_id: int):
+        cursor.execute('SELECT round_number FROM rounds WHERE id = ?', (round_id,))
+        round_data = cursor.fetchone()
+        if not round_data:
+            return
+        
+        # 從前一個快照開始累加；通常只需要加上本 Round 的分數
+        cursor.execute('SELECT MAX(round_id) AS round_id FROM score_snapshots WHERE round_id < ?', (round_id,))
+        base_round_id = cursor.fetchone()['round_id'] or 0
+        cursor.execute('SELECT team_id, total_score FROM score_snapshots WHERE round_id = ?', (base_round_id,))
+        totals = {row['team_id']: row['total_score'] for row in cursor.fetchall()}
+        cursor.execute('''
+            SELECT team_id, SUM(total_score) AS total_score FROM scores
+            WHERE round_id > ? AND round_id <= ?
+            GROUP BY team_id
+        ''', (base_round_id, round_id))
+        for row in cursor.fetchall():
+            totals[row['team_id']] = totals.get(row['team_id'], 0) + row['total_score']
+        cursor.execute('SELECT id FROM teams')
+        for row in cursor.fetchall():
+            totals.setdefault(row['id'], 0)
+        
+        ranks = rank_scores(totals)
+        cursor.executemany('''
+            INSERT OR REPLACE INTO score_snapshots (round_id, round_number, team_id, total_score, rank)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(round_id, round_data['round_number'], team_id, total, ranks[team_id])
+              for team_id, total in totals.items()])
+    
+    def get_timeline(self, since_round: int = 0) -> Dict:
+        """分數時間軸 (欄式格式，見 storage.build_timeline)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT round_number, team_id, total_score, rank FROM score_snapshots
+            WHERE round_number > ?
+            ORDER BY round_id
+        ''', (since_round,))
+        snapshots = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return build_timeline(self.get_teams(), snapshots)
+    
+    def save_game_state(self, state: Dict, wait: bool = True):
+        """記錄遊戲階段轉換"""
+        return self._write(self._save_game_state, state, wait=wait)
+    
+    def _save_game_state(self, cursor, state: Dict):
+        cursor.execute('''
+            INSERT INTO game_journal (phase, round_number, round_id, deadline, game_start_time)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (state['phase'], state['round_number'], state['round_id'], state['deadline'],
+              state['game_start_time']))
+    
+    def get_game_state(self) -> Optional[Dict]:
+        """最後一次記錄的遊戲階段"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM game_journal ORDER BY id DESC LIMIT 1')
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+    
+    def save_patch(self, patch: Dict, wait: bool = True):
+        """記錄隊伍目前的 Patch"""
+        return self._write(self._save_patch, patch, wait=wait)
+    
+    def _save_patch(self, cursor, patch: Dict):
+        cursor.execute('''
+            INSERT INTO patches (team_id, sha256, size, filename, uploaded_at, status, validation_error)
+            VALUES (?, ?, ?, ?, ?, 'pending', NULL)
+            ON CONFLICT(team_id) DO UPDATE SET
+                sha256 = excluded.sha256, size = excluded.size, filename = excluded.filename,
+                uploaded_at = excluded.uploaded_at, status = 'pending', validation_error = NULL
+        ''', (patch['team_id'], patch['sha256'], patch['size'], patch['filename'], patch['uploaded_at']))
+    
+    def set_patch_status(self, team_id: int, sha256: str, status: str, error: str = None, wait: bool = True):
+        """記錄 Patch 的檢查結果"""
+        return self._write(self._set_patch_status, team_id, sha256, status, error, wait=wait)
+    
+    def _set_patch_status(self, cursor, team_id: int, sha256: str, status: str, error: str):
+        cursor.execute('''
+            UPDATE patches
+            SET status = ?, validation_error = ?,
+                valid_sha256 = CASE WHEN ? = 'valid' THEN sha256 ELSE valid_sha256 END
+            WHERE team_id = ? AND sha256 = ?
+        ''', (status, error, status, team_id, sha256))
+    
+    def get_patch(self, team_id: int) -> Optional[Dict]:
+        """隊伍目前的 Patch 紀錄"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM patches WHERE team_id = ?', (team_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+    
+    def get_patches(self) -> List[Dict]:
+        """所有隊伍目前的 Patch 紀錄"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM patches ORDER BY team_id')
+        patches = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return patches
+
+
+# 量測每個 Database 方法的耗時
+instrument_methods(Database, DB_METHOD_SECONDS, exclude=('get_connection',))
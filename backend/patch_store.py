@@ -0,0 +1,117 @@
+"""
+隊伍 Patch 的儲存
+上傳以串流方式寫入暫存檔 (超過大小上限即中止)，同時計算 SHA-256；
+內容以雜湊值命名 (objects/<前兩碼>/<雜湊>.py)，以 rename 原子地放到定位，相同內容只存一份。
+每隊目前的 Patch (雜湊、大小、檔名、上傳時間) 記錄在資料庫的 patches 表，列表與下載只查資料庫
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class PatchStore:
+    def __init__(self, db: Storage, root: str = '/app/data/patches', max_bytes: int = 1024 * 1024):
+        """
+        root: Patch 內容與暫存檔的目錄
+        max_bytes: 單一 Patch 的大小上限
+        """
+        self.db = db
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path(self, sha256: str) -> str:
+        """雜湊值對應的內容檔路徑"""
+        return os.path.join(self.root, 'objects', sha256[:2], f'{sha256}.py')
+
+    def save(self, team_id: int, filename: str, stream: BinaryIO) -> Tuple[Optional[Dict], str]:
+        """
+        從 stream 讀取並保存隊伍的 Patch
+        返回: (Patch 紀錄, 錯誤訊息)
+        """
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.py')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        return None, f'Patch exceeds {self.max_bytes} bytes'
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                if size == 0:
+                    return None, 'Patch is empty'
+                sha256 = digest.hexdigest()
+                blob_path = self.path(sha256)
+                stored = os.path.exists(blob_path)
+                if not stored:
+                    tmp.flush()
+                    os.fsync(tmp.fileno())
+            # 相同內容已存在時直接丟棄暫存檔
+            if not stored:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(tmp_path, blob_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        current = self.db.get_patch(team_id)
+        if current and current['sha256'] == sha256:
+            # 與目前的 Patch 相同：不需寫入
+            return current, None
+        record = {
+            'team_id': team_id,
+            'sha256': sha256,
+            'size': size,
+            'filename': filename,
+            'uploaded_at': time.time(),
+        }
+        self.db.save_patch(record)
+        return self.db.get_patch(team_id), None
+
+    def get(self, team_id: int) -> Optional[Dict]:
+        """隊伍目前的 Patch 紀錄 (內容檔不存在時視為沒有 Patch)"""
+        record = self.db.get_patch(team_id)
+        if record and not os.path.exists(self.path(record['sha256'])):
+            logger.error(f"Patch object {record['sha256']} of team {team_id} is missing")
+            return None
+        return record
+
+    def list(self) -> List[Dict]:
+        """所有隊伍目前的 Patch 紀錄 (依隊伍 ID 排序)"""
+        return self.db.get_patches()
+
+    def import_legacy(self):
+        """把舊版直接存放在 root 下的 {team_id}_app.py 匯入為 Patch 紀錄"""
+        if not os.path.isdir(self.root):
+            return
+        for filename in sorted(os.listdir(self.root)):
+            if not filename.endswith('_app.py'):
+                continue
+            try:
+                team_id = int(filename.split('_')[0])
+            except ValueError:
+                continue
+            legacy_path = os.path.join(self.root, filename)
+            if self.db.get_patch(team_id) is None:
+                with open(legacy_path, 'rb') as f:
+                    record, error = self.save(team_id, filename, f)
+                if error:
+                    logger.error(f"Failed to import legacy patch {filename}: {error}")
+                    continue
+                logger.info(f"Imported legacy patch {filename} ({record['sha256'][:12]})")
+            os.remove(legacy_path)
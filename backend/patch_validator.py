@@ -0,0 +1,242 @@
+"""
+Patch 上傳後的預先檢查
+上傳的 Patch 在比賽階段就交給背景的檢查池，不必等到 Patch 階段套用後服務掛掉才發現。
+每個檢查在一次性的隊伍映像容器中執行 (與正式環境相同的 Python 與套件)：
+  1. py_compile 編譯 (語法錯誤)
+  2. import (逾時、缺少模組、沒有 wsgi.py 需要的 app / init_app)
+檢查容器沒有網路、沒有掛載任何主機目錄 (Patch 內容由 stdin 傳入)、根目錄唯讀並限制記憶體與程序數，
+隊伍的程式碼接觸不到主控制系統的資料 (tokens.json、game.db)
+檢查結果記錄在 patches 表；公開的錯誤只有分類 (編譯錯誤的行號除外)，容器輸出只寫入伺服器 log
+Patch 階段只套用最後一個通過檢查的版本，不做任何編譯或檢查
+相同內容 (sha256) 的檢查結果會重複使用
+"""
+import logging
+import re
+import subprocess
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_futures
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# 檢查容器中執行的腳本：從 stdin 讀入 Patch，編譯到 import 使用的 __pycache__ 位置
+# (import 時不再重新編譯)，再以與 vulnerable_app_unified/wsgi.py 相同的方式 import
+# 編譯錯誤時只輸出行號 (此時還沒有執行任何隊伍的程式碼)
+CHECK_SCRIPT = '''
+import importlib.util, os, py_compile, sys
+work_dir = '/tmp/patch-check'
+os.makedirs(work_dir)
+path = work_dir + '/app.py'
+with open(path, 'wb') as f:
+    f.write(sys.stdin.buffer.read())
+try:
+    py_compile.compile(path, cfile=importlib.util.cache_from_source(path), doraise=True)
+except py_compile.PyCompileError as e:
+    print(getattr(e.exc_value, 'lineno', None) or '')
+    sys.exit(2)
+sys.path.insert(0, work_dir)
+from app import app as application, init_app
+if not callable(init_app):
+    raise SystemExit('init_app is not callable')
+'''
+COMPILE_ERROR_EXIT = 2
+# 啟動時確認檢查容器可以執行 Python 並 import 隊伍服務的套件
+SELF_CHECK_SCRIPT = 'import flask, requests'
+# docker run 本身失敗 (daemon 錯誤 / 無法執行 / 找不到指令) 的結束碼
+DOCKER_ERROR_EXITS = (125, 126, 127)
+
+# 檢查容器的資源上限
+CHECK_MEMORY = '512m'
+CHECK_PIDS = 64
+CHECK_TMPFS = '/tmp:size=16m'
+# 容器建立與移除需要的額外時間 (秒)
+CONTAINER_OVERHEAD_SECONDS = 10
+CHECK_OUTPUT_LINES = 5
+
+# 公開的錯誤分類
+ERROR_COMPILE = 'Compile error'
+ERROR_IMPORT = 'Import failed'
+ERROR_TIMEOUT = 'Import timed out'
+ERROR_UNAVAILABLE = 'Validation unavailable'
+PUBLIC_ERROR = re.compile(
+    r'(Compile error( \(line \d+\))?|Import failed|Import timed out after \S+s|Validation unavailable)'
+)
+
+
+def sandbox_command(image: str, name: str, script: str) -> List[str]:
+    """在一次性的隊伍映像容器中以 python3 -I 執行 script 的 docker 指令 (stdin 會傳入容器)"""
+    return [
+        'docker', 'run', '-i', '--rm',
+        '--name', name,
+        '--network', 'none',
+        '--read-only', '--tmpfs', CHECK_TMPFS,
+        '--memory', CHECK_MEMORY, '--memory-swap', CHECK_MEMORY,
+        '--pids-limit', str(CHECK_PIDS), '--cpus', '1',
+        '--cap-drop', 'ALL', '--security-opt', 'no-new-privileges',
+        '--user', '65534:65534',
+        # 給隊伍服務 import 時需要的環境變數 (有 TEAM_TOKEN 時不向主服務器取 token)
+        '-e', 'TEAM_ID=team0', '-e', 'TEAM_TOKEN=patch-check', '-e', 'HOME=/tmp',
+        '--entrypoint', 'python3',
+        image, '-I', '-c', script,
+    ]
+
+
+def _remove_container(name: str):
+    try:
+        subprocess.run(['docker', 'rm', '-f', name], capture_output=True, timeout=30)
+    except Exception as e:
+        logger.error(f"Failed to remove patch check container {name}: {e}")
+
+
+def check_patch(content: bytes, image: str, timeout: float = 10.0) -> Tuple[str, Optional[str]]:
+    """
+    在一次性的容器中編譯並 import Patch
+    返回: (status, 錯誤分類)，status 為 valid / invalid / error (無法執行檢查)
+    """
+    name = f'patch-check-{uuid.uuid4().hex[:12]}'
+    try:
+        result = subprocess.run(
+            sandbox_command(image, name, CHECK_SCRIPT),
+            input=content, capture_output=True, timeout=timeout + CONTAINER_OVERHEAD_SECONDS
+        )
+    except subprocess.TimeoutExpired:
+        # 結束 docker CLI 不會停止容器
+        _remove_container(name)
+        return 'invalid', f'{ERROR_TIMEOUT} after {timeout:g}s'
+    if result.returncode == 0:
+        return 'valid', None
+    stdout = result.stdout.decode('utf-8', errors='replace').strip()
+    stderr = result.stderr.decode('utf-8', errors='replace').strip()
+    output = '\n'.join(stderr.splitlines()[-CHECK_OUTPUT_LINES:])
+    if result.returncode in DOCKER_ERROR_EXITS:
+        logger.error(f"Patch check container {name} could not run (exit {result.returncode}): {output}")
+        return 'error', ERROR_UNAVAILABLE
+    # 容器輸出可能包含隊伍程式碼產生的任意內容，只寫入伺服器 log
+    logger.info(f"Patch check {name} failed (exit {result.returncode}): {output}")
+    if result.returncode == COMPILE_ERROR_EXIT:
+        line = stdout.splitlines()[0] if stdout else ''
+        return 'invalid', f'{ERROR_COMPILE} (line {int(line)})' if line.isdigit() else ERROR_COMPILE
+    return 'invalid', ERROR_IMPORT
+
+
+class PatchValidator:
+    def __init__(self, db: Storage, path: Callable[[str], str], image: Callable[[int], str],
+                 workers: int = 2, import_timeout: float = 10.0,
+                 listener: Callable[[Dict, str, Optional[str]], None] = None):
+        """
+        path: sha256 -> Patch 內容檔路徑 (PatchStore.path)
+        image: team_id -> 檢查時使用的隊伍映像
+        workers: 同時執行的檢查容器數
+        import_timeout: 檢查的逾時秒數 (不含容器建立時間)
+        listener: 每個檢查完成後呼叫 listener(patch, status, error)
+        """
+        self.db = db
+        self.path = path
+        self.image = image
+        self.workers = workers
+        self.import_timeout = import_timeout
+        self.listener = listener
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='patch-check')
+        self._results: Dict[str, Tuple[str, Optional[str]]] = {}  # sha256 -> (status, error)
+        self._checks: Dict[str, Future] = {}  # sha256 -> 檢查中的 Future (同內容只檢查一次)
+        self._pending: set = set()  # 尚未寫入結果的 submit Future
+        self._lock = threading.Lock()
+
+    def self_check(self, team_ids: Iterable[int]) -> List[str]:
+        """
+        確認每個隊伍映像都能啟動檢查容器並執行 Python (伺服器啟動時呼叫一次)
+        返回: 錯誤訊息 (全部可以執行時為空)
+        """
+        images = sorted({self.image(team_id) for team_id in team_ids})
+        return [error for error in self._pool.map(self._self_check_image, images) if error]
+
+    def _self_check_image(self, image: str) -> Optional[str]:
+        name = f'patch-check-{uuid.uuid4().hex[:12]}'
+        try:
+            result = subprocess.run(sandbox_command(image, name, SELF_CHECK_SCRIPT), stdin=subprocess.DEVNULL,
+                                    capture_output=True, timeout=self.import_timeout + CONTAINER_OVERHEAD_SECONDS)
+        except subprocess.TimeoutExpired:
+            _remove_container(name)
+            return f'{image}: sandbox did not finish within {self.import_timeout + CONTAINER_OVERHEAD_SECONDS:g}s'
+        except OSError as e:
+            return f'{image}: cannot run docker: {e}'
+        if result.returncode != 0:
+            stderr = result.stderr.decode('utf-8', errors='replace').strip()
+            return f"{image}: exit {result.returncode}: {' / '.join(stderr.splitlines()[-CHECK_OUTPUT_LINES:])}"
+        return None
+
+    def _check(self, patch: Dict) -> Tuple[str, Optional[str]]:
+        with open(self.path(patch['sha256']), 'rb') as f:
+            content = f.read()
+        return check_patch(content, self.image(patch['team_id']), self.import_timeout)
+
+    def submit(self, patch: Dict) -> Future:
+        """非同步檢查 Patch，完成後寫入檢查結果；返回的 Future 結果為 (status, error)"""
+        sha256 = patch['sha256']
+        done = Future()
+        with self._lock:
+            cached = self._results.get(sha256)
+            if cached is None:
+                check = self._checks.get(sha256)
+                if check is None:
+                    check = self._pool.submit(self._check, patch)
+                    self._checks[sha256] = check
+                self._pending.add(done)
+        if cached is not None:
+            self._record(patch, cached, done)
+        else:
+            check.add_done_callback(lambda check: self._finish(patch, check, done))
+        return done
+
+    def _finish(self, patch: Dict, check: Future, done: Future):
+        try:
+            result = check.result()
+        except Exception as e:
+            # 無法執行檢查 (例如找不到 docker) 的細節只寫入 log
+            logger.error(f"Patch check for team {patch['team_id']} crashed: {e}")
+            result = ('error', ERROR_UNAVAILABLE)
+        with self._lock:
+            self._checks.pop(patch['sha256'], None)
+            # 無法執行的檢查不快取，下次上傳重新檢查
+            if result[0] != 'error':
+                self._results[patch['sha256']] = result
+        self._record(patch, result, done)
+
+    def _record(self, patch: Dict, result: Tuple[str, Optional[str]], done: Future):
+        status, error = result
+        if status == 'valid':
+            logger.info(f"Patch {patch['sha256'][:12]} of team {patch['team_id']} passed validation")
+        else:
+            logger.warning(f"Patch {patch['sha256'][:12]} of team {patch['team_id']} failed validation: {error}")
+        try:
+            self.db.set_patch_status(patch['team_id'], patch['sha256'], status, error)
+            if self.listener is not None:
+                self.listener(patch, status, error)
+        except Exception as e:
+            logger.error(f"Failed to record patch status for team {patch['team_id']}: {e}")
+        with self._lock:
+            self._pending.discard(done)
+        done.set_result(result)
+
+    def resume(self):
+        """
+        重新檢查尚未有結果的 Patch (伺服器重啟前還在檢查中)，
+        以及錯誤訊息不是公開分類的舊紀錄 (舊版直接保存檢查程序的輸出)
+        """
+        for patch in self.db.get_patches():
+            error = patch['validation_error']
+            if patch['status'] == 'pending' or (error and not PUBLIC_ERROR.fullmatch(error)):
+                self.submit(patch)
+
+    def wait(self, timeout: float = None):
+        """等待目前排入的檢查完成並寫入結果 (最多 timeout 秒)"""
+        with self._lock:
+            pending = list(self._pending)
+        if pending:
+            wait_futures(pending, timeout=timeout)
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
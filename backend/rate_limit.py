@@ -0,0 +1,75 @@
+"""
+記憶體內的 token bucket 限流
+每個 key (例如隊伍) 一個桶，以固定速率補充、最多累積 burst 個 token；
+請求時桶內不足 1 個 token 即拒絕，並算出需要等待多久才能再送
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+from metrics import Counter
+
+RATE_LIMIT_REQUESTS = Counter('ad_rate_limit_requests_total', '限流器判定結果', ['limiter', 'key', 'result'])
+
+
+class TokenBucketLimiter:
+    def __init__(self, name: str, rate: float, burst: float, clock: Callable[[], float] = time.monotonic,
+                 idle_seconds: float = 600):
+        """
+        rate: 每秒補充的 token 數
+        burst: 桶的容量 (可瞬間連續送出的請求數)
+        idle_seconds: 閒置超過此秒數且已補滿的桶會被清除
+        """
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        # 閒置時間至少要足以補滿桶，清除後重建的桶才不會多給 token
+        self.idle_seconds = max(idle_seconds, burst / rate)
+        # key -> [目前 token 數, 上次更新時間]
+        self._buckets: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._last_prune = clock()
+
+    def acquire(self, key: str, cost: float = 1) -> Tuple[bool, float]:
+        """
+        嘗試消耗 cost 個 token
+        返回: (是否允許, 被拒絕時建議的等待秒數)
+        """
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [self.burst, now]
+                self._buckets[key] = bucket
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                allowed, retry_after = True, 0.0
+            else:
+                allowed, retry_after = False, (cost - bucket[0]) / self.rate
+
+            if now - self._last_prune > self.idle_seconds:
+                self._prune(now)
+
+        RATE_LIMIT_REQUESTS.inc(limiter=self.name, key=key, result='allowed' if allowed else 'limited')
+        return allowed, retry_after
+
+    def _prune(self, now: float):
+        """清除閒置太久的桶 (呼叫時需持有 _lock)"""
+        idle = [key for key, (tokens, updated) in self._buckets.items()
+                if now - updated > self.idle_seconds]
+        for key in idle:
+            del self._buckets[key]
+        self._last_prune = now
+
+    @classmethod
+    def from_config(cls, name: str, limit_config: Dict):
+        """依設定建立限流器；沒有設定或 rate <= 0 時返回 None (不限流)"""
+        if not limit_config or limit_config.get('rate', 0) <= 0:
+            return None
+        rate = float(limit_config['rate'])
+        return cls(name, rate, float(limit_config.get('burst', rate)))
@@ -0,0 +1,75 @@
+"""
+唯讀 API 的回應快取
+每種資源 (scores, rounds, teams...) 有一個版本號，資料變動的事件 (Round 結束、服務檢查、
+Flag 提交成功) 發生時遞增；快取的回應以其依賴資源的版本號為 key，保存已序列化的 bytes 與 ETag
+"""
+import json
+import secrets
+import threading
+from typing import Callable, Dict, Iterable, Tuple
+
+from compression import compress
+
+
+class CachedResponse:
+    __slots__ = ('body', 'etag', '_encoded')
+
+    def __init__(self, body: bytes, etag: str):
+        self.body = body
+        self.etag = etag
+        self._encoded = {}
+
+    def encoded(self, encoding: str) -> Tuple[bytes, str]:
+        """獲取壓縮後的 body 與對應的 ETag (每種編碼只壓縮一次)"""
+        if encoding == 'identity':
+            return self.body, self.etag
+        if encoding not in self._encoded:
+            self._encoded[encoding] = compress(self.body, encoding)
+        return self._encoded[encoding], f'{self.etag}-{encoding}'
+
+
+class ResponseCache:
+    def __init__(self, dumps: Callable = None, max_entries: int = 256):
+        self.dumps = dumps or (lambda data: json.dumps(data).encode('utf-8'))
+        self.max_entries = max_entries
+        self.epoch = secrets.token_hex(4)  # 伺服器重啟後舊的 ETag 一律失效
+        self._versions: Dict[str, int] = {}
+        self._entries: Dict[str, Tuple[tuple, CachedResponse]] = {}
+        self._lock = threading.Lock()
+
+    def bump(self, *resources: str):
+        """資源資料變動，使依賴它的快取失效"""
+        with self._lock:
+            for resource in resources:
+                self._versions[resource] = self._versions.get(resource, 0) + 1
+
+    def get_versions(self, resources: Iterable[str]) -> tuple:
+        """獲取一組資源目前的版本號"""
+        with self._lock:
+            return tuple(self._versions.get(resource, 0) for resource in resources)
+
+    def get(self, key: str, resources: Iterable[str], builder: Callable, extra=None) -> CachedResponse:
+        """
+        獲取快取的回應，版本號不符時呼叫 builder() 重新產生
+        extra: 額外的版本成分 (例如時間區段)，會一併比對並編入 ETag
+        """
+        versions = self.get_versions(resources) + (extra,)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == versions:
+            return entry[1]
+
+        # 在鎖外產生回應；若產生期間資源被 bump，下次請求會因版本不符而重建
+        body = self.dumps(builder())
+        version_tag = '.'.join(str(v) for v in versions if v is not None)
+        cached = CachedResponse(body, f'{key}-{self.epoch}-{version_tag}')
+
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (versions, cached)
+        return cached
+
+    def clear(self):
+        """清除所有快取的回應"""
+        with self._lock:
+            self._entries.clear()
@@ -1,43 +1,63 @@
 from typing import Dict, List
-from models import Database
+from storage import Storage
+from uptime import UptimeTracker
 import logging
 
 logger = logging.getLogger(__name__)
 
 class ScoringEngine:
-    def __init__(self, db: Database, config: Dict):
+    def __init__(self, db: Storage, config: Dict, uptime: UptimeTracker = None):
         self.db = db
         self.config = config
+        # 有 UptimeTracker 時從記憶體讀取檢查計數，否則讀取資料庫中的 uptime_counters
+        self.uptime = uptime
         self.num_teams = config['game']['num_teams']
         self.sla_total_pool = config['scoring']['sla_total_pool']  # 512
         self.base_defense_score = config['scoring']['base_defense_score']  # 12
         self.attack_score_per_flag = config['scoring']['attack_score_per_flag']  # 1
         self.defense_penalty = config['scoring']['defense_penalty_per_steal']  # 1
+        # latest: 以本 Round 最後一次檢查判定在線與否；fraction: 依本 Round 檢查成功的比例分配 SLA 分數池
+        self.sla_mode = config['scoring'].get('sla_mode', 'latest')
     
-    def calculate_sla_score(self, team_id: int, service_status: Dict[int, bool]) -> float:
+    def calculate_sla_score(self, team_id: int, service_status: Dict[int, float]) -> float:
         """
         計算服務在線分數 (SLA Score)
         規則：512 總分池 / 在線隊伍數
         例如：12 隊都在線 -> 512/12 = 42.67 分/隊
               4 隊在線 -> 512/4 = 128 分/隊
+        service_status 的值為在線權重：latest 模式為 True/False；
+        fraction 模式為檢查成功比例，分數池依比例分配 (512 * 本隊比例 / 所有隊伍比例總和)
         """
         # 只有在線的隊伍才能獲得分數
-        if not service_status.get(team_id, False):
+        weight = float(service_status.get(team_id, 0))
+        if weight <= 0:
             logger.info(f"Team {team_id}: Service DOWN, SLA = 0")
             return 0.0
         
-        # 計算有多少隊伍在線
-        online_teams = sum(1 for is_up in service_status.values() if is_up)
+        # 計算有多少隊伍在線 (fraction 模式為比例總和)
+        online_teams = sum(float(value) for value in service_status.values() if value)
         
         if online_teams == 0:
             return 0.0
         
         # SLA分數 = 512 / 在線隊伍數
-        sla_score = self.sla_total_pool / online_teams
+        sla_score = self.sla_total_pool * weight / online_teams
         
-        logger.info(f"Team {team_id}: SLA = {sla_score:.2f} ({online_teams} teams online)")
+        logger.info(f"Team {team_id}: SLA = {sla_score:.2f} ({online_teams:g} teams online)")
         return round(sla_score, 2)
     
+    def get_sla_weights(self, round_id: int) -> Dict[int, float]:
+        """
+        本 Round 每隊的 SLA 權重 {team_id: 權重}，只讀取每隊一筆檢查計數
+        沒有計數時 (例如舊資料) 退回查詢 service_status 的最新狀態
+        """
+        counters = self.uptime.get_round(round_id) if self.uptime is not None else self.db.get_uptime_counters(round_id)
+        if not counters:
+            return {s['team_id']: s['is_up'] for s in self.db.get_service_status(round_id)}
+        if self.sla_mode == 'fraction':
+            return {team_id: c['successes'] / c['checks'] if c['checks'] else 0.0 for team_id, c in counters.items()}
+        return {team_id: bool(c['last_up']) for team_id, c in counters.items()}
+    
     def calculate_defense_score(self, team_id: int, flag_steals: Dict[int, int]) -> float:
         """
         計算防禦分數 (Defense Score)
@@ -77,8 +97,7 @@ class ScoringEngine:
         teams = self.db.get_teams()
         
         # 獲取服務狀態
-        service_statuses = self.db.get_service_status(round_id)
-        service_status_map = {s['team_id']: s['is_up'] for s in service_statuses}
+        service_status_map = self.get_sla_weights(round_id)
         
         # 獲取 flag 竊取統計
         flag_steals = self.db.get_flag_steals(round_id)
@@ -91,7 +110,8 @@ class ScoringEngine:
         logger.info(f"Flag Steals: {flag_steals}")
         logger.info(f"Attack Counts: {attack_counts}")
         
-        # 計算每個隊伍的分數
+        # 計算每個隊伍的分數（寫入排進 writer，全部算完後再等待 commit）
+        pending_writes = []
         for team in teams:
             team_id = team['id']
             
@@ -101,13 +121,14 @@ class ScoringEngine:
             attack_score = self.calculate_attack_score(team_id, attack_counts)
             
             # 保存到資料庫
-            self.db.save_scores(
+            pending_writes.append(self.db.save_scores(
                 team_id=team_id,
                 round_id=round_id,
                 sla_score=sla_score,
                 defense_score=defense_score,
-                attack_score=attack_score
-            )
+                attack_score=attack_score,
+                wait=False
+            ))
             
             total = sla_score + defense_score + attack_score
             logger.info(
@@ -115,6 +136,12 @@ class ScoringEngine:
                 f"SLA={sla_score}, Defense={defense_score}, Attack={attack_score}, Total={total}"
             )
         
+        for future in pending_writes:
+            future.result()
+        
+        # 記錄本 Round 結算後的累計總分與名次 (分數時間軸)
+        self.db.save_score_snapshot(round_id)
+        
         logger.info(f"=== Round {round_id} scoring complete ===")
     
     def get_scoreboard_summary(self) -> Dict:
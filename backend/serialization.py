@@ -0,0 +1,103 @@
+"""
+JSON 序列化
+有安裝 orjson 時使用 orjson，否則退回標準庫 json；API 回應 (Flask JSON provider)、回應快取與
+SocketIO 廣播都經由這裡序列化。
+  - 與 Flask 預設相同，物件的 key 依字母排序 (sort_keys)
+  - PreEncoded: 先序列化一次的 payload，廣播給所有客戶端時直接嵌入，不再重新序列化
+"""
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 依部署環境而定
+    orjson = None
+
+ENCODER = 'orjson' if orjson is not None else 'json'
+# orjson 3.9+ 才能把已序列化的 JSON 嵌入輸出
+_Fragment = getattr(orjson, 'Fragment', None)
+
+
+class PreEncoded:
+    """已序列化的 JSON 值 (保留原始資料，供無法直接嵌入 bytes 的 encoder 使用)"""
+    __slots__ = ('data', 'json')
+
+    def __init__(self, data: Any):
+        self.data = data
+        self.json = dumps(data).decode('utf-8')
+
+
+def _default(o: Any) -> Any:
+    """與 Flask 預設 JSON provider 相同的型別轉換，另外支援 PreEncoded"""
+    if isinstance(o, PreEncoded):
+        return _Fragment(o.json) if _Fragment is not None else o.data
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    # datetime 交給 _default 轉換 (與 Flask 相同格式)；dict 允許 int key (例如 {team_id: is_up})
+    _OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        """序列化為 UTF-8 JSON bytes (緊湊格式)"""
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    loads = orjson.loads
+else:
+    def dumps(obj: Any) -> bytes:
+        """序列化為 UTF-8 JSON bytes (緊湊格式)"""
+        return json.dumps(obj, default=_default, ensure_ascii=False, sort_keys=True,
+                          separators=(',', ':')).encode('utf-8')
+
+    loads = json.loads
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider：jsonify / request.json 改用 dumps / loads，回應直接使用 bytes"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:
+            # 指定了 indent 等格式參數時交給標準庫
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        return loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b'\n', mimetype=self.mimetype)
+
+
+class SocketIOJSON:
+    """
+    給 SocketIO(json=...) 使用的 json 模組介面
+    事件封包是 [event, payload...] 的 list，其中的 PreEncoded 直接嵌入已序列化的字串
+    """
+
+    @staticmethod
+    def dumps(obj: Any, **kwargs: Any) -> str:
+        if isinstance(obj, list) and any(isinstance(item, PreEncoded) for item in obj):
+            return '[' + ','.join(
+                item.json if isinstance(item, PreEncoded) else dumps(item).decode('utf-8') for item in obj
+            ) + ']'
+        return dumps(obj).decode('utf-8')
+
+    @staticmethod
+    def loads(s, **kwargs: Any) -> Any:
+        return loads(s)
@@ -1,13 +1,15 @@
 #!/bin/sh
 
-# 刪除舊資料庫
-echo "清理舊資料庫..."
-rm -f /app/data/game.db
-rm -f /app/data/ad_system.db
+# 預設保留資料庫，重啟後從遊戲狀態紀錄恢復進行中的遊戲
+# RESET_GAME=1 時刪除舊資料庫，重新開始
+if [ "$RESET_GAME" = "1" ]; then
+    echo "清理舊資料庫..."
+    rm -f /app/data/game.db
+    rm -f /app/data/ad_system.db
+fi
 
-# 清空 patch 資料夾
-echo "清理 patch 資料夾..."
-rm -rf /app/patches/*
+# 清理中斷的 patch 上傳暫存檔
+rm -rf /app/data/patches/tmp
 
 echo "啟動應用程式..."
 python app.py
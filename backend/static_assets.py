@@ -0,0 +1,78 @@
+"""
+記憶體內的靜態資源
+檔案只讀取與前處理一次，並預先產生 gzip / brotli 版本與強 ETag；
+檔案修改時間 (mtime) 變動時自動重新載入，方便開發時直接修改 dashboard.html
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from compression import SUPPORTED_ENCODINGS, compress
+
+
+class AssetVersion:
+    """某一版本的資源內容及其各種壓縮編碼"""
+    __slots__ = ('variants', 'etag', 'mimetype', 'mtime')
+
+    def __init__(self, content: bytes, mimetype: str, mtime: float):
+        self.variants: Dict[str, bytes] = {'identity': content}
+        for encoding in SUPPORTED_ENCODINGS:
+            self.variants[encoding] = compress(content, encoding)
+        self.etag = hashlib.sha256(content).hexdigest()[:32]
+        self.mimetype = mimetype
+        self.mtime = mtime
+
+
+class StaticAsset:
+    def __init__(self, paths: List[str], transform: Callable[[bytes], bytes] = None,
+                 mimetype: str = 'application/octet-stream', check_interval: float = 1.0):
+        """
+        paths: 依序嘗試的檔案路徑
+        transform: 載入後對內容做的前處理
+        check_interval: 兩次檢查 mtime 之間的最短間隔 (秒)
+        """
+        self.paths = paths
+        self.transform = transform
+        self.mimetype = mimetype
+        self.check_interval = check_interval
+        self._current: Optional[AssetVersion] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _find_path(self) -> Optional[str]:
+        for path in self.paths:
+            if os.path.exists(path):
+                return path
+        return None
+
+    def get(self) -> Optional[AssetVersion]:
+        """獲取目前的資源版本，檔案不存在時返回 None"""
+        now = time.monotonic()
+        if self._current is not None and now - self._last_check < self.check_interval:
+            return self._current
+
+        with self._lock:
+            if self._current is not None and now - self._last_check < self.check_interval:
+                return self._current
+            self._last_check = now
+
+            path = self._find_path()
+            if path is None:
+                self._current = None
+                return None
+            try:
+                mtime = os.stat(path).st_mtime
+                if self._current is not None and self._current.mtime == mtime:
+                    return self._current
+                with open(path, 'rb') as f:
+                    content = f.read()
+            except FileNotFoundError:
+                self._current = None
+                return None
+
+            if self.transform:
+                content = self.transform(content)
+            self._current = AssetVersion(content, self.mimetype, mtime)
+            return self._current
@@ -0,0 +1,238 @@
+"""
+遊戲資料的儲存介面
+涵蓋隊伍、Round、Flag、提交紀錄、服務狀態與分數；app / FlagManager / ScoringEngine / checker 只透過此介面存取資料
+實作：
+  - models.Database: SQLite (正式環境)
+  - memory_db.MemoryDatabase: 純記憶體 (模擬、benchmark、what-if 重播)，不做任何磁碟 I/O
+
+寫入方法的 wait=False 表示不等待寫入完成，改為返回 Future
+"""
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+class Storage(ABC):
+    def close(self):
+        """釋放資源 (停止背景寫入等)"""
+
+    # ---- 隊伍 ----
+
+    @abstractmethod
+    def add_team(self, team_id: int, name: str, host: str, port: int, wait: bool = True):
+        """新增隊伍 (同 id 則覆蓋)"""
+
+    @abstractmethod
+    def get_teams(self) -> List[Dict]:
+        """獲取所有隊伍 (依 id 排序)"""
+
+    # ---- Round ----
+
+    @abstractmethod
+    def create_round(self, round_number: int) -> int:
+        """創建新 Round，返回 round_id"""
+
+    @abstractmethod
+    def get_current_round(self) -> Optional[Dict]:
+        """獲取當前 active 的 Round"""
+
+    @abstractmethod
+    def get_round_by_number(self, round_number: int) -> Optional[Dict]:
+        """依 Round 編號查詢 (同一編號有多筆時取第一筆)"""
+
+    @abstractmethod
+    def get_last_round_number(self) -> int:
+        """已建立的最大 Round 編號 (沒有任何 Round 時為 0)"""
+
+    @abstractmethod
+    def close_round(self, round_id: int):
+        """結束 Round"""
+
+    # ---- Flag ----
+
+    @abstractmethod
+    def add_flag(self, team_id: int, round_id: int, flag_value: str, expires_at: datetime = None,
+                 vuln_type: str = 'monitor'):
+        """新增 Flag（expires_at 設為 None 表示永不過期）"""
+
+    @abstractmethod
+    def add_flags(self, flags: List[Dict]):
+        """批次新增 Flags (每筆包含 team_id / round_id / flag_value / vuln_type / expires_at)"""
+
+    @abstractmethod
+    def get_flag(self, flag_value: str) -> Optional[Dict]:
+        """根據 Flag 值查詢 Flag"""
+
+    @abstractmethod
+    def get_team_flags(self, team_id: int, round_id: int) -> Dict[str, str]:
+        """某隊伍在某 Round 的所有 Flag: {vuln_type: flag_value}"""
+
+    # ---- 提交紀錄 ----
+
+    @abstractmethod
+    def submit_flag(self, submitter_team_id: int, flag_value: str, round_id: int) -> Dict:
+        """提交 Flag，返回 {'success', 'message', 'target_team_id'}"""
+
+    @abstractmethod
+    def get_recent_submissions(self, limit: int = 100) -> List[Dict]:
+        """最近的提交紀錄 (新到舊)，每筆包含 timestamp / flag / success / attacker_team / victim_team"""
+
+    @abstractmethod
+    def get_flag_steals(self, round_id: int) -> Dict[int, int]:
+        """獲取每隊在本 Round 被竊取的次數"""
+
+    @abstractmethod
+    def get_attack_scores(self, round_id: int) -> Dict[int, int]:
+        """獲取每隊在本 Round 的攻擊次數"""
+
+    # ---- 服務狀態 ----
+
+    @abstractmethod
+    def record_service_status(self, team_id: int, round_id: int, is_up: bool,
+                              response_time: float = None, error_message: str = None, wait: bool = True):
+        """記錄服務狀態"""
+
+    @abstractmethod
+    def record_service_statuses(self, statuses: List[Dict], wait: bool = True):
+        """批次記錄服務狀態 (每筆包含 team_id / round_id / is_up / response_time / error_message)"""
+
+    @abstractmethod
+    def get_service_status(self, round_id: int) -> List[Dict]:
+        """獲取所有隊伍在某 Round 的最新服務狀態"""
+
+    @abstractmethod
+    def save_uptime_counters(self, counters: List[Dict], wait: bool = True):
+        """
+        寫入每隊每 Round 的檢查累計計數 (覆蓋)，每筆包含 team_id / round_id / checks / successes /
+        last_up / latency_sum / latency_buckets (list)
+        """
+
+    @abstractmethod
+    def get_uptime_counters(self, round_id: int) -> Dict[int, Dict]:
+        """某 Round 每隊的檢查累計計數: {team_id: counter}"""
+
+    # ---- 分數 ----
+
+    @abstractmethod
+    def save_scores(self, team_id: int, round_id: int, sla_score: float,
+                    defense_score: float, attack_score: float, wait: bool = True):
+        """保存分數 (同隊伍同 Round 則覆蓋)"""
+
+    @abstractmethod
+    def get_scoreboard(self) -> List[Dict]:
+        """總排行榜 (依總分由高到低)，包含各隊在當前 Round 的最新服務狀態"""
+
+    @abstractmethod
+    def get_round_scores(self, round_id: int) -> List[Dict]:
+        """獲取特定 Round 的分數"""
+
+    # ---- 分數時間軸 ----
+
+    @abstractmethod
+    def save_score_snapshot(self, round_id: int, wait: bool = True):
+        """
+        記錄某 Round 結算後每隊的累計總分與名次 (在 save_scores 之後呼叫)
+        累計分數由前一個快照加上之後各 Round 的分數得出，不重新加總整張 scores 表
+        """
+
+    @abstractmethod
+    def get_timeline(self, since_round: int = 0) -> Dict:
+        """Round 編號大於 since_round 的快照，格式見 build_timeline"""
+
+    # ---- 遊戲狀態紀錄 ----
+
+    @abstractmethod
+    def save_game_state(self, state: Dict, wait: bool = True):
+        """
+        記錄一次遊戲階段轉換，每筆包含 phase (playing / scoring / patching / stopped) /
+        round_number / round_id / deadline (階段截止的 epoch 秒數，可為 None) / game_start_time (ISO 格式)
+        """
+
+    @abstractmethod
+    def get_game_state(self) -> Optional[Dict]:
+        """最後一次記錄的遊戲階段 (從未記錄時為 None)"""
+
+    # ---- Patch ----
+
+    @abstractmethod
+    def save_patch(self, patch: Dict, wait: bool = True):
+        """
+        記錄隊伍目前的 Patch (同隊伍則覆蓋)，包含 team_id / sha256 / size / filename /
+        uploaded_at (epoch 秒數)；檢查狀態重設為 pending，保留 valid_sha256
+        """
+
+    @abstractmethod
+    def set_patch_status(self, team_id: int, sha256: str, status: str, error: str = None, wait: bool = True):
+        """
+        記錄 Patch 的檢查結果 (valid / invalid / error)，隊伍目前的 Patch 已不是 sha256 時忽略
+        valid 時同時把 valid_sha256 設為 sha256
+        """
+
+    @abstractmethod
+    def get_patch(self, team_id: int) -> Optional[Dict]:
+        """
+        隊伍目前的 Patch 紀錄，除了 save_patch 的欄位外包含 status / validation_error /
+        valid_sha256 (最後一個通過檢查的版本，可為 None)
+        """
+
+    @abstractmethod
+    def get_patches(self) -> List[Dict]:
+        """所有隊伍目前的 Patch 紀錄 (依隊伍 ID 排序)"""
+
+
+def rank_scores(totals: Dict[int, float]) -> Dict[int, int]:
+    """依總分排名 (同分同名次，下一名跳號：1, 2, 2, 4)"""
+    ranks = {}
+    previous = None
+    for position, (team_id, score) in enumerate(sorted(totals.items(), key=lambda item: (-item[1], item[0])), 1):
+        if score != previous:
+            rank = position
+            previous = score
+        ranks[team_id] = rank
+    return ranks
+
+
+def build_timeline(teams: List[Dict], snapshots: List[Dict]) -> Dict:
+    """
+    把快照 (依 Round 排序，每筆包含 round_number / team_id / total_score / rank) 轉成欄式格式:
+        {
+            'rounds': [Round 編號...],
+            'team_ids': [...], 'team_names': [...],
+            'score': [[第 i 隊在每個 Round 的累計總分]...],
+            'rank': [[第 i 隊在每個 Round 的名次]...]
+        }
+    某 Round 沒有快照的隊伍為 None
+    """
+    rounds = []
+    round_index = {}
+    for snapshot in snapshots:
+        if snapshot['round_number'] not in round_index:
+            round_index[snapshot['round_number']] = len(rounds)
+            rounds.append(snapshot['round_number'])
+    team_index = {team['id']: i for i, team in enumerate(teams)}
+    score = [[None] * len(rounds) for _ in teams]
+    rank = [[None] * len(rounds) for _ in teams]
+    for snapshot in snapshots:
+        i = team_index.get(snapshot['team_id'])
+        if i is None:
+            continue
+        j = round_index[snapshot['round_number']]
+        score[i][j] = snapshot['total_score']
+        rank[i][j] = snapshot['rank']
+    return {
+        'rounds': rounds,
+        'team_ids': [team['id'] for team in teams],
+        'team_names': [team['name'] for team in teams],
+        'score': score,
+        'rank': rank,
+    }
+
+
+def completed(result=None, wait: bool = True):
+    """同步完成的寫入：wait=True 直接返回結果，否則包成已完成的 Future"""
+    if wait:
+        return result
+    future = Future()
+    future.set_result(result)
+    return future
@@ -0,0 +1,66 @@
+"""
+有相依關係的工作並行執行
+Round 結束時的計分、排行榜發布、下一 Round 的 Flag 準備與容器重建彼此獨立，
+以 TaskGraph 在執行緒中同時進行，只有相依的工作 (例如 scoring -> close_round) 依序執行
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as wait_futures
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TaskGraph:
+    def __init__(self, on_step: Callable[[str, float], None] = None):
+        """on_step: 每個工作完成後呼叫 on_step(name, started)，started 為 time.perf_counter() 的值"""
+        self.on_step = on_step
+        self._tasks: Dict[str, Tuple[Callable[[], None], Tuple[str, ...]]] = {}
+
+    def add(self, name: str, func: Callable[[], None], after: Iterable[str] = ()):
+        """新增工作；after 中的工作全部成功後才執行 (需先 add)"""
+        after = tuple(after)
+        for dependency in after:
+            if dependency not in self._tasks:
+                raise ValueError(f'Unknown dependency {dependency!r} of task {name!r}')
+        self._tasks[name] = (func, after)
+
+    def _run_task(self, name: str):
+        started = time.perf_counter()
+        self._tasks[name][0]()
+        if self.on_step is not None:
+            self.on_step(name, started)
+
+    def run(self, max_workers: Optional[int] = None) -> Dict[str, Optional[BaseException]]:
+        """
+        執行所有工作並等待完成
+        返回: 失敗或略過的工作 {name: 例外 (相依工作失敗而略過時為 None)}
+        """
+        failed: Dict[str, Optional[BaseException]] = {}
+        done = set()
+        waiting: List[str] = list(self._tasks)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers or len(self._tasks) or 1,
+                                thread_name_prefix='task-graph') as pool:
+            while waiting or running:
+                for name in list(waiting):
+                    dependencies = self._tasks[name][1]
+                    if any(dependency in failed for dependency in dependencies):
+                        logger.error(f"Skipping task '{name}': a dependency failed")
+                        failed[name] = None
+                        waiting.remove(name)
+                    elif all(dependency in done for dependency in dependencies):
+                        running[pool.submit(self._run_task, name)] = name
+                        waiting.remove(name)
+                if not running:
+                    continue
+                finished, _ = wait_futures(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        done.add(name)
+                    else:
+                        logger.error(f"Task '{name}' failed: {error}", exc_info=error)
+                        failed[name] = error
+        return failed
@@ -0,0 +1,255 @@
+"""
+隊伍註冊表
+依 game.num_teams 與 network 設定動態分配每隊的子網路 IP、對外 port 與容器名稱，
+config['teams']、docker-compose.yml 與 Patch 階段重建容器都由這裡產生，
+不再各自寫死 172.30.0.{100 + N} / {8100 + N} (該規則超過約 150 隊就會超出 /24)
+
+產生 docker-compose.yml (在 backend/ 目錄下):
+    python team_registry.py --config ../config-docker.yml --output ../docker-compose.yml
+"""
+import argparse
+import ipaddress
+import math
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+DEFAULT_NETWORK = {
+    'name': 'adsystem_ad-network',   # docker CLI 看到的網路名稱 (compose 專案名稱_網路名稱)
+    'subnet': 'auto',                # auto: 依隊伍數選擇能容納的最小子網路 (至少 /24)
+    'base': '172.30.0.0',            # auto 時子網路的起始位址
+    'main_ip': '172.30.0.10',        # 主控制系統的 IP
+    'team_ip_offset': 100,           # Team N 使用子網路中 offset 之後的第 N 個可用位址
+    'host_port_base': 8100,          # Team N 對外 port = base + N
+    'spare_host_port_base': 9100,    # blue/green 時 Team N 備用 slot 的對外 port = base + N
+    'service_port': 8000,            # 隊伍服務在容器內的 port
+    'image': 'adsystem_{name}',      # 隊伍映像名稱 ({name} 為容器名稱)
+}
+
+
+class TeamRegistry:
+    def __init__(self, num_teams: int, network: Dict = None, overrides: List[Dict] = None,
+                 main_port: int = 5000, spare_slots: bool = False):
+        """
+        num_teams: 隊伍數
+        network: 覆寫 DEFAULT_NETWORK 的設定
+        overrides: config['teams'] 中手動設定的隊伍 (依 id 覆寫 name / host / port)
+        main_port: 主控制系統在容器內的 port
+        spare_slots: 每隊另外分配一個備用 slot (blue/green 切換時新容器使用)
+        """
+        self.num_teams = num_teams
+        self.network = {**DEFAULT_NETWORK, **(network or {})}
+        self.main_ip = ipaddress.ip_address(self.network['main_ip'])
+        self.main_port = main_port
+        self.spare_slots = spare_slots
+        self.subnet = self._allocate_subnet()
+        self._check_port_ranges()
+        self._slots, self._spares = self._allocate_slots({team['id']: team for team in (overrides or [])})
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'TeamRegistry':
+        return cls(
+            config['game']['num_teams'],
+            network=config.get('network'),
+            overrides=config.get('teams'),
+            main_port=config.get('server', {}).get('port', 5000),
+            spare_slots=config.get('containers', {}).get('swap') == 'blue_green'
+        )
+
+    def _required_addresses(self) -> int:
+        # 網路位址 + offset 以內的保留位址 + 各隊伍 (含備用 slot) + 廣播位址
+        slots_per_team = 2 if self.spare_slots else 1
+        return self.network['team_ip_offset'] + self.num_teams * slots_per_team + 2
+
+    def _allocate_subnet(self) -> ipaddress.IPv4Network:
+        subnet = self.network['subnet']
+        if subnet == 'auto':
+            prefix = min(24, 32 - math.ceil(math.log2(self._required_addresses())))
+            subnet = ipaddress.ip_network(f"{self.network['base']}/{prefix}", strict=False)
+        else:
+            subnet = ipaddress.ip_network(subnet)
+        if subnet.num_addresses < self._required_addresses():
+            raise ValueError(f'Subnet {subnet} cannot hold {self.num_teams} teams '
+                             f'(offset {self.network["team_ip_offset"]})')
+        if self.main_ip not in subnet:
+            raise ValueError(f'Main server IP {self.main_ip} is outside subnet {subnet}')
+        return subnet
+
+    def _check_port_ranges(self):
+        """主要 slot 與備用 slot 的對外 port 範圍 (base + 1 ~ base + num_teams) 不可重疊"""
+        if not self.spare_slots:
+            return
+        primary = self.network['host_port_base']
+        spare = self.network['spare_host_port_base']
+        if abs(primary - spare) < self.num_teams:
+            raise ValueError(f'Host ports {primary + 1}-{primary + self.num_teams} overlap spare ports '
+                             f'{spare + 1}-{spare + self.num_teams} ({self.num_teams} teams); '
+                             f'move network.spare_host_port_base at least {self.num_teams} away from host_port_base')
+
+    def _allocate_slots(self, overrides: Dict[int, Dict]) -> Tuple[Dict[int, Dict], Dict[int, Dict]]:
+        """返回: (每隊的 slot, 每隊的備用 slot)；備用 slot 的 IP 接在所有隊伍之後"""
+        reserved = {self.subnet.network_address, self.subnet.network_address + 1,
+                    self.subnet.broadcast_address, self.main_ip}
+        address = self.subnet.network_address + self.network['team_ip_offset']
+
+        def next_address(team_id):
+            nonlocal address
+            address += 1
+            while address in reserved:
+                address += 1
+            if address not in self.subnet or address == self.subnet.broadcast_address:
+                raise ValueError(f'Subnet {self.subnet} ran out of addresses at team {team_id}')
+            return address
+
+        def host_port(base_key, team_id):
+            port = self.network[base_key] + team_id
+            if port > 65535:
+                raise ValueError(f'Host port {port} for team {team_id} is out of range')
+            return port
+
+        slots = {}
+        for team_id in range(1, self.num_teams + 1):
+            address = next_address(team_id)
+            name = f'team{team_id}'
+            override = overrides.get(team_id, {})
+            slots[team_id] = {
+                'id': team_id,
+                'name': override.get('name', f'Team {team_id}'),
+                'container': name,
+                # 隊伍服務使用的 TEAM_ID (不論容器在哪個 slot 都相同)
+                'team_name': name,
+                'image': self.network['image'].format(name=name),
+                'ip': str(address),
+                'host_port': host_port('host_port_base', team_id),
+                # 主控制系統在同一個 Docker 網路上，以容器名稱連線
+                'host': override.get('host', name),
+                'port': override.get('port', self.network['service_port']),
+                'volumes': {f'adsystem_{name}-logs': '/app/logs', f'adsystem_{name}-files': '/app/files'},
+            }
+
+        spares = {}
+        if self.spare_slots:
+            for team_id, slot in slots.items():
+                address = next_address(team_id)
+                container = f"{slot['container']}-green"
+                spares[team_id] = dict(
+                    slot,
+                    container=container,
+                    ip=str(address),
+                    host_port=host_port('spare_host_port_base', team_id),
+                    host=container,
+                    port=self.network['service_port'],
+                )
+        return slots, spares
+
+    @property
+    def network_name(self) -> str:
+        return self.network['name']
+
+    @property
+    def main_server(self) -> str:
+        return f'http://{self.main_ip}:{self.main_port}'
+
+    def slot(self, team_id: int) -> Optional[Dict]:
+        return self._slots.get(team_id)
+
+    def spare_slot(self, team_id: int) -> Optional[Dict]:
+        """blue/green 的備用 slot (容器名稱、IP 與對外 port 與主要 slot 不同，共用映像與 volume)"""
+        return self._spares.get(team_id)
+
+    def slots(self) -> List[Dict]:
+        return [self._slots[team_id] for team_id in sorted(self._slots)]
+
+    def teams(self) -> List[Dict]:
+        """config['teams'] 的格式 (init_teams 使用)"""
+        return [
+            {'id': slot['id'], 'name': slot['name'], 'host': slot['host'], 'port': slot['port']}
+            for slot in self.slots()
+        ]
+
+    def compose(self) -> str:
+        """產生 docker-compose.yml"""
+        lines = [
+            'services:',
+            '  # 主控制系統 (Dashboard)',
+            '  ad-main:',
+            '    build: ./backend',
+            '    container_name: ad-main',
+            '    ports:',
+            f'      - "8001:{self.main_port}"',
+            '    environment:',
+            '      - CONFIG_FILE=/app/config-docker.yml',
+            '      # 設為 1 時啟動前清除資料庫 (否則從上次的遊戲狀態繼續)',
+            '      - RESET_GAME=0',
+            '    volumes:',
+            '      - ./config-docker.yml:/app/config-docker.yml',
+            '      - ./dashboard.html:/app/dashboard.html',
+            '      - ad-data:/app/data',
+            '      - /var/run/docker.sock:/var/run/docker.sock',
+            '    networks:',
+            '      ad-network:',
+            f'        ipv4_address: {self.main_ip}',
+            '',
+        ]
+        for slot in self.slots():
+            name = slot['container']
+            team_name = slot['team_name']
+            lines += [
+                f"  # 隊伍 {slot['id']}",
+                f'  {name}:',
+                '    build:',
+                '      context: ./vulnerable_app_unified',
+                '      dockerfile: Dockerfile.apache',
+                f'    container_name: {name}',
+                '    environment:',
+                f'      - TEAM_ID={team_name}',
+                f'      - MAIN_SERVER={self.main_server}',
+                f"      - PORT={self.network['service_port']}",
+                f'      - SECRET_KEY={team_name}-secret-key',
+                '      - APACHE_LOG_DIR=/var/log/apache2',
+                '    ports:',
+                f"      - \"{slot['host_port']}:{self.network['service_port']}\"",
+                '    volumes:',
+                f'      - {name}-logs:/app/logs',
+                f'      - {name}-files:/app/files',
+                '    networks:',
+                '      ad-network:',
+                f"        ipv4_address: {slot['ip']}",
+                '    depends_on:',
+                '      - ad-main',
+                '',
+            ]
+        lines += [
+            'networks:',
+            '  ad-network:',
+            '    driver: bridge',
+            '    ipam:',
+            '      config:',
+            f'        - subnet: {self.subnet}',
+            '',
+            'volumes:',
+            '  ad-data:',
+        ]
+        for slot in self.slots():
+            lines += [f"  {slot['container']}-logs:", f"  {slot['container']}-files:"]
+        return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate docker-compose.yml from the team registry')
+    parser.add_argument('--config', default='../config-docker.yml')
+    parser.add_argument('--output', help='write to this file instead of stdout')
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        registry = TeamRegistry.from_config(yaml.safe_load(f))
+    compose = registry.compose()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(compose)
+    else:
+        print(compose, end='')
+
+
+if __name__ == '__main__':
+    main()
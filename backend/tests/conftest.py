@@ -0,0 +1,30 @@
+"""backend 的模組以平面方式 import (與 python app.py 相同)"""
+import argparse
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def game(tmp_path_factory):
+    """
+    載入 app 模組 (記憶體資料庫、模擬的隊伍服務)
+    app 在 import 時讀取設定並建立全域物件，整個測試階段只載入一次
+    """
+    from bench.fake_fleet import FakeFleet
+    from bench.simulate import write_config
+
+    work_dir = str(tmp_path_factory.mktemp('game'))
+    fleet = FakeFleet(2, seed=1)
+    fleet.use_virtual_addresses()
+    args = argparse.Namespace(round_duration=60, patch_duration=30, check_interval=5,
+                              storage='memory', container_swap='recreate')
+    os.environ['CONFIG_FILE'] = write_config(work_dir, args, fleet.teams())
+    os.environ['TOKEN_FILE'] = os.path.join(work_dir, 'tokens.json')
+
+    import app
+    app.init_teams()
+    return app
@@ -0,0 +1,164 @@
+import sqlite3
+import threading
+
+import pytest
+
+from db_writer import DatabaseWriter
+
+
+def _connect(path, timeout=5.0):
+    return lambda: sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'writer.db')
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT NOT NULL)')
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _values(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute('SELECT value FROM items ORDER BY id')]
+    finally:
+        conn.close()
+
+
+def _insert(cursor, value):
+    cursor.execute('INSERT INTO items (value) VALUES (?)', (value,))
+    return cursor.lastrowid
+
+
+def _insert_then_fail(cursor, value):
+    cursor.execute('INSERT INTO items (value) VALUES (?)', (value,))
+    raise ValueError('op failed')
+
+
+def test_failing_op_rolls_back_only_its_savepoint(db_path):
+    writer = DatabaseWriter(_connect(db_path), max_delay=0.2)
+    try:
+        futures = [writer.submit(_insert, 'a'), writer.submit(_insert_then_fail, 'b'), writer.submit(_insert, 'c')]
+        assert futures[0].result(5) == 1
+        with pytest.raises(ValueError):
+            futures[1].result(5)
+        assert futures[2].result(5) == 2
+    finally:
+        writer.close()
+    assert _values(db_path) == ['a', 'c']
+
+
+def test_failed_begin_fails_whole_batch(db_path):
+    # 另一個連線持有寫鎖，writer 的 BEGIN IMMEDIATE 逾時
+    blocker = sqlite3.connect(db_path, isolation_level=None)
+    blocker.execute('BEGIN IMMEDIATE')
+    writer = DatabaseWriter(_connect(db_path, timeout=0.05), max_delay=0.2)
+    try:
+        futures = [writer.submit(_insert, 'a'), writer.submit(_insert, 'b')]
+        for future in futures:
+            with pytest.raises(sqlite3.OperationalError):
+                future.result(5)
+    finally:
+        blocker.execute('ROLLBACK')
+        blocker.close()
+        writer.close()
+    assert _values(db_path) == []
+
+
+def test_failed_commit_fails_whole_batch(tmp_path):
+    # 延遲檢查的外鍵在 COMMIT 時才失敗
+    path = str(tmp_path / 'fk.db')
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE parents (id INTEGER PRIMARY KEY);
+        CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT NOT NULL,
+                            parent_id INTEGER REFERENCES parents (id) DEFERRABLE INITIALLY DEFERRED);
+    ''')
+    conn.close()
+
+    def connect():
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute('PRAGMA foreign_keys=ON')
+        return conn
+
+    def insert_orphan(cursor):
+        cursor.execute("INSERT INTO items (value, parent_id) VALUES ('orphan', 42)")
+
+    writer = DatabaseWriter(connect, max_delay=0.2)
+    try:
+        futures = [writer.submit(_insert, 'a'), writer.submit(insert_orphan)]
+        for future in futures:
+            with pytest.raises(sqlite3.IntegrityError):
+                future.result(5)
+        # 失敗的批次已回滾，之後的寫入不受影響
+        assert writer.submit(_insert, 'b').result(5)
+    finally:
+        writer.close()
+    assert _values(path) == ['b']
+
+
+def test_future_resolves_after_commit(db_path):
+    writer = DatabaseWriter(_connect(db_path))
+    seen = []
+    committed = threading.Event()
+
+    def on_done(future):
+        # Future 完成時，其他連線已經看得到寫入的資料
+        seen.extend(_values(db_path))
+        committed.set()
+
+    try:
+        writer.submit(_insert, 'a').add_done_callback(on_done)
+        assert committed.wait(5)
+    finally:
+        writer.close()
+    assert seen == ['a']
+
+
+def test_database_write_without_wait_returns_future(tmp_path):
+    from models import Database
+
+    db = Database(str(tmp_path / 'game.db'), writer_options={'max_delay_ms': 50})
+    try:
+        future = db.add_team(1, 'Team 1', '10.0.0.1', 8001, wait=False)
+        future.result(5)
+        assert [team['id'] for team in db.get_teams()] == [1]
+    finally:
+        db.close()
+
+
+def test_close_drains_queue(db_path):
+    writer = DatabaseWriter(_connect(db_path), max_batch=8, max_delay=0.05)
+    futures = [writer.submit(_insert, str(i)) for i in range(50)]
+    writer.close()
+    assert all(future.done() for future in futures)
+    assert _values(db_path) == [str(i) for i in range(50)]
+    with pytest.raises(RuntimeError):
+        writer.submit(_insert, 'late')
+
+
+def test_close_during_submit_never_strands_future(db_path):
+    """close() 在 submit 檢查 _closed 之後、排入佇列之前執行：操作要嘛被拒絕，要嘛完成"""
+    writer = DatabaseWriter(_connect(db_path))
+    queue_put = writer._queue.put
+    closer = threading.Thread(target=writer.close)
+
+    def put(item, *args, **kwargs):
+        if closer.ident is None:
+            # 第一次排入操作時，讓 close() 在另一個執行緒搶先執行
+            closer.start()
+            closer.join(0.2)
+        queue_put(item, *args, **kwargs)
+
+    writer._queue.put = put
+    try:
+        future = writer.submit(_insert, 'a')
+    except RuntimeError:
+        future = None
+    closer.join(5)
+    if future is not None:
+        assert future.result(5) == 1
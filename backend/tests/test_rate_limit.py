@@ -0,0 +1,64 @@
+import pytest
+
+from rate_limit import TokenBucketLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_burst_then_limited_with_retry_after(clock):
+    limiter = TokenBucketLimiter('test', rate=2, burst=3, clock=clock)
+    assert [limiter.acquire('team1')[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = limiter.acquire('team1')
+    assert not allowed
+    assert retry_after == pytest.approx(0.5)
+
+
+def test_refills_at_rate_up_to_burst(clock):
+    limiter = TokenBucketLimiter('test', rate=2, burst=3, clock=clock)
+    for _ in range(3):
+        limiter.acquire('team1')
+    clock.now += 0.5
+    assert limiter.acquire('team1') == (True, 0.0)
+    assert not limiter.acquire('team1')[0]
+    # 閒置再久也只補到 burst
+    clock.now += 60
+    assert [limiter.acquire('team1')[0] for _ in range(4)] == [True, True, True, False]
+
+
+def test_keys_have_separate_buckets(clock):
+    limiter = TokenBucketLimiter('test', rate=1, burst=1, clock=clock)
+    assert limiter.acquire('team1')[0]
+    assert not limiter.acquire('team1')[0]
+    assert limiter.acquire('team2')[0]
+
+
+def test_pruned_bucket_does_not_grant_extra_tokens(clock):
+    # idle_seconds 小於補滿時間時會被拉長到 burst / rate
+    limiter = TokenBucketLimiter('test', rate=1, burst=10, clock=clock, idle_seconds=1)
+    assert limiter.idle_seconds == 10
+    for _ in range(10):
+        limiter.acquire('team1')
+    clock.now += 5
+    limiter.acquire('team2')
+    assert 'team1' in limiter._buckets
+    assert [limiter.acquire('team1')[0] for _ in range(6)] == [True] * 5 + [False]
+
+
+def test_from_config():
+    assert TokenBucketLimiter.from_config('flag_submit', None) is None
+    assert TokenBucketLimiter.from_config('flag_submit', {'rate': 0}) is None
+    limiter = TokenBucketLimiter.from_config('flag_submit', {'rate': 5})
+    assert (limiter.rate, limiter.burst) == (5.0, 5.0)
+    limiter = TokenBucketLimiter.from_config('flag_submit', {'rate': 5, 'burst': 20})
+    assert limiter.burst == 20.0
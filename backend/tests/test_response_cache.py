@@ -0,0 +1,59 @@
+import json
+
+from response_cache import ResponseCache
+
+
+def test_rebuilds_only_after_bump():
+    cache = ResponseCache()
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {'n': len(calls)}
+
+    first = cache.get('teams', ('teams',), build)
+    assert cache.get('teams', ('teams',), build) is first
+    cache.bump('scores')
+    assert cache.get('teams', ('teams',), build) is first
+    cache.bump('teams')
+    second = cache.get('teams', ('teams',), build)
+    assert json.loads(second.body) == {'n': 2}
+    assert second.etag != first.etag
+
+
+def test_extra_is_part_of_version_and_etag():
+    cache = ResponseCache()
+    first = cache.get('status', ('game',), lambda: {}, extra=1)
+    assert cache.get('status', ('game',), lambda: {}, extra=1) is first
+    second = cache.get('status', ('game',), lambda: {}, extra=2)
+    assert second is not first
+    assert second.etag.endswith('.2')
+
+
+def test_etag_changes_across_restarts():
+    assert ResponseCache().get('teams', ('teams',), dict).etag != ResponseCache().get('teams', ('teams',), dict).etag
+
+
+def test_encoded_etag_per_encoding():
+    cached = ResponseCache().get('teams', ('teams',), lambda: {'teams': ['x'] * 100})
+    assert cached.encoded('identity') == (cached.body, cached.etag)
+    body, etag = cached.encoded('gzip')
+    assert etag == f'{cached.etag}-gzip'
+    assert cached.encoded('gzip')[0] is body
+
+
+def test_conditional_request_returns_304_until_data_changes(game):
+    client = game.app.test_client()
+    response = client.get('/api/teams')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.get('/api/teams', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    game.response_cache.bump('teams')
+    response = client.get('/api/teams', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(response.json['teams']) == 2
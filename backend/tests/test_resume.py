@@ -0,0 +1,98 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from memory_db import MemoryDatabase
+from models import Database
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def make_db(request, tmp_path):
+    """同一份資料的兩個 Storage 實體 (sqlite 模擬伺服器重啟後重新開啟資料庫)"""
+    if request.param == 'memory':
+        db = MemoryDatabase()
+        return lambda: db
+    return lambda: Database(str(tmp_path / 'game.db'))
+
+
+def test_journal_returns_last_phase(make_db):
+    db = make_db()
+    assert db.get_game_state() is None
+    db.save_game_state({'phase': 'playing', 'round_number': 3, 'round_id': 7, 'deadline': 1000.0,
+                        'game_start_time': '2026-01-01T10:00:00+08:00'})
+    db.save_game_state({'phase': 'patching', 'round_number': 3, 'round_id': 7, 'deadline': 1300.0,
+                        'game_start_time': '2026-01-01T10:00:00+08:00'})
+    state = make_db().get_game_state()
+    assert (state['phase'], state['round_number'], state['round_id'], state['deadline']) == ('patching', 3, 7, 1300.0)
+    assert state['game_start_time'] == '2026-01-01T10:00:00+08:00'
+
+
+@pytest.fixture
+def resumable(game, monkeypatch):
+    """記錄 game_loop 的呼叫 (不真的執行遊戲循環)，測試後還原 game_state"""
+    calls = []
+    monkeypatch.setattr(game, 'game_loop', lambda **kwargs: calls.append(kwargs))
+    saved = dict(game.game_state)
+    yield calls
+    game.game_state.clear()
+    game.game_state.update(saved)
+    game.flag_manager.clear_feed()
+
+
+def _start_round(game, round_number):
+    teams = game.db.get_teams()
+    round_id = game.db.create_round(round_number)
+    game.flag_manager.create_flags_for_round(round_id, round_number, teams)
+    game.flag_manager.clear_feed()
+    return round_id, teams
+
+
+def _loop_resumed_with(calls):
+    """resume_game 在背景執行緒啟動 game_loop，等待它被呼叫"""
+    deadline = time.monotonic() + 5
+    while not calls and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(calls) == 1
+    return calls[0]['resume']
+
+
+def test_resume_playing_phase_republishes_flags(game, resumable):
+    round_id, teams = _start_round(game, 41)
+    deadline = game.clock.time() + 120
+    game.game_state['start_time'] = datetime.fromisoformat('2026-01-01T10:00:00+08:00')
+    game.journal_phase('playing', 41, round_id, deadline)
+    game.game_state.update({'started': False, 'current_round': 0, 'round_id': None, 'start_time': None})
+
+    assert game.resume_game()
+    assert (game.game_state['started'], game.game_state['current_round'], game.game_state['round_id']) == (True, 41, round_id)
+    assert game.game_state['phase'] == 'playing'
+    assert game.game_state['start_time'].isoformat() == '2026-01-01T10:00:00+08:00'
+    feed = game.flag_manager.get_feed(teams[0]['id'])
+    assert feed['round'] == 41
+    assert feed['flags'] == game.db.get_team_flags(teams[0]['id'], round_id)
+    resume = _loop_resumed_with(resumable)
+    assert (resume['phase'], resume['round_id'], resume['deadline']) == ('playing', round_id, deadline)
+
+
+def test_resume_patching_phase_keeps_deadline(game, resumable):
+    round_id, _ = _start_round(game, 42)
+    deadline = game.clock.time() + 20
+    game.journal_phase('patching', 42, round_id, deadline)
+
+    assert game.resume_game()
+    assert game.game_state['phase'] == 'patching'
+    info = game.game_state['patch_phase_info']
+    assert (info['round_id'], info['round_number']) == (round_id, 42)
+    assert 0 < info['remaining_seconds'] <= 20
+    # Patch 階段沒有 Flag feed
+    assert game.flag_manager.get_feed(1)['round'] == 0
+    assert _loop_resumed_with(resumable)['deadline'] == deadline
+
+
+def test_stopped_game_is_not_resumed(game, resumable):
+    game.journal_phase('stopped', 43, None)
+    assert not game.resume_game()
+    assert not game.game_state['started']
+    time.sleep(0.05)
+    assert resumable == []
@@ -0,0 +1,95 @@
+"""
+每隊每 Round 的服務檢查累計計數
+ServiceChecker 每得到一個檢查結果就更新：檢查次數、成功次數、最新狀態、延遲總和與延遲分布，
+並在每輪檢查結束時寫入資料庫 (uptime_counters)。SLA 計分與 uptime 查詢只需讀取 O(隊伍數) 的計數，
+不必掃描 service_status 的原始紀錄；伺服器重啟後從資料庫載入繼續累計
+"""
+import bisect
+import threading
+from typing import Dict, List
+
+from storage import Storage
+
+# 延遲分布的上界 (秒)，最後一格為超過最大上界 (+Inf)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def new_counter(team_id: int, round_id: int, num_buckets: int) -> Dict:
+    return {
+        'team_id': team_id,
+        'round_id': round_id,
+        'checks': 0,
+        'successes': 0,
+        'last_up': 0,
+        'latency_sum': 0.0,
+        'latency_buckets': [0] * num_buckets,
+    }
+
+
+class UptimeTracker:
+    def __init__(self, db: Storage, buckets=LATENCY_BUCKETS, keep_rounds: int = 3):
+        """keep_rounds: 記憶體中保留最近幾個 Round 的計數 (更早的 Round 需要時從資料庫載入)"""
+        self.db = db
+        self.buckets = tuple(buckets)
+        self.keep_rounds = keep_rounds
+        self._rounds: Dict[int, Dict[int, Dict]] = {}  # round_id -> {team_id: counter}
+        self._dirty = set()  # (round_id, team_id)
+        self._lock = threading.Lock()
+
+    def _round(self, round_id: int) -> Dict[int, Dict]:
+        """某 Round 的計數 (呼叫時需持有 _lock)"""
+        counters = self._rounds.get(round_id)
+        if counters is None:
+            counters = self.db.get_uptime_counters(round_id)
+            self._rounds[round_id] = counters
+            for old_round_id in sorted(self._rounds)[:-self.keep_rounds]:
+                if not any(key[0] == old_round_id for key in self._dirty):
+                    del self._rounds[old_round_id]
+        return counters
+
+    def record(self, team_id: int, round_id: int, is_up: bool, response_time: float = None):
+        """累計一次檢查結果"""
+        with self._lock:
+            counters = self._round(round_id)
+            counter = counters.get(team_id)
+            if counter is None:
+                counter = counters[team_id] = new_counter(team_id, round_id, len(self.buckets) + 1)
+            counter['checks'] += 1
+            counter['successes'] += 1 if is_up else 0
+            counter['last_up'] = 1 if is_up else 0
+            if response_time is not None:
+                counter['latency_sum'] += response_time
+                counter['latency_buckets'][bisect.bisect_left(self.buckets, response_time)] += 1
+            self._dirty.add((round_id, team_id))
+
+    def flush(self, wait: bool = True):
+        """把有變動的計數寫入資料庫"""
+        with self._lock:
+            rows = [dict(self._rounds[round_id][team_id], latency_buckets=list(
+                self._rounds[round_id][team_id]['latency_buckets'])) for round_id, team_id in self._dirty]
+            self._dirty.clear()
+        return self.db.save_uptime_counters(rows, wait=wait)
+
+    def get_round(self, round_id: int) -> Dict[int, Dict]:
+        """某 Round 每隊的計數 (複本)"""
+        with self._lock:
+            return {team_id: dict(counter, latency_buckets=list(counter['latency_buckets']))
+                    for team_id, counter in self._round(round_id).items()}
+
+
+def uptime_summary(counters: Dict[int, Dict], buckets=LATENCY_BUCKETS) -> List[Dict]:
+    """計數轉成 API 輸出：uptime 比例、平均延遲與延遲分布"""
+    summary = []
+    for team_id in sorted(counters):
+        counter = counters[team_id]
+        samples = sum(counter['latency_buckets'])
+        summary.append({
+            'team_id': team_id,
+            'checks': counter['checks'],
+            'successes': counter['successes'],
+            'uptime': round(counter['successes'] / counter['checks'], 4) if counter['checks'] else None,
+            'is_up': bool(counter['last_up']),
+            'avg_latency': round(counter['latency_sum'] / samples, 4) if samples else None,
+            'latency_buckets': dict(zip([str(bound) for bound in buckets] + ['+Inf'], counter['latency_buckets'])),
+        })
+    return summary
@@ -5,6 +5,10 @@ import subprocess
 import shlex
 import requests
 import time
+import json
+import fcntl
+import tempfile
+import threading
 from pathlib import Path
 
 app = Flask(__name__)
@@ -32,15 +36,69 @@ FLAGS = {
     'download': os.environ.get('FLAG_DOWNLOAD', 'FLAG{default_download}')
 }
 
-def fetch_flags_from_server():
-    """從主服務器獲取當前所有 Flags"""
-    global FLAGS
+# 最後一次套用的 Flag feed 版本 (ETag)，用於條件請求
+FLAGS_ETAG = None
+# FLAGS 是否為主服務器發布的 Flags (之後每次輪詢都檢查 flag 檔案是否被刪改)
+FLAGS_APPLIED = False
+# Flag feed long-poll 等待時間 (秒)
+FLAG_FEED_WAIT = int(os.environ.get('FLAG_FEED_WAIT', 25))
+
+# 容器內多個 mod_wsgi worker 共用的 Flag 同步檔案
+# 只有取得 FLAG_SYNC_LOCK 的 worker (leader) 會向主服務器拉取 Flags，
+# 其餘 worker 從 FLAG_SHARED_FILE 讀取
+FLAG_SYNC_LOCK = '/app/.flag_sync.lock'
+FLAG_SHARED_FILE = '/app/.flags.json'
+INIT_LOCK = '/app/.init.lock'
+_shared_flags_mtime = None
+
+def load_shared_flags():
+    """如果共享 Flag 檔案有更新，重新載入到本 worker (每次只需一次 stat)"""
+    global FLAGS, FLAGS_ETAG, FLAGS_APPLIED, _shared_flags_mtime
+    try:
+        mtime = os.stat(FLAG_SHARED_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return
+    if mtime == _shared_flags_mtime:
+        return
+    try:
+        with open(FLAG_SHARED_FILE, 'r') as f:
+            data = json.load(f)
+        FLAGS = data['flags']
+        FLAGS_ETAG = data.get('etag')
+        FLAGS_APPLIED = data.get('applied', False)
+        _shared_flags_mtime = mtime
+    except Exception as e:
+        print(f"✗ Error loading shared flags: {e}")
+
+def publish_shared_flags():
+    """將目前的 Flags 原子性地寫入共享檔案，供其他 worker 讀取"""
+    global _shared_flags_mtime
+    try:
+        content = json.dumps({'etag': FLAGS_ETAG, 'flags': FLAGS, 'applied': FLAGS_APPLIED})
+        if write_file_if_changed(FLAG_SHARED_FILE, content):
+            _shared_flags_mtime = os.stat(FLAG_SHARED_FILE).st_mtime_ns
+    except Exception as e:
+        print(f"✗ Error publishing shared flags: {e}")
+
+def fetch_flags_from_server(wait=0):
+    """
+    從主服務器的版本化 Flag feed 獲取當前所有 Flags
+    帶上 If-None-Match，版本未變動時伺服器最多等待 wait 秒 (long-poll) 後回傳 304
+    返回: 請求是否成功 (失敗時呼叫端應退避)
+    """
+    global FLAGS, FLAGS_ETAG, FLAGS_APPLIED
     try:
         team_num = int(TEAM_ID.replace('team', ''))
-        url = f"{MAIN_SERVER}/api/team/{team_num}/flags"
+        url = f"{MAIN_SERVER}/api/team/{team_num}/flags/feed"
+        
+        params = {'wait': wait}
+        if TEAM_TOKEN:
+            params['token'] = TEAM_TOKEN
+        headers = {'If-None-Match': FLAGS_ETAG} if FLAGS_ETAG else {}
+        response = requests.get(url, params=params, headers=headers, timeout=wait + 5)
         
-        params = {'token': TEAM_TOKEN} if TEAM_TOKEN else {}
-        response = requests.get(url, params=params, timeout=5)
+        if response.status_code == 304:
+            return True
         
         if response.status_code == 200:
             data = response.json()
@@ -50,49 +108,103 @@ def fetch_flags_from_server():
                 
                 if has_valid_flags:
                     FLAGS = new_flags
-                    print(f"✓ Fetched {len(FLAGS)} flags from server:")
+                    FLAGS_APPLIED = True
+                    print(f"✓ Fetched {len(FLAGS)} flags from server (round {data.get('round')}):")
                     for vuln_type, flag in FLAGS.items():
                         print(f"  - {vuln_type}: {flag}")
                     update_flag_files()
                 else:
                     print(f"⚠ Fetched flags are empty (game may not have started yet)")
-        else:
-            print(f"✗ Failed to fetch flags: HTTP {response.status_code}")
-            print(f"  Response: {response.text[:200]}")
+            FLAGS_ETAG = response.headers.get('ETag')
+            publish_shared_flags()
+            return True
+        
+        print(f"✗ Failed to fetch flags: HTTP {response.status_code}")
+        print(f"  Response: {response.text[:200]}")
     except Exception as e:
         print(f"✗ Error fetching flags: {e}")
+    return False
+
+def write_file_if_changed(path, content):
+    """
+    內容與現有檔案不同時才寫入，寫入時先寫暫存檔再 rename (原子替換)
+    暫存檔以 . 開頭，/logs 的 grep 與檔案列表不會看到寫到一半的內容
+    返回: 是否有實際寫入
+    """
+    try:
+        with open(path, 'r') as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
 
 def update_flag_files():
+    """將 FLAGS 寫入三個漏洞對應的位置，只更新 Flag 有變動 (或被刪改) 的部分"""
     global FLAGS
     flag_path = '/app/secret_flag.txt'
     try:
-        with open(flag_path, 'w') as f:
-            f.write(f"Congratulations! You found the flag:\n{FLAGS['download']}\n")
-        print(f"✓ Updated {flag_path} with download flag")
+        if write_file_if_changed(flag_path, f"Congratulations! You found the flag:\n{FLAGS['download']}\n"):
+            print(f"✓ Updated {flag_path} with download flag")
     except Exception as e:
         print(f"✗ Error updating {flag_path}: {e}")
     log_path = os.path.join(LOG_DIR, 'flag.log')
     try:
-        os.makedirs(LOG_DIR, exist_ok=True)
-        with open(log_path, 'w') as f:
-            f.write(f"FLAG: {FLAGS['logs']}\n")
-        print(f"✓ Updated {log_path} with logs flag")
+        if write_file_if_changed(log_path, f"FLAG: {FLAGS['logs']}\n"):
+            print(f"✓ Updated {log_path} with logs flag")
     except Exception as e:
         print(f"✗ Error updating {log_path}: {e}")
     try:
         conn = sqlite3.connect('blog.db')
         cursor = conn.cursor()
-        cursor.execute('UPDATE posts SET content = ? WHERE id = 999', (FLAGS['monitor'],))
-        conn.commit()
+        cursor.execute('SELECT content FROM posts WHERE id = 999')
+        row = cursor.fetchone()
+        # 只有內容不同時才寫入，避免每次都拿 SQLite 寫鎖
+        if row is None or row[0] != FLAGS['monitor']:
+            cursor.execute('UPDATE posts SET content = ? WHERE id = 999', (FLAGS['monitor'],))
+            conn.commit()
+            print(f"✓ Updated database post (id=999) with monitor flag")
         conn.close()
-        print(f"✓ Updated database post (id=999) with monitor flag")
     except Exception as e:
         print(f"✗ Error updating database: {e}")
+
 def flag_updater():
-    """定期從主服務器更新 Flag"""
+    """以 long-poll 持續等待主服務器的 Flag 更新，新 Round 的 Flags 產生後立即套用"""
+    fetch_flags_from_server()
     while True:
-        time.sleep(10)
-        fetch_flags_from_server()
+        fetched = fetch_flags_from_server(wait=FLAG_FEED_WAIT)
+        # 不論是否有新版本 (304 / 逾時 / 連線失敗)，每次輪詢都恢復被刪改的 flag 檔案
+        if FLAGS_APPLIED:
+            update_flag_files()
+        if not fetched:
+            # 主服務器無法連線時退避，避免忙等
+            time.sleep(10)
+
+def flag_sync_leader():
+    """
+    競選容器內的 Flag 同步 leader
+    阻塞等待 FLAG_SYNC_LOCK 的排他鎖：取得鎖的 worker 負責拉取並寫入 Flags，
+    leader 進程結束 (Apache 回收 worker) 時鎖自動釋放，由下一個等待中的 worker 接手
+    """
+    lock_file = open(FLAG_SYNC_LOCK, 'w')
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    print(f"✓ Worker {os.getpid()} elected as flag sync leader")
+    # 從上一任 leader 寫入的共享檔案接續 ETag，避免重複寫入相同的 Flags
+    load_shared_flags()
+    flag_updater()
+
 FILES_DIR = '/app/files'
 UPLOAD_DIR = '/app/uploads'
 LOG_DIR = '/app/logs'
@@ -162,6 +274,11 @@ def init_files():
 
 # ==================== 路由 ====================
 
+@app.before_request
+def sync_flags():
+    """每個請求前檢查共享 Flag 檔案是否由 leader 更新"""
+    load_shared_flags()
+
 @app.route('/')
 def index():
     return render_template('home.html', session=session)
@@ -200,7 +317,8 @@ def logs():
         
         if keyword:
             try:
-                cmd = f"grep -r \"{keyword}\" {LOG_DIR}/"
+                # 以 . 開頭的檔案是寫入中的暫存檔 (write_file_if_changed)，不列入搜尋結果
+                cmd = f"grep -r --exclude='.*' \"{keyword}\" {LOG_DIR}/"
                 result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=5)
                 output = result.stdout if result.stdout else "No matches found"
             except subprocess.TimeoutExpired:
@@ -290,15 +408,18 @@ def health():
 # ==================== 應用初始化 ====================
 
 def init_app():
-    init_db()
-    init_files()
+    # mod_wsgi 的每個 worker 都會執行 init_app，以檔案鎖序列化初始化
+    with open(INIT_LOCK, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        init_db()
+        init_files()
     print(f"Team ID: {TEAM_ID}")
     print(f"Main Server: {MAIN_SERVER}")
-    fetch_flags_from_server()
-    import threading
-    updater_thread = threading.Thread(target=flag_updater, daemon=True)
-    updater_thread.start()
-    print(f"✓ Application initialized for {TEAM_ID}")
+    load_shared_flags()
+    # 每個容器只有一個 worker 會成為 leader 並向主服務器拉取 Flags
+    sync_thread = threading.Thread(target=flag_sync_leader, daemon=True)
+    sync_thread.start()
+    print(f"✓ Application initialized for {TEAM_ID} (worker {os.getpid()})")
 
 # ==================== 啟動 ====================
 
@@ -12,7 +12,8 @@ sys.path.insert(0, '/app')
 # 從 app.py 導入 Flask 應用並初始化
 from app import app as application, init_app
 
-# 初始化應用（創建資料庫、啟動 flag 更新線程等）
+# 初始化應用（創建資料庫、競選 flag 同步 leader 等）
+# 嵌入式模式下每個 worker 都會 import 此檔案，但每個容器只有一個 worker 會向主服務器拉取 flags
 init_app()
 
 # Apache mod_wsgi 會使用 'application' 這個變數